@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Агрегация по столбцам (GROUP BY): count/sum/min/max значений по целочисленному
+ключу — category_id, supplier_id, product_id или дате поставки (день/месяц/год).
+Если установлен NumPy, вычисления векторные (C-циклы по массивам), иначе —
+на чистом Python с тем же результатом. Суммы целочисленные (цены в копейках),
+без ошибок округления float.
+
+Отбор строк (WHERE) — маска по позициям строк: массив bool NumPy или bytearray
+из 0/1. Маски объединяются через and/or и превращаются в позиции строк.
+"""
+
+from array import array
+from itertools import compress
+from operator import mul
+from typing import Dict, Iterable, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен
+    np = None
+
+# Результат группировки: ключ → (count, sum, min, max)
+GroupStats = Dict[int, Tuple[int, int, int, int]]
+
+# Ключи для дат поставки: YYYYMMDD → день / месяц / год
+DATE_BUCKETS = {"day": 1, "month": 100, "year": 10000}
+
+
+def has_numpy() -> bool:
+    return np is not None
+
+
+def date_key(value: str) -> int:
+    """Дата 'ГГГГ-ММ-ДД' → целое ГГГГММДД (0, если дата пустая или некорректная)."""
+    if len(value) >= 10 and value[4] == "-" and value[7] == "-":
+        try:
+            return int(value[:4]) * 10000 + int(value[5:7]) * 100 + int(value[8:10])
+        except ValueError:
+            pass
+    return 0
+
+
+def bucket_label(key: int, bucket: str) -> str:
+    """Целый ключ даты обратно в строку: 2025-02-16, 2025-02 или 2025."""
+    if bucket == "year":
+        return f"{key:04d}"
+    if bucket == "month":
+        return f"{key // 100:04d}-{key % 100:02d}"
+    return f"{key // 10000:04d}-{key // 100 % 100:02d}-{key % 100:02d}"
+
+
+def _as_int64(values):
+    if isinstance(values, array) and values.typecode == "q":
+        return np.frombuffer(values, dtype=np.int64)  # без копирования
+    return np.asarray(values, dtype=np.int64)
+
+
+def multiply(a: Sequence[int], b: Sequence[int]):
+    """Поэлементное произведение столбцов (например цена в копейках × остаток)."""
+    if np is not None:
+        return _as_int64(a) * _as_int64(b)
+    return array("q", map(mul, a, b))
+
+
+def bucket_dates(dates: Sequence[int], bucket: str):
+    """Столбец ключей ГГГГММДД → ключи выбранного периода (day/month/year)."""
+    div = DATE_BUCKETS[bucket]
+    if div == 1:
+        return dates
+    if np is not None:
+        return _as_int64(dates) // div
+    return array("q", (d // div for d in dates))
+
+
+def group_by(keys: Sequence[int], values: Sequence[int]) -> GroupStats:
+    """Группировка values по keys: {ключ: (count, sum, min, max)}."""
+    if len(keys) != len(values):
+        raise ValueError("Столбцы ключей и значений разной длины")
+    if not len(keys):
+        return {}
+    if np is not None:
+        return _group_by_numpy(_as_int64(keys), _as_int64(values))
+    acc: Dict[int, list] = {}
+    for k, v in zip(keys, values):
+        a = acc.get(k)
+        if a is None:
+            acc[k] = [1, v, v, v]
+        else:
+            a[0] += 1
+            a[1] += v
+            if v < a[2]:
+                a[2] = v
+            if v > a[3]:
+                a[3] = v
+    return {k: tuple(a) for k, a in acc.items()}
+
+
+def _group_by_numpy(k, v) -> GroupStats:
+    kmin, kmax = int(k.min()), int(k.max())
+    span = kmax - kmin + 1
+    if span <= 4 * len(k) + 1024:
+        # Плотные ключи (id категорий, поставщиков, даты): линейный проход без сортировки
+        inv = k - kmin
+        counts = np.bincount(inv, minlength=span)
+        sums = np.zeros(span, dtype=np.int64)
+        np.add.at(sums, inv, v)
+        mins = np.full(span, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(mins, inv, v)
+        maxs = np.full(span, np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(maxs, inv, v)
+        present = np.flatnonzero(counts)
+        keys = present + kmin
+        counts, sums, mins, maxs = counts[present], sums[present], mins[present], maxs[present]
+    else:
+        # Разреженные ключи: сортировка и свёртка по границам групп
+        order = np.argsort(k, kind="stable")
+        ks, vs = k[order], v[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(ks)) + 1))
+        keys = ks[starts]
+        counts = np.diff(np.append(starts, len(ks)))
+        sums = np.add.reduceat(vs, starts)
+        mins = np.minimum.reduceat(vs, starts)
+        maxs = np.maximum.reduceat(vs, starts)
+    return {
+        int(key): (int(c), int(s), int(lo), int(hi))
+        for key, c, s, lo, hi in zip(keys.tolist(), counts.tolist(), sums.tolist(), mins.tolist(), maxs.tolist())
+    }
+
+
+def stock_by_category(category_ids: Sequence[int], quantities: Sequence[int],
+                      prices_kop: Sequence[int]) -> Dict[int, Tuple[int, int, int]]:
+    """Остатки по категориям: {category_id: (кол-во товаров, суммарный остаток, стоимость в копейках)}."""
+    qty = group_by(category_ids, quantities)
+    value = group_by(category_ids, multiply(prices_kop, quantities))
+    return {cid: (q[0], q[1], value[cid][1]) for cid, q in qty.items()}
+
+
+# --- Отбор строк (маски) ---
+
+def mask_range(values: Sequence[int], lo: Optional[int], hi: Optional[int]):
+    """Маска lo <= value <= hi (граница None — без ограничения)."""
+    if np is not None:
+        v = _as_int64(values)
+        mask = np.ones(len(v), dtype=bool)
+        if lo is not None:
+            mask &= v >= lo
+        if hi is not None:
+            mask &= v <= hi
+        return mask
+    if lo is None:
+        return bytearray(v <= hi for v in values) if hi is not None else bytearray(b"\x01") * len(values)
+    if hi is None:
+        return bytearray(v >= lo for v in values)
+    return bytearray(lo <= v <= hi for v in values)
+
+
+def mask_in(values: Sequence[int], keys: Set[int]):
+    """Маска value ∈ keys."""
+    if np is not None:
+        return np.isin(_as_int64(values), np.fromiter(keys, dtype=np.int64, count=len(keys)))
+    return bytearray(map(keys.__contains__, values))
+
+
+def mask_positions(size: int, positions: Iterable[int]):
+    """Маска из позиций отобранных строк."""
+    if np is not None:
+        mask = np.zeros(size, dtype=bool)
+        mask[np.asarray(positions, dtype=np.int64)] = True
+        return mask
+    mask = bytearray(size)
+    for i in positions:
+        mask[i] = 1
+    return mask
+
+
+def mask_and(a, b):
+    if np is not None:
+        return a & b
+    # Байты 0/1: побитовая операция над целым числом — один проход в C
+    n = len(a)
+    return bytearray((int.from_bytes(a, "little") & int.from_bytes(b, "little")).to_bytes(n, "little"))
+
+
+def mask_or(a, b):
+    if np is not None:
+        return a | b
+    n = len(a)
+    return bytearray((int.from_bytes(a, "little") | int.from_bytes(b, "little")).to_bytes(n, "little"))
+
+
+def positions(mask):
+    """Позиции отобранных строк по возрастанию."""
+    if np is not None:
+        return np.flatnonzero(mask)
+    return array("q", compress(range(len(mask)), mask))
+
+
+def take(order: Sequence[int], mask):
+    """Позиции из order (перестановка строк), отобранные маской, в порядке order."""
+    if np is not None:
+        o = _as_int64(order)
+        return o[mask[o]]
+    return array("q", compress(order, map(mask.__getitem__, order)))
@@ -5,7 +5,7 @@
 """
 
 import customtkinter as ctk
-from tkinter import ttk
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
 
 from config import PROJECT_DIR, REPORTS_DIR
@@ -14,9 +14,12 @@ from csv_db import (
     MANAGER,
     READER,
     load_table,
-    v_products_full,
-    v_deliveries_full,
-    v_stock_by_category,
+    iter_table,
+    view_page,
+    view_count,
+    view_rows,
+    VIEW_FILTERS,
+    subscribe,
     add_delivery,
     add_category,
     add_supplier,
@@ -25,6 +28,10 @@ from csv_db import (
     update_delivery,
     get_row,
 )
+from gui_tasks import BackgroundTasks
+from text_index import NameIndex
+from typeahead import Typeahead
+from virtual_tree import VirtualTree
 from auth import (
     check_login,
     ROLE_ADMIN,
@@ -53,7 +60,7 @@ def run_backup():
 
 def run_restore(backup_path: Path):
     from restore_db import run_restore
-    run_restore(backup_path)
+    return run_restore(backup_path)
 
 
 def run_performance():
@@ -66,6 +73,76 @@ def run_performance():
     return None
 
 
+# Виды вкладки «Данные»: (фрагмент названия, представление csv_db.view_page, столбцы, заголовки, ширина столбца)
+_DATA_VIEWS = (
+    ("Товары", "products_full", ("id", "product_name", "category_name", "supplier_name", "price", "quantity"),
+     {"id": "ID", "product_name": "Товар", "category_name": "Категория", "supplier_name": "Поставщик", "price": "Цена", "quantity": "Кол-во"},
+     100),
+    ("Поставки", "deliveries_full", ("id", "product_name", "supplier_name", "quantity", "delivery_date"),
+     {"id": "ID", "product_name": "Товар", "supplier_name": "Поставщик", "quantity": "Кол-во", "delivery_date": "Дата"},
+     120),
+    ("Категории", "categories", ("id", "name", "description"),
+     {"id": "ID", "name": "Название", "description": "Описание"},
+     150),
+    ("Поставщики", "suppliers", ("id", "name", "contact", "address"),
+     {"id": "ID", "name": "Название", "contact": "Контакты", "address": "Адрес"},
+     120),
+    ("", "stock_by_category", ("category_name", "products_count", "total_quantity", "total_value"),
+     {"category_name": "Категория", "products_count": "Товаров", "total_quantity": "Остаток", "total_value": "Стоимость"},
+     120),
+)
+
+
+def _data_view(choice: str):
+    """Вид по выбранному пункту: (представление, столбцы, заголовки, ширина)."""
+    for part, view, cols, headers, width in _DATA_VIEWS:
+        if part in choice:
+            return view, cols, headers, width
+
+
+# Таблицы, от которых зависят строки вида: (таблица строк вида, справочники)
+_VIEW_DEPENDS = {
+    "products_full": ("products", ("categories", "suppliers")),
+    "deliveries_full": ("deliveries", ("products", "suppliers")),
+    "categories": ("categories", ()),
+    "suppliers": ("suppliers", ()),
+    "stock_by_category": (None, ("products", "categories")),
+}
+
+
+def _page_values(view: str, cols, offset: int, limit: int, order_by, descending: bool, filters=None):
+    """Страница представления в виде кортежей значений столбцов (выполняется в фоновом потоке)."""
+    rows = view_page(view, offset, limit, order_by, descending, filters=filters)
+    return [tuple(r.get(c, "") for c in cols) for r in rows]
+
+
+def _parse_filter(field: str, text: str):
+    """Значение поля фильтра: None — пусто, ValueError — некорректно (цена допускает запятую)."""
+    text = text.strip().replace(" ", "")
+    if not text:
+        return None
+    if field.startswith("price"):
+        try:
+            value = Decimal(text.replace(",", "."))
+        except InvalidOperation:
+            raise ValueError(text) from None
+        if not value.is_finite():
+            raise ValueError(text)
+        return str(value)
+    return int(text)
+
+
+def _id_values(view: str, cols, ids):
+    return [tuple(r.get(c, "") for c in cols) for r in view_rows(view, ids)]
+
+
+def _delivery_choices():
+    """Индексы названий товаров и поставщиков для подсказок (выполняется в фоновом потоке)."""
+    products = NameIndex((p["id"], p["name"]) for p in iter_table("products"))
+    suppliers = NameIndex((s["id"], s["name"]) for s in iter_table("suppliers"))
+    return products, suppliers
+
+
 class App(ctk.CTk):
     def __init__(self, current_username: str = "admin", current_role: str = ROLE_ADMIN):
         super().__init__()
@@ -88,6 +165,9 @@ class App(ctk.CTk):
             ctk.CTkButton(top_bar, text="Пользователи", width=120, command=self._dialog_manage_users).pack(side="left", padx=(0, 8))
         ctk.CTkButton(top_bar, text="Выход", width=80, command=self._logout).pack(side="right")
 
+        self.tasks = BackgroundTasks(self)
+        # Запись может идти в потоке пула (восстановление): уведомления — в главный поток
+        self._unsubscribe = subscribe(lambda changes: self.tasks.post(self._on_data_changed, changes))
         self.tabview = ctk.CTkTabview(self, width=880, height=560)
         self.tabview.pack(padx=10, pady=10, fill="both", expand=True)
         self.tabview.add("Данные")
@@ -123,29 +203,64 @@ class App(ctk.CTk):
         self.btn_edit.pack(side="left", padx=(0, 5))
         self.btn_add = ctk.CTkButton(top, text="Добавить", width=90, command=self._add_new)
         self.btn_add.pack(side="left")
-        # Таблица через Treeview
+        self.loading_label = ctk.CTkLabel(top, text="", width=80)
+        self.loading_label.pack(side="left", padx=(10, 0))
+        self.loading_bar = ctk.CTkProgressBar(top, width=120, mode="indeterminate")
+        self._loading = False
+        # Строка фильтров: поиск по названиям и диапазоны, отбор выполняет движок хранения
+        bar = ctk.CTkFrame(tab, fg_color="transparent")
+        bar.pack(fill="x", pady=(0, 5))
+        self.filter_entries = {}
+        for field, label, width in (("text", "Поиск:", 240), ("price_min", "Цена от", 80), ("price_max", "до", 80),
+                                    ("qty_min", "Кол-во от", 70), ("qty_max", "до", 70)):
+            ctk.CTkLabel(bar, text=label).pack(side="left", padx=(0 if field == "text" else 8, 4))
+            entry = ctk.CTkEntry(bar, width=width)
+            entry.pack(side="left")
+            entry.bind("<KeyRelease>", lambda e: self._on_filter_changed())
+            self.filter_entries[field] = entry
+        self._entry_border = self.filter_entries["text"].cget("border_color")
+        ctk.CTkButton(bar, text="Сбросить", width=90, command=self._reset_filters).pack(side="left", padx=(8, 0))
+        self._filters = {}
+        # Таблица: видимые строки подгружаются страницами (см. virtual_tree)
         frame = ctk.CTkFrame(tab, fg_color="transparent")
         frame.pack(fill="both", expand=True)
-        self.tree = ttk.Treeview(frame, show="headings", height=18)
-        scroll_y = ttk.Scrollbar(frame)
-        scroll_x = ttk.Scrollbar(frame, orient="horizontal")
-        self.tree.configure(yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set)
-        scroll_y.pack(side="right", fill="y")
-        scroll_x.pack(side="bottom", fill="x")
-        self.tree.pack(side="left", fill="both", expand=True)
-        scroll_y.config(command=self.tree.yview)
-        scroll_x.config(command=self.tree.xview)
+        self.table = VirtualTree(frame, self.tasks, "data", on_loading=self._set_loading, on_error=self._data_failed)
+        self.table.pack()
         self._refresh_data()
 
     def _on_data_type_changed(self, choice):
         self._refresh_data()
 
+    def _data_filters(self, view: str):
+        """Фильтры из строки фильтров для вида; некорректные числа подсвечиваются и не применяются."""
+        supported = VIEW_FILTERS.get(view, ())
+        filters = {}
+        for field, entry in self.filter_entries.items():
+            entry.configure(state="normal" if field in supported else "disabled")
+            value, valid = None, True
+            if field in supported:
+                try:
+                    value = entry.get().strip() if field == "text" else _parse_filter(field, entry.get())
+                except ValueError:
+                    valid = False
+            entry.configure(border_color=self._entry_border if valid else "orange")
+            if value not in (None, ""):
+                filters[field] = value
+        return filters
+
+    def _on_filter_changed(self):
+        view = _data_view(self.data_combo.get())[0]
+        if self._data_filters(view) != self._filters:
+            self._refresh_data(keep_position=False)
+
+    def _reset_filters(self):
+        for entry in self.filter_entries.values():
+            entry.configure(state="normal")
+            entry.delete(0, "end")
+        self._on_filter_changed()
+
     def _get_selected_row_id(self):
-        sel = self.tree.selection()
-        if not sel:
-            return None
-        item = self.tree.item(sel[0])
-        vals = item.get("values")
+        vals = self.table.selected_values()
         if vals:
             return vals[0]  # first column is id
         return None
@@ -211,7 +326,6 @@ class App(ctk.CTk):
             if not name:
                 return
             update_row("categories", row_id, {"name": name, "description": e_desc.get().strip()})
-            self._refresh_data()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
@@ -233,8 +347,6 @@ class App(ctk.CTk):
             if not name:
                 return
             add_category(name, e_desc.get().strip())
-            self._refresh_data()
-            self._refresh_delivery_combos()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
@@ -265,8 +377,6 @@ class App(ctk.CTk):
             if not name:
                 return
             update_row("suppliers", row_id, {"name": name, "contact": e_contact.get().strip(), "address": e_addr.get().strip()})
-            self._refresh_data()
-            self._refresh_delivery_combos()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
@@ -291,8 +401,6 @@ class App(ctk.CTk):
             if not name:
                 return
             add_supplier(name, e_contact.get().strip(), e_addr.get().strip())
-            self._refresh_data()
-            self._refresh_delivery_combos()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
@@ -345,8 +453,6 @@ class App(ctk.CTk):
             price = float(e_price.get().strip().replace(",", "."))
             qty = int(e_qty.get().strip())
             update_row("products", row_id, {"name": name, "category_id": cat_id, "supplier_id": sup_id, "price": price, "quantity": qty})
-            self._refresh_data()
-            self._refresh_delivery_combos()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
@@ -386,8 +492,6 @@ class App(ctk.CTk):
             price = float(e_price.get().strip().replace(",", ".") or "0")
             qty = int(e_qty.get().strip() or "0")
             add_product(name, cat_id, sup_id, price, qty)
-            self._refresh_data()
-            self._refresh_delivery_combos()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
@@ -397,25 +501,23 @@ class App(ctk.CTk):
         row = get_row("deliveries", row_id)
         if not row:
             return
-        products = load_table("products")
-        suppliers = load_table("suppliers")
+        product = get_row("products", row["product_id"])
+        supplier = get_row("suppliers", row["supplier_id"])
         win = ctk.CTkToplevel(self)
         win.title("Изменить поставку")
         win.geometry("520x300")
         ctk.CTkLabel(win, text="Товар:").pack(anchor="w", padx=20, pady=(15, 0))
-        combo_prod = ctk.CTkComboBox(win, width=380, values=[f"{p['id']} — {p['name']}" for p in products])
-        combo_prod.pack(padx=20, pady=5)
-        for p in products:
-            if p["id"] == row["product_id"]:
-                combo_prod.set(f"{p['id']} — {p['name']}")
-                break
+        field_prod = Typeahead(win, width=380)
+        field_prod.set_search(self._name_search("products"))
+        field_prod.pack(padx=20, pady=5)
+        if product:
+            field_prod.set((product["id"], product["name"]))
         ctk.CTkLabel(win, text="Поставщик:").pack(anchor="w", padx=20, pady=(10, 0))
-        combo_sup = ctk.CTkComboBox(win, width=380, values=[f"{s['id']} — {s['name']}" for s in suppliers])
-        combo_sup.pack(padx=20, pady=5)
-        for s in suppliers:
-            if s["id"] == row["supplier_id"]:
-                combo_sup.set(f"{s['id']} — {s['name']}")
-                break
+        field_sup = Typeahead(win, width=380)
+        field_sup.set_search(self._name_search("suppliers"))
+        field_sup.pack(padx=20, pady=5)
+        if supplier:
+            field_sup.set((supplier["id"], supplier["name"]))
         ctk.CTkLabel(win, text="Количество:").pack(anchor="w", padx=20, pady=(10, 0))
         e_qty = ctk.CTkEntry(win, width=120)
         e_qty.pack(padx=20, pady=5, anchor="w")
@@ -426,73 +528,77 @@ class App(ctk.CTk):
         e_date.insert(0, row.get("delivery_date", ""))
 
         def save():
-            prod_id = int(combo_prod.get().split("—")[0].strip())
-            sup_id = int(combo_sup.get().split("—")[0].strip())
+            prod_id = field_prod.get_id()
+            sup_id = field_sup.get_id()
             qty = int(e_qty.get().strip())
             date_val = e_date.get().strip()
-            if qty <= 0:
+            if qty <= 0 or prod_id is None or sup_id is None:
                 return
             update_delivery(row_id, product_id=prod_id, supplier_id=sup_id, quantity=qty, delivery_date=date_val or None)
-            self._refresh_data()
             win.destroy()
 
         ctk.CTkButton(win, text="Сохранить", command=save).pack(pady=15)
         win.transient(self)
 
-    def _refresh_data(self):
-        for c in self.tree.get_children():
-            self.tree.delete(c)
-        choice = self.data_combo.get()
-        if "Товары" in choice:
-            rows = v_products_full()
-            cols = ("id", "product_name", "category_name", "supplier_name", "price", "quantity")
-            self.tree["columns"] = cols
-            headers = {"id": "ID", "product_name": "Товар", "category_name": "Категория", "supplier_name": "Поставщик", "price": "Цена", "quantity": "Кол-во"}
-            for col in cols:
-                self.tree.heading(col, text=headers.get(col, col))
-                self.tree.column(col, width=100)
-            for r in rows:
-                self.tree.insert("", "end", values=(r.get("id"), r.get("product_name"), r.get("category_name"), r.get("supplier_name"), r.get("price"), r.get("quantity")))
-        elif "Поставки" in choice:
-            rows = v_deliveries_full()
-            cols = ("id", "product_name", "supplier_name", "quantity", "delivery_date")
-            self.tree["columns"] = cols
-            headers = {"id": "ID", "product_name": "Товар", "supplier_name": "Поставщик", "quantity": "Кол-во", "delivery_date": "Дата"}
-            for col in cols:
-                self.tree.heading(col, text=headers.get(col, col))
-                self.tree.column(col, width=120)
-            for r in rows:
-                self.tree.insert("", "end", values=(r.get("id"), r.get("product_name"), r.get("supplier_name"), r.get("quantity"), r.get("delivery_date")))
-        elif "Категории" in choice:
-            rows = load_table("categories")
-            cols = ("id", "name", "description")
-            self.tree["columns"] = cols
-            headers = {"id": "ID", "name": "Название", "description": "Описание"}
-            for col in cols:
-                self.tree.heading(col, text=headers.get(col, col))
-                self.tree.column(col, width=150)
-            for r in rows:
-                self.tree.insert("", "end", values=(r.get("id"), r.get("name"), r.get("description", "")))
-        elif "Поставщики" in choice:
-            rows = load_table("suppliers")
-            cols = ("id", "name", "contact", "address")
-            self.tree["columns"] = cols
-            headers = {"id": "ID", "name": "Название", "contact": "Контакты", "address": "Адрес"}
-            for col in cols:
-                self.tree.heading(col, text=headers.get(col, col))
-                self.tree.column(col, width=120)
-            for r in rows:
-                self.tree.insert("", "end", values=(r.get("id"), r.get("name"), r.get("contact", ""), r.get("address", "")))
+    def _refresh_data(self, keep_position: bool = True):
+        """Перезагрузить таблицу: строки запрашиваются страницами в фоне, незавершённые запросы отменяются."""
+        view, cols, headers, width = _data_view(self.data_combo.get())
+        filters = self._filters = self._data_filters(view)
+        self.table.set_source(
+            view, cols, headers, width,
+            lambda offset, limit, order_by, desc: _page_values(view, cols, offset, limit, order_by, desc, filters),
+            lambda: view_count(view, filters),
+            lambda ids: _id_values(view, cols, ids),
+            keep_position=keep_position,
+        )
+
+    def _on_data_changed(self, changes):
+        """
+        Изменения из csv_db после операции записи: изменённые строки вида перечитываются
+        по id, при вставках и изменении справочников — только видимые страницы.
+        """
+        view = _data_view(self.data_combo.get())[0]
+        main, refs = _VIEW_DEPENDS[view]
+        updated, inserted, shifted = set(), False, False
+        rebuild_names = False
+        for table, op, row_id, fields in changes:
+            if table == main:
+                if op == "update":
+                    updated.add(row_id)
+                else:
+                    inserted = True
+            elif table in refs:
+                shifted = True
+            # Подсказки новой поставки зависят только от названий товаров и поставщиков
+            if table in ("products", "suppliers") and (op != "update" or fields is None or "name" in fields):
+                if op == "replace":
+                    rebuild_names = True
+                elif not rebuild_names:
+                    self._update_delivery_names(table, row_id)
+        # При отборе изменённая строка может выйти из выборки или войти в неё
+        if inserted or shifted or (updated and self._filters):
+            self.table.refresh(recount=inserted or bool(self._filters))
+        elif updated:
+            self.table.refresh_rows(updated)
+        if rebuild_names:
+            self._refresh_delivery_combos()
+
+    def _data_failed(self, exc):
+        self._set_loading(False)
+        self._show_message(f"Не удалось загрузить данные: {exc}", "Ошибка")
+
+    def _set_loading(self, on: bool):
+        if on == self._loading:
+            return
+        self._loading = on
+        if on:
+            self.loading_label.configure(text="Загрузка…")
+            self.loading_bar.pack(side="left", padx=(10, 0))
+            self.loading_bar.start()
         else:
-            rows = v_stock_by_category()
-            cols = ("category_name", "products_count", "total_quantity", "total_value")
-            self.tree["columns"] = cols
-            headers = {"category_name": "Категория", "products_count": "Товаров", "total_quantity": "Остаток", "total_value": "Стоимость"}
-            for col in cols:
-                self.tree.heading(col, text=headers.get(col, col))
-                self.tree.column(col, width=120)
-            for r in rows:
-                self.tree.insert("", "end", values=(r.get("category_name"), r.get("products_count"), r.get("total_quantity"), r.get("total_value")))
+            self.loading_label.configure(text="")
+            self.loading_bar.stop()
+            self.loading_bar.pack_forget()
 
     def _build_actions_tab(self):
         tab = self.tabview.tab("Действия")
@@ -543,12 +649,23 @@ class App(ctk.CTk):
         p = Path(path_str)
         if not p.is_absolute():
             p = PROJECT_DIR / p
-        try:
-            run_restore(p)
-            self._log(f"Восстановлено из {p}")
-            self._refresh_data()
-        except Exception as e:
-            self._log(f"Ошибка: {e}")
+        if self.tasks.busy("restore"):
+            return
+        # Сборка и проверка копии идут в фоне; data/ меняется только в самом конце
+        self.btn_restore.configure(state="disabled")
+        self._log(f"Восстановление из {p}...")
+        self.tasks.submit("restore", lambda: run_restore(p), lambda counts: self._restored(p, counts),
+                          self._restore_failed)
+
+    def _restored(self, path: Path, counts):
+        self.btn_restore.configure(state="normal")
+        rows = ", ".join(f"{name}: {n}" for name, n in counts.items())
+        self._log(f"Восстановлено из {path} ({rows})")
+        self._refresh_data()
+
+    def _restore_failed(self, exc: BaseException):
+        self.btn_restore.configure(state="normal")
+        self._log(f"Ошибка: {exc}")
 
     def _do_performance(self):
         try:
@@ -562,15 +679,15 @@ class App(ctk.CTk):
         form = ctk.CTkFrame(tab, fg_color="transparent")
         form.pack(pady=20, padx=20)
         ctk.CTkLabel(form, text="Товар:").grid(row=0, column=0, sticky="w", pady=5, padx=(0, 10))
-        products = load_table("products")
-        product_values = [f"{p['id']} — {p['name']}" for p in products] or ["— Сначала инициализируйте БД (вкладка Действия)"]
-        self.delivery_product_combo = ctk.CTkComboBox(form, width=250, values=product_values)
-        self.delivery_product_combo.grid(row=0, column=1, pady=5)
+        # Подсказки по названию; индексы названий строятся в фоне (_refresh_delivery_combos)
+        self._names = {"products": None, "suppliers": None}
+        self.delivery_product = Typeahead(form, width=320, placeholder="Начните вводить название или id")
+        self.delivery_product.set_search(self._name_search("products"))
+        self.delivery_product.grid(row=0, column=1, pady=5)
         ctk.CTkLabel(form, text="Поставщик:").grid(row=1, column=0, sticky="w", pady=5, padx=(0, 10))
-        suppliers = load_table("suppliers")
-        supplier_values = [f"{s['id']} — {s['name']}" for s in suppliers] or ["— Сначала инициализируйте БД"]
-        self.delivery_supplier_combo = ctk.CTkComboBox(form, width=250, values=supplier_values)
-        self.delivery_supplier_combo.grid(row=1, column=1, pady=5)
+        self.delivery_supplier = Typeahead(form, width=320, placeholder="Начните вводить название или id")
+        self.delivery_supplier.set_search(self._name_search("suppliers"))
+        self.delivery_supplier.grid(row=1, column=1, pady=5)
         ctk.CTkLabel(form, text="Количество:").grid(row=2, column=0, sticky="w", pady=5, padx=(0, 10))
         self.delivery_qty_entry = ctk.CTkEntry(form, width=120, placeholder_text="10")
         self.delivery_qty_entry.grid(row=2, column=1, sticky="w", pady=5)
@@ -580,11 +697,29 @@ class App(ctk.CTk):
         self.delivery_status.pack(pady=10)
 
     def _refresh_delivery_combos(self):
-        """Обновить списки товаров и поставщиков на вкладке «Новая поставка»."""
-        products = load_table("products")
-        suppliers = load_table("suppliers")
-        self.delivery_product_combo.configure(values=[f"{p['id']} — {p['name']}" for p in products] or ["— Нет товаров"])
-        self.delivery_supplier_combo.configure(values=[f"{s['id']} — {s['name']}" for s in suppliers] or ["— Нет поставщиков"])
+        """Перестроить индексы названий для подсказок «Товар» и «Поставщик» (в фоне)."""
+        self.tasks.submit("combos", _delivery_choices, self._show_delivery_choices)
+
+    def _show_delivery_choices(self, choices):
+        self._names["products"], self._names["suppliers"] = choices
+
+    def _name_search(self, table: str):
+        """Подсказки по названиям таблицы (пусто, пока индекс строится)."""
+        return lambda query, limit: self._names[table].search(query, limit) if self._names[table] else []
+
+    def _update_delivery_names(self, table: str, row_id):
+        """Товар или поставщик добавлен или переименован: обновить индекс названий на месте."""
+        names = self._names[table]
+        if names is None:
+            return  # индекс ещё строится и прочитает запись сам
+        field = self.delivery_product if table == "products" else self.delivery_supplier
+        row = get_row(table, row_id)
+        if row is None:
+            names.remove(row_id)
+            field.refresh_item(row_id, None)
+        else:
+            names.add(row_id, row["name"])
+            field.refresh_item(row_id, row["name"])
 
     def _apply_role(self):
         """Ограничить интерфейс по роли: view — только просмотр."""
@@ -598,10 +733,15 @@ class App(ctk.CTk):
         self.btn_restore.configure(state="disabled")
         self.restore_entry.configure(state="disabled")
         self.btn_delivery.configure(state="disabled")
-        self.delivery_product_combo.configure(state="disabled")
-        self.delivery_supplier_combo.configure(state="disabled")
+        self.delivery_product.configure(state="disabled")
+        self.delivery_supplier.configure(state="disabled")
         self.delivery_qty_entry.configure(state="disabled")
 
+    def destroy(self):
+        self._unsubscribe()
+        self.tasks.shutdown()
+        super().destroy()
+
     def _logout(self):
         """Выход: закрыть приложение и открыть окно входа."""
         self.destroy()
@@ -744,14 +884,13 @@ class App(ctk.CTk):
     def _do_add_delivery(self):
         self.delivery_status.configure(text="")
         try:
-            p_str = self.delivery_product_combo.get()
-            s_str = self.delivery_supplier_combo.get()
+            product_id = self.delivery_product.get_id()
+            supplier_id = self.delivery_supplier.get_id()
             qty_str = self.delivery_qty_entry.get().strip()
-            if not p_str or not s_str or not qty_str or p_str.startswith("—") or s_str.startswith("—"):
-                self.delivery_status.configure(text="Заполните все поля и инициализируйте БД при необходимости.", text_color="orange")
+            if product_id is None or supplier_id is None or not qty_str:
+                self.delivery_status.configure(
+                    text="Выберите товар и поставщика из подсказок и укажите количество.", text_color="orange")
                 return
-            product_id = int(p_str.split("—")[0].strip())
-            supplier_id = int(s_str.split("—")[0].strip())
             quantity = int(qty_str)
             if quantity <= 0:
                 self.delivery_status.configure(text="Количество должно быть > 0.", text_color="orange")
@@ -760,7 +899,6 @@ class App(ctk.CTk):
             self.delivery_status.configure(text="Поставка добавлена. Остаток товара обновлён.", text_color="green")
             self.delivery_qty_entry.delete(0, "end")
             self.tabview.set("Данные")
-            self._refresh_data()
         except ValueError as e:
             self.delivery_status.configure(text=f"Ошибка ввода: {e}", text_color="orange")
         except Exception as e:
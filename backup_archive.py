@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Сжатый архив резервной копии одним файлом (для переноса на другой носитель).
+Архив — обычный tar, сжатый независимыми блоками по BLOCK_SIZE байт: блоки
+сжимаются параллельно в пуле потоков (zlib, lzma и zstandard отпускают GIL),
+а последовательность сжатых блоков остаётся корректным файлом .tar.gz / .tar.xz /
+.tar.zst, который распаковывают и стандартные утилиты (tar, gzip, xz, zstd).
+Последний элемент архива — CHECKSUMS (JSON: размер и SHA-256 каждого файла);
+extract() читает архив потоком и сверяет с ним каждый распакованный файл.
+zstd используется, если установлен пакет zstandard, иначе gzip.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import tarfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен
+    zstandard = None
+
+BLOCK_SIZE = 4 * 1024 * 1024
+CHECKSUMS = "CHECKSUMS"
+_COPY_SIZE = 1024 * 1024
+
+# Кодек: расширение файла, сжатие блока (самостоятельный фрагмент формата), начало файла
+CODECS = {
+    "zstd": (".tar.zst", lambda block: zstandard.ZstdCompressor(level=3, write_checksum=True).compress(block),
+             b"\x28\xb5\x2f\xfd"),
+    "gzip": (".tar.gz", lambda block: gzip.compress(block, compresslevel=6, mtime=0), b"\x1f\x8b"),
+    "xz": (".tar.xz", lambda block: lzma.compress(block, preset=6), b"\xfd7zXZ\x00"),
+}
+# Ошибки чтения повреждённого или обрезанного архива
+_READ_ERRORS = (tarfile.TarError, EOFError, zlib.error, lzma.LZMAError, gzip.BadGzipFile) + (
+    (zstandard.ZstdError,) if zstandard is not None else ())
+
+# Файл для архива: (путь внутри архива через «/», размер, поток с содержимым)
+Item = Tuple[str, int, BinaryIO]
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def suffix(codec: str) -> str:
+    return CODECS[codec][0]
+
+
+class _BlockCompressor:
+    """Файлоподобный приёмник tar-потока: сжимает блоки в пуле и пишет их в out по порядку."""
+
+    def __init__(self, out: BinaryIO, codec: str, workers: int):
+        self._out = out
+        self._compress = CODECS[codec][1]
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive")
+        self._pending: deque = deque()
+        self._limit = 2 * workers  # сжатых блоков в памяти не больше
+        self._buf = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buf += data
+        while len(self._buf) >= BLOCK_SIZE:
+            self._submit(bytes(self._buf[:BLOCK_SIZE]))
+            del self._buf[:BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(self._pool.submit(self._compress, block))
+        while len(self._pending) > self._limit:
+            self._out.write(self._pending.popleft().result())
+
+    def close(self) -> None:
+        try:
+            if self._buf:
+                self._submit(bytes(self._buf))
+                self._buf.clear()
+            while self._pending:
+                self._out.write(self._pending.popleft().result())
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+
+
+class _Hashing:
+    """Поток-обёртка: считает SHA-256 прочитанного."""
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def read(self, n: int = -1) -> bytes:
+        data = self._f.read(n)
+        self.sha256.update(data)
+        return data
+
+
+def write(path: Path, items: Iterable[Item], codec: Optional[str] = None, workers: Optional[int] = None,
+          meta: Optional[Dict[str, Dict[str, Any]]] = None) -> Path:
+    """
+    Записать архив (через временный файл и os.replace). meta — дополнительные
+    поля записей CHECKSUMS по путям файлов. Возвращает путь архива.
+    """
+    codec = codec or default_codec()
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("Для zstd установите пакет zstandard (pip install zstandard)")
+    if codec not in CODECS:
+        raise ValueError(f"Неизвестный формат сжатия: {codec} (допустимо: {', '.join(CODECS)})")
+    sums: Dict[str, Dict[str, Any]] = {}
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as out:
+            sink = _BlockCompressor(out, codec, workers or os.cpu_count() or 1)
+            try:
+                with tarfile.open(fileobj=sink, mode="w|", format=tarfile.PAX_FORMAT, copybufsize=_COPY_SIZE) as tar:
+                    for name, size, f in items:
+                        info = tarfile.TarInfo(name)
+                        info.size = size
+                        info.mode = 0o644
+                        hashing = _Hashing(f)
+                        tar.addfile(info, hashing)
+                        sums[name] = {"size": size, "sha256": hashing.sha256.hexdigest(), **(meta or {}).get(name, {})}
+                    data = json.dumps({"files": sums}, ensure_ascii=False, indent=1).encode("utf-8")
+                    info = tarfile.TarInfo(CHECKSUMS)
+                    info.size = len(data)
+                    info.mode = 0o644
+                    tar.addfile(info, io.BytesIO(data))
+            finally:
+                sink.close()
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
+
+
+def is_archive(path: Path) -> bool:
+    """Файл архива (по первым байтам) — gzip, xz или zstd."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+    except (IsADirectoryError, FileNotFoundError, PermissionError):
+        return False
+    return any(head.startswith(magic) for _, _, magic in CODECS.values())
+
+
+def _open(raw: BinaryIO) -> BinaryIO:
+    head = raw.read(8)
+    raw.seek(0)
+    if head.startswith(CODECS["gzip"][2]):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if head.startswith(CODECS["xz"][2]):
+        return lzma.LZMAFile(raw)
+    if head.startswith(CODECS["zstd"][2]):
+        if zstandard is None:
+            raise ValueError("Архив сжат zstd: установите пакет zstandard (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    raise ValueError("Неизвестный формат архива")
+
+
+def _safe_name(name: str) -> PurePosixPath:
+    rel = PurePosixPath(name)
+    if rel.is_absolute() or ".." in rel.parts or not rel.parts:
+        raise ValueError(f"Недопустимый путь в архиве: {name}")
+    return rel
+
+
+def extract(path: Path, dest: Path, select: Optional[Callable[[str], bool]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Распаковать архив потоком в каталог dest и сверить файлы с CHECKSUMS
+    (select — отбор файлов по пути в архиве, остальные пропускаются).
+    ValueError — архив повреждён, обрезан или не совпадают контрольные суммы.
+    Возвращает записи CHECKSUMS распакованных файлов.
+    """
+    found: Dict[str, Dict[str, Any]] = {}
+    expected = None
+    try:
+        with open(path, "rb") as raw, _open(raw) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if member.name == CHECKSUMS:
+                    expected = json.loads(tar.extractfile(member).read())["files"]
+                    continue
+                if not member.isfile() or (select is not None and not select(member.name)):
+                    continue
+                target = dest.joinpath(*_safe_name(member.name).parts)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                src = tar.extractfile(member)
+                sha = hashlib.sha256()
+                with open(target, "wb") as out:
+                    for data in iter(lambda: src.read(_COPY_SIZE), b""):
+                        sha.update(data)
+                        out.write(data)
+                found[member.name] = {"size": member.size, "sha256": sha.hexdigest()}
+    except _READ_ERRORS as e:
+        raise ValueError(f"Архив {path.name} повреждён: {e}") from e
+    if expected is None:
+        raise ValueError(f"В архиве {path.name} нет контрольных сумм ({CHECKSUMS}): архив обрезан или повреждён")
+    wanted = {n for n in expected if select is None or select(n)}
+    bad = sorted(wanted ^ set(found) | {n for n in found if n in expected and (
+        found[n]["size"], found[n]["sha256"]) != (expected[n]["size"], expected[n]["sha256"])})
+    if bad:
+        raise ValueError(f"Архив {path.name}: не совпадают контрольные суммы: {', '.join(bad[:5])}")
+    return {n: expected[n] for n in found}
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Резервное копирование по расписанию (долго работающий процесс).
+Расписание, ограничение скорости и срок хранения копий — в config.py
+(BACKUP_SCHEDULE, BACKUP_RATE_MB, BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY).
+Каждая копия — инкрементная (backup_db.run_backup): каталог данных блокируется
+только на мгновенный снимок жёсткими ссылками, файлы читаются с ограничением
+скорости, поэтому запись поставок во время копии не замедляется. После копии
+удаляются старые копии, части хранилища, на которые больше не ссылается ни одна
+копия, и файлы журнала изменений до позиции самой ранней оставшейся копии.
+Ошибка одной копии не останавливает процесс — следующая выполняется по расписанию.
+Запуск: python backup_daemon.py [--once]  (--once — одна копия с очисткой и выход)
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Set
+
+import csv_changelog
+import csv_db
+from backup_db import collect_garbage, prune_backups, read_manifest, run_backup
+from config import BACKUP_DIR, BACKUP_KEEP_DAILY, BACKUP_KEEP_LAST, BACKUP_RATE_MB, BACKUP_SCHEDULE
+
+# Ожидание следующей копии — шагами не длиннее минуты (перевод часов, сон компьютера)
+_SLEEP_STEP = 60
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+# Поля cron: (нижняя граница, верхняя граница); день недели 0 и 7 — воскресенье
+_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_field(text: str, lo: int, hi: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        if span == "*":
+            first, last = lo, hi
+        elif "-" in span:
+            first, last = map(int, span.split("-", 1))
+        else:
+            first = int(span)
+            last = hi if step else first
+        n = int(step) if step else 1
+        if not lo <= first <= last <= hi or n < 1:
+            raise ValueError(part)
+        values.update(range(first, last + 1, n))
+    return values
+
+
+class Schedule:
+    """Расписание копий: интервал ("every 30m") или cron из пяти полей."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.interval: Optional[timedelta] = None
+        words = text.split()
+        try:
+            if len(words) == 2 and words[0] == "every":
+                self.interval = timedelta(seconds=int(words[1][:-1]) * _UNITS[words[1][-1]])
+                if self.interval <= timedelta(0):
+                    raise ValueError(words[1])
+                return
+            if len(words) != 5:
+                raise ValueError(text)
+            self.minutes, self.hours, self.days, self.months, weekdays = (
+                _parse_field(w, lo, hi) for w, (lo, hi) in zip(words, _FIELDS))
+        except (ValueError, KeyError):
+            raise ValueError(f"Неверное расписание копий: {text!r}") from None
+        self.weekdays = {d % 7 for d in weekdays}
+        self._any_day, self._any_weekday = words[2] == "*", words[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        # Как в cron: если заданы и число, и день недели — подходит любое из них
+        if not self._any_day and not self._any_weekday:
+            return day or weekday
+        return day and weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшее время копии строго после moment."""
+        if self.interval is not None:
+            return moment + self.interval
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=4 * 366)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Расписание копий {self.text!r} не наступает никогда")
+
+
+def _log(message: str) -> None:
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}", flush=True)
+
+
+def _prune_changelog(backup_dir: Path) -> int:
+    """Удалить файлы журнала изменений, которые не нужны ни одной оставшейся копии."""
+    starts = [m["changelog"]["position"] for p in backup_dir.iterdir()
+              for m in (read_manifest(p),) if m is not None and "changelog" in m]
+    if not starts:
+        return 0
+    return len(csv_changelog.prune(csv_db.changelog_dir(), min(starts)))
+
+
+def run_once(backup_dir: Path = BACKUP_DIR) -> Path:
+    """Одна копия по настройкам расписания и очистка старых копий. Возвращает папку копии."""
+    started = time.perf_counter()
+    path = run_backup(rate=BACKUP_RATE_MB * 2 ** 20 if BACKUP_RATE_MB else None)
+    removed = prune_backups(backup_dir, BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY)
+    chunks, size = collect_garbage(backup_dir)
+    segments = _prune_changelog(backup_dir)
+    _log(f"Копия {path.name} за {time.perf_counter() - started:.1f} с; удалено копий: {len(removed)}, "
+         f"частей: {chunks} ({size / 2 ** 20:.1f} МБ), файлов журнала изменений: {segments}")
+    return path
+
+
+def main(args) -> None:
+    if "--once" in args:
+        run_once()
+        return
+    schedule = Schedule(BACKUP_SCHEDULE)
+    _log(f"Копии по расписанию {schedule.text!r}, каталог {BACKUP_DIR}")
+    planned = schedule.next_after(datetime.now())
+    while True:
+        _log(f"Следующая копия: {planned:%Y-%m-%d %H:%M:%S}")
+        left = (planned - datetime.now()).total_seconds()
+        while left > 0:
+            time.sleep(min(left, _SLEEP_STEP))
+            left = (planned - datetime.now()).total_seconds()
+        try:
+            run_once()
+        except Exception as e:  # процесс продолжает работу: следующая копия — по расписанию
+            _log(f"Ошибка копии: {e}")
+        # Пропущенные за время долгой копии моменты не наверстываются
+        planned = schedule.next_after(max(planned, datetime.now()))
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except KeyboardInterrupt:
+        _log("Остановлено.")
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
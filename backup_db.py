@@ -1,36 +1,535 @@
 # -*- coding: utf-8 -*-
 """
 Резервное копирование БД учета товаров (CSV).
-Копирует каталог data/ в backups/products_db_YYYYMMDD_HHMMSS/.
-Запуск: python backup_db.py [имя_папки]
+Копия — папка backups/products_db_YYYYMMDD_HHMMSS/ с манифестом manifest.json:
+для каждого файла каталога data/ (вместе с секциями data/deliveries/) — список
+его частей по хешу SHA-256. Сами части хранятся один раз в общем хранилище
+backups/chunks/ и используются всеми копиями, поэтому время и место копии
+пропорциональны изменениям с прошлой копии:
+- файл с прежней сигнатурой (mtime, размер, inode) не читается;
+- у изменённого файла части прошлой копии, с которых он по-прежнему начинается,
+  сверяются по SHA-256 (без разбиения), заново разбивается только остальное:
+  у дописанного файла — хвост с начала последней части. Совпадение inode
+  и рост размера ничего не доказывают: файловая система отдаёт номер
+  заменённого (os.replace) файла следующему;
+- в переписанном файле границы частей проходят по концам строк и выбираются
+  по содержимому строки, поэтому правка в середине меняет одну-две части.
+Производные файлы (индексы, снимки, блокировка, журнал) не копируются.
+Каталог данных блокируется только на мгновенный снимок жёсткими ссылками
+(data/_meta/backup_<pid>/): таблицы переписываются через os.replace, и ссылка
+сохраняет прежнее содержимое, а дописываемые файлы читаются до размера на момент
+снимка. Чтение снимка может ограничиваться по скорости (копия по расписанию,
+backup_daemon), запись в data/ его не ждёт. Старые копии удаляются prune_backups,
+ненужные части хранилища — collect_garbage.
+Манифест запоминает позицию журнала изменений (csv_changelog) на момент копии:
+restore_db --until повторяет изменения с неё до нужного момента.
+Старые копии — полные копии папки data/ — восстанавливаются как прежде.
+При движке SQLite (STORAGE_BACKEND = "sqlite") копируется только база: снимок
+делает sqlite3 backup API (sqlite_db.backup_to), в копии это файл products.db;
+журнал изменений этот движок не ведёт, копия — без позиции журнала. Файлы базы
+в data/ при движке CSV не копируются (их нельзя скопировать согласованно).
+Для переноса на другой носитель копия выгружается в сжатый архив одним файлом
+(backup_archive): products_db_*.tar.zst, .tar.gz или .tar.xz рядом с папкой.
+Запуск: python backup_db.py [имя_папки] [--full] [--archive[=zstd|gzip|xz]]
+(--full — перечитать все файлы; --archive — также создать сжатый архив копии)
 """
 
+import hashlib
+import json
+import os
 import shutil
 import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from config import DATA_DIR, BACKUP_DIR
+import backup_archive
+import csv_changelog
+import csv_db
+import csv_lock
+import sqlite_db
+from config import BACKUP_DIR
 
+MANIFEST = "manifest.json"
+CHUNKS_DIR = "chunks"
+CHUNK_MIN = 256 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+# Граница части — после строки, у которой младшие биты crc32 нулевые:
+# в среднем через ~8 тыс. строк после CHUNK_MIN (части около 0,5–1 МБ)
+_CUT_MASK = (1 << 13) - 1
+# Производные и временные файлы каталога данных; файлы базы SQLite копируются только через backup API
+_SKIP_SUFFIXES = (".snap", ".idx.json", ".idx.log", ".tmp", ".db", ".db-wal", ".db-shm", ".db-journal")
+SQLITE_FILE = "products.db"  # база SQLite в копии
+_SKIP_PATHS = ("_meta/lock", "_meta/journal/", "_meta/backup_")
+# Имя папки копии по умолчанию (такие папки удаляет prune_backups)
+NAME_FORMAT = "products_db_%Y%m%d_%H%M%S"
+# Блокировка хранилища копий: копия — разделяемая, удаление копий и частей — исключительная
+STORE_LOCK = ".lock"
+_store_locks: Dict[Path, csv_lock.DirLock] = {}
 
-def run_backup(output_path: Path = None) -> Path:
-    """Создать резервную копию папки data/. Возвращает путь к папке копии."""
-    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+# Запись манифеста: {"sig": [mtime_ns, size, ino], "size": n, "chunks": [[sha256, размер], ...]}
+Entry = Dict[str, Any]
+
+
+def chunk_path(store: Path, digest: str) -> Path:
+    return store / digest[:2] / digest
+
+
+def _cut(buf: bytes, eof: bool) -> int:
+    """Длина первой части в буфере (в буфере не меньше CHUNK_MAX байт или конец файла)."""
+    if len(buf) <= CHUNK_MIN:
+        return len(buf)
+    pos = buf.find(b"\n", CHUNK_MIN - 1)
+    limit = min(len(buf), CHUNK_MAX)
+    while pos != -1 and pos < limit:
+        end = buf.find(b"\n", pos + 1)
+        if end == -1 or end >= limit:
+            break
+        if not zlib.crc32(buf[pos + 1:end]) & _CUT_MASK:
+            return end + 1
+        pos = end
+    if eof and len(buf) <= CHUNK_MAX:
+        return len(buf)
+    last = buf.rfind(b"\n", 0, limit)
+    return last + 1 if last >= CHUNK_MIN else limit
+
+
+def iter_chunks(f, size: int) -> Iterator[bytes]:
+    """Части файла от текущей позиции до size байт (границы зависят только от содержимого)."""
+    buf = b""
+    left = size
+    while True:
+        while len(buf) < CHUNK_MAX and left:
+            block = f.read(min(left, CHUNK_MAX))
+            left = left - len(block) if block else 0
+            buf += block
+        if not buf:
+            return
+        n = _cut(buf, not left)
+        yield buf[:n]
+        buf = buf[n:]
+
+
+def _store_chunk(store: Path, data: bytes, stats: Dict[str, int]) -> str:
+    """Положить часть в хранилище (если её там ещё нет). Возвращает её хеш."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = chunk_path(store, digest)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{digest}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        stats["new_chunks"] += 1
+        stats["new_bytes"] += len(data)
+    return digest
+
+
+def _signature(st: os.stat_result) -> List[int]:
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+class _Throttle:
+    """Ограничение скорости чтения: пауза после порции, если чтение опережает rate байт/с."""
+
+    def __init__(self, rate: Optional[float]):
+        self._rate = rate
+        self._start = time.monotonic()
+        self._done = 0
+
+    def __call__(self, n: int) -> None:
+        if not self._rate:
+            return
+        self._done += n
+        ahead = self._done / self._rate - (time.monotonic() - self._start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _same_prefix(f, prev_chunks: List[List[Any]], size: int, stats: Dict[str, int],
+                 throttle: _Throttle) -> List[List[Any]]:
+    """
+    Части прошлой копии, с которых файл начинается и сейчас (сверка SHA-256 от
+    начала файла до первого расхождения). Последняя часть прошлой копии не берётся:
+    она закончилась концом файла, а не границей по содержимому, и разбиение
+    продолжается с её начала.
+    """
+    same: List[List[Any]] = []
+    offset = 0
+    for digest, length in prev_chunks[:-1]:
+        if offset + length > size:
+            break
+        data = f.read(length)
+        stats["read_bytes"] += len(data)
+        throttle(len(data))
+        if hashlib.sha256(data).hexdigest() != digest:
+            break
+        same.append([digest, length])
+        offset += length
+    return same
+
+
+def _backup_file(path: Path, st: os.stat_result, prev: Optional[Entry], store: Path, full: bool,
+                 stats: Dict[str, int], throttle: _Throttle) -> Entry:
+    """
+    Запись манифеста для файла: из прошлой копии, совпадающее с ней начало и новый
+    остаток (у дописанного файла — хвост) или файл целиком.
+    st — состояние файла на момент снимка: читается не дальше st.st_size байт.
+    """
+    sig = _signature(st)
+    stats["bytes"] += st.st_size
+    reuse = prev is not None and not full and all(chunk_path(store, d).exists() for d, _ in prev["chunks"])
+    if reuse and prev["sig"] == sig:
+        stats["unchanged"] += 1
+        return prev
+    with open(path, "rb") as f:
+        chunks = _same_prefix(f, prev["chunks"], st.st_size, stats, throttle) if reuse else []
+        offset = sum(n for _, n in chunks)
+        f.seek(offset)
+        for data in iter_chunks(f, st.st_size - offset):
+            chunks.append([_store_chunk(store, data, stats), len(data)])
+            stats["read_bytes"] += len(data)
+            throttle(len(data))
+    return {"sig": sig, "size": st.st_size, "chunks": chunks}
+
+
+def data_files(data_dir: Path) -> List[Tuple[str, Path]]:
+    """Файлы каталога данных для копии: (путь относительно data/ через «/», путь)."""
+    files = []
+    for path in sorted(data_dir.rglob("*")):
+        rel = path.relative_to(data_dir).as_posix()
+        if not path.is_file() or rel.endswith(_SKIP_SUFFIXES) or rel.startswith(_SKIP_PATHS):
+            continue
+        files.append((rel, path))
+    return files
+
+
+def remove_stale_dirs(parent: Path, prefix: str) -> None:
+    """Удалить каталоги <prefix><pid>..., оставшиеся от завершившихся процессов (сбой посреди работы)."""
+    for path in parent.glob(prefix + "*"):
+        try:
+            os.kill(int(path.name[len(prefix):].split("_")[0]), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except (ValueError, OSError):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _snapshot(data_dir: Path) -> Tuple[Path, List[Tuple[str, Path, os.stat_result]]]:
+    """
+    Снимок каталога данных жёсткими ссылками (вызывается под блокировкой каталога).
+    Возвращает каталог снимка и (путь относительно data/, ссылка, состояние файла).
+    """
+    meta = data_dir / "_meta"
+    remove_stale_dirs(meta, "backup_")
+    directory = meta / f"backup_{os.getpid()}"
+    shutil.rmtree(directory, ignore_errors=True)
+    files = []
+    for rel, path in data_files(data_dir):
+        target = directory / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)  # ФС без жёстких ссылок
+        files.append((rel, target, path.stat()))
+    return directory, files
+
+
+def _snapshot_sqlite(parent: Path) -> Tuple[Path, List[Tuple[str, Path, os.stat_result]]]:
+    """Снимок базы SQLite (sqlite_db.backup_to) во временный каталог parent/.sqlite_<pid>; формат — как у _snapshot."""
+    remove_stale_dirs(parent, ".sqlite_")
+    directory = parent / f".sqlite_{os.getpid()}"
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir()
+    target = directory / SQLITE_FILE
+    sqlite_db.backup_to(target)
+    return directory, [(SQLITE_FILE, target, target.stat())]
+
+
+def _copy_snapshot(snapped: List[Tuple[str, Path, os.stat_result]], dest: Path) -> None:
+    """Файлы снимка в каталог dest — каждый в размере на момент снимка (дописанное позже не копируется)."""
+    for rel, path, st in snapped:
+        target = dest / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "rb") as src, open(target, "wb") as out:
+            left = st.st_size
+            while left:
+                data = src.read(min(left, CHUNK_MAX))
+                if not data:
+                    break
+                out.write(data)
+                left -= len(data)
+
+
+def _store_lock(backup_dir: Path, exclusive: bool = False):
+    path = backup_dir / STORE_LOCK
+    lock = _store_locks.get(path)
+    if lock is None:
+        lock = _store_locks[path] = csv_lock.DirLock(path)
+    return lock.hold(exclusive)
+
+
+def read_manifest(backup_path: Path) -> Optional[Dict[str, Any]]:
+    """Манифест копии; None — это полная копия папки data/ (старый формат) или не копия."""
+    try:
+        return json.loads((backup_path / MANIFEST).read_text(encoding="utf-8"))
+    except (FileNotFoundError, NotADirectoryError, ValueError):
+        return None
+
+
+def _latest_manifest(backup_dir: Path, exclude: Path) -> Optional[Dict[str, Any]]:
+    """Манифест самой поздней копии с манифестом (основа для следующей)."""
+    latest = None
+    for path in backup_dir.iterdir() if backup_dir.exists() else ():
+        if path == exclude:
+            continue
+        manifest = read_manifest(path)
+        if manifest is not None and (latest is None or manifest["created"] > latest["created"]):
+            latest = manifest
+    return latest
+
+
+def _write_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def run_backup(output_path: Path = None, full: bool = False, rate: Optional[float] = None,
+               snapshot_to: Optional[Path] = None) -> Path:
+    """
+    Создать резервную копию папки data/. Возвращает путь к папке копии.
+    full=True — перечитать все файлы, не доверяя сигнатурам прошлой копии;
+    rate — ограничение скорости чтения файлов, байт/с;
+    snapshot_to — сохранить туда файлы снимка, с которого сделана копия
+    (для побайтовой сверки: performance_analysis check-backups).
+    При движке SQLite копируется только база (см. описание модуля).
+    FileNotFoundError — каталога data/ (или базы SQLite) нет.
+    """
+    data_dir = csv_db.DATA_DIR
+    sqlite = csv_db.get_backend() == "sqlite"
+    if sqlite and not sqlite_db.db_path().exists():
+        raise FileNotFoundError(f"База SQLite не найдена: {sqlite_db.db_path()}."
+                                " Сначала выполните: python sqlite_db.py migrate")
+    if not sqlite and not data_dir.exists():
+        raise FileNotFoundError("Каталог data/ не найден. Сначала выполните: python create_database.py")
     if output_path is None:
-        output_path = BACKUP_DIR / f"products_db_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    if not DATA_DIR.exists():
-        print("Каталог data/ не найден. Сначала выполните: python create_database.py")
-        sys.exit(1)
-    if output_path.exists():
-        shutil.rmtree(output_path)
-    shutil.copytree(DATA_DIR, output_path)
+        output_path = BACKUP_DIR / datetime.now().strftime(NAME_FORMAT)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    stats = {"bytes": 0, "read_bytes": 0, "new_bytes": 0, "new_chunks": 0, "unchanged": 0}
+    with _store_lock(output_path.parent):
+        if output_path.exists():
+            shutil.rmtree(output_path)
+        store = output_path.parent / CHUNKS_DIR
+        prev = _latest_manifest(output_path.parent, output_path)
+        prev_files = prev["files"] if prev is not None else {}
+        if sqlite:
+            snapshot, snapped = _snapshot_sqlite(output_path.parent)
+            changelog = None
+        else:
+            # Разделяемая блокировка — только на время снимка: запись в data/ ждёт миллисекунды.
+            # Запись в журнал изменений идёт под исключительной блокировкой: позиция согласована с файлами
+            with csv_db.data_snapshot_lock():
+                snapshot, snapped = _snapshot(data_dir)
+                changelog = {"position": csv_changelog.position(csv_db.changelog_dir()),
+                             "time": csv_changelog.timestamp()}
+        throttle = _Throttle(rate)
+        try:
+            files = {rel: _backup_file(path, st, prev_files.get(rel), store, full, stats, throttle)
+                     for rel, path, st in snapped}
+            if snapshot_to is not None:
+                _copy_snapshot(snapped, snapshot_to)
+        finally:
+            shutil.rmtree(snapshot, ignore_errors=True)
+        output_path.mkdir(parents=True)
+        manifest = {"created": datetime.now().isoformat(timespec="microseconds"), "files": files}
+        if changelog is not None:
+            manifest["changelog"] = changelog
+        _write_manifest(output_path / MANIFEST, manifest)
+    mb = 2 ** 20
     print(f"Резервная копия создана: {output_path}")
+    print(f"  Файлов: {len(files)} (без изменений {stats['unchanged']}), данных {stats['bytes'] / mb:.1f} МБ; "
+          f"прочитано {stats['read_bytes'] / mb:.1f} МБ, новых частей {stats['new_chunks']} "
+          f"({stats['new_bytes'] / mb:.1f} МБ)")
     return output_path
 
 
-if __name__ == "__main__":
-    name = sys.argv[1] if len(sys.argv) > 1 else None
-    path = Path(name) if name else None
+def _backup_time(path: Path) -> Optional[datetime]:
+    """Время копии по имени папки по умолчанию (NAME_FORMAT); None — папка названа иначе."""
+    try:
+        return datetime.strptime(path.name, NAME_FORMAT)
+    except ValueError:
+        return None
+
+
+def prune_backups(backup_dir: Path, keep_last: int, keep_daily: int, now: Optional[datetime] = None) -> List[Path]:
+    """
+    Удалить старые папки копий с именами по умолчанию: остаются keep_last последних
+    и самая поздняя копия каждого из keep_daily последних дней. Папки с другими
+    именами и архивы не трогаются. Возвращает удалённые папки.
+    """
+    now = now or datetime.now()
+    dated = sorted(((t, p) for p in backup_dir.iterdir() if p.is_dir()
+                    for t in (_backup_time(p),) if t is not None), reverse=True)
+    keep = {p for _, p in dated[:max(keep_last, 0)]}
+    days = set()
+    for t, p in dated:
+        if (now.date() - t.date()).days < keep_daily and t.date() not in days:
+            days.add(t.date())
+            keep.add(p)
+    removed = []
+    with _store_lock(backup_dir, exclusive=True):
+        for _, p in dated:
+            if p not in keep:
+                shutil.rmtree(p)
+                removed.append(p)
+    return removed
+
+
+def collect_garbage(backup_dir: Path) -> Tuple[int, int]:
+    """
+    Удалить из хранилища части, на которые не ссылается ни одна копия (и временные
+    файлы прерванной записи). Возвращает (число файлов, байт).
+    """
+    store = backup_dir / CHUNKS_DIR
+    count = size = 0
+    with _store_lock(backup_dir, exclusive=True):
+        used = set()
+        for path in backup_dir.iterdir():
+            manifest = read_manifest(path)
+            if manifest is not None:
+                used.update(d for entry in manifest["files"].values() for d, _ in entry["chunks"])
+        for path in store.glob("??/*") if store.exists() else ():
+            if path.name not in used:
+                count += 1
+                size += path.stat().st_size
+                path.unlink()
+    return count, size
+
+
+def _read_chunk(store: Path, digest: str, size: int, rel: str) -> bytes:
+    """Содержимое части с проверкой размера и хеша."""
+    try:
+        data = chunk_path(store, digest).read_bytes()
+    except FileNotFoundError:
+        raise ValueError(f"Нет части {digest[:12]} файла {rel} в {store}") from None
+    if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Повреждена часть {digest[:12]} файла {rel}")
+    return data
+
+
+class _ChunkReader:
+    """Файл копии как поток для чтения: части читаются по очереди с проверкой хеша."""
+
+    def __init__(self, store: Path, rel: str, entry: Entry):
+        self._store = store
+        self._rel = rel
+        self._chunks = iter(entry["chunks"])
+        self._buf = b""
+
+    def read(self, n: int = -1) -> bytes:
+        while n < 0 or len(self._buf) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += _read_chunk(self._store, chunk[0], chunk[1], self._rel)
+        if n < 0 or n >= len(self._buf):
+            data, self._buf = self._buf, b""
+        else:
+            data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+
+def extract(backup_path: Path, dest: Path, select: Optional[Callable[[str], bool]] = None,
+            workers: int = 1) -> List[str]:
+    """
+    Собрать файлы копии с манифестом в каталоге dest (select — отбор по пути
+    относительно data/; workers — файлов одновременно). Хеш каждой части
+    проверяется. Возвращает пути файлов.
+    """
+    manifest = read_manifest(backup_path)
+    if manifest is None:
+        raise ValueError(f"В {backup_path} нет манифеста резервной копии")
+    store = backup_path.parent / CHUNKS_DIR
+    files = [(rel, entry) for rel, entry in manifest["files"].items() if select is None or select(rel)]
+
+    def write(item: Tuple[str, Entry]) -> None:
+        rel, entry = item
+        target = dest / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, "wb") as out:
+            for digest, size in entry["chunks"]:
+                out.write(_read_chunk(store, digest, size, rel))
+
+    # Чтение, хеширование и запись отпускают GIL — файлы собираются параллельно
+    with _store_lock(backup_path.parent), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(write, files))
+    return [rel for rel, _ in files]
+
+
+def _folder_items(folder: Path) -> Iterator[backup_archive.Item]:
+    for rel, path in data_files(folder):
+        with open(path, "rb") as f:
+            yield rel, os.fstat(f.fileno()).st_size, f
+
+
+def export_archive(backup_path: Path, codec: Optional[str] = None, workers: Optional[int] = None) -> Path:
+    """
+    Сжатый архив копии одним файлом рядом с её папкой: products_db_*.tar.zst
+    (или .tar.gz / .tar.xz, см. backup_archive). Копия с манифестом читается из
+    хранилища частей — без блокировки каталога данных; полная копия старого
+    формата — из её папки.
+    """
+    codec = codec or backup_archive.default_codec()
+    manifest = read_manifest(backup_path)
+    if manifest is not None:
+        store = backup_path.parent / CHUNKS_DIR
+        items = ((rel, entry["size"], _ChunkReader(store, rel, entry)) for rel, entry in manifest["files"].items())
+        # Исходные сигнатуры файлов нужны восстановлению (журнал остатков, см. restore_db)
+        meta = {rel: {"sig": entry["sig"]} for rel, entry in manifest["files"].items()}
+    else:
+        items = _folder_items(backup_path)
+        meta = None
+    archive = backup_path.with_name(backup_path.name + backup_archive.suffix(codec))
+    with _store_lock(backup_path.parent):
+        backup_archive.write(archive, items, codec, workers, meta)
+    return archive
+
+
+def _parse_args(args: List[str]) -> Tuple[Optional[Path], bool, Optional[str]]:
+    """[имя_папки] [--full] [--archive[=zstd|gzip|xz]] → (путь, full, формат архива или None)."""
+    path, full, archive = None, False, None
+    for arg in args:
+        if arg == "--full":
+            full = True
+        elif arg == "--archive" or arg.startswith("--archive="):
+            archive = arg.partition("=")[2] or backup_archive.default_codec()
+        else:
+            path = Path(arg)
     if path and not path.is_absolute():
         path = BACKUP_DIR / path
-    run_backup(path)
+    return path, full, archive
+
+
+if __name__ == "__main__":
+    path, full, archive = _parse_args(sys.argv[1:])
+    try:
+        path = run_backup(path, full=full)
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(1)
+    if archive is not None:
+        started = time.perf_counter()
+        result = export_archive(path, archive)
+        print(f"Архив: {result} ({result.stat().st_size / 2 ** 20:.1f} МБ, {time.perf_counter() - started:.1f} с)")
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Компактное представление таблицы products по столбцам.
+Числовые поля хранятся в array('q') (8 байт на значение), цена — целым числом
+копеек, строки интернируются. Строка таблицы доступна как ProductRow —
+лёгкое представление с интерфейсом словаря (p["price"], p.get("name"), dict(p)),
+поэтому код, написанный для списков словарей (представления v_*, GUI), работает
+и с ProductColumns.
+"""
+
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import aggregates
+
+FIELDS = ("id", "name", "category_id", "supplier_id", "price", "quantity", "created_at")
+_INT_FIELDS = {"id": "ids", "category_id": "category_ids", "supplier_id": "supplier_ids", "quantity": "quantities"}
+_CENT = Decimal("0.01")
+
+
+def price_to_kop(value: Any) -> int:
+    """Цена (строка, Decimal, число) → целое число копеек с округлением до копейки."""
+    if isinstance(value, str):
+        whole, dot, frac = value.strip().partition(".")
+        # Быстрый путь для обычной записи вида 1234.50
+        if whole.isdigit() and (not dot or (frac.isdigit() and len(frac) <= 2)):
+            return int(whole) * 100 + int(frac.ljust(2, "0") or 0)
+    return int((Decimal(str(value)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+_PLAIN_PRICES = re.compile(r"(?:\d{1,13}(?:\.\d{1,2})?\n)*")
+
+
+def prices_to_kop(values: Sequence[str]) -> array:
+    """
+    Столбец цен-строк → array('q') копеек. Если все цены в обычной записи (до 2 знаков
+    после точки, что проверяется одним регулярным выражением по всему столбцу),
+    перевод идёт через float в C-циклах: для таких чисел float(x) * 100 округляется
+    точно. Иначе — price_to_kop для каждого значения.
+    """
+    if _PLAIN_PRICES.fullmatch("\n".join(values) + "\n" if values else ""):
+        return array("q", map(round, map((100.0).__mul__, map(float, values))))
+    return array("q", map(price_to_kop, values))
+
+
+def _int_column(values: Sequence[Any]) -> array:
+    if isinstance(values, array) and values.typecode == "q":
+        return values
+    return array("q", map(int, values))
+
+
+def kop_to_price(kop: int) -> Decimal:
+    """Целое число копеек → Decimal с двумя знаками после запятой."""
+    return Decimal(kop).scaleb(-2).quantize(_CENT)
+
+
+class ProductRow(Mapping):
+    """Строка ProductColumns с интерфейсом словаря (без копирования данных)."""
+
+    __slots__ = ("_table", "_pos")
+
+    def __init__(self, table: "ProductColumns", pos: int):
+        self._table = table
+        self._pos = pos
+
+    def __getitem__(self, key: str) -> Any:
+        t, i = self._table, self._pos
+        attr = _INT_FIELDS.get(key)
+        if attr is not None:
+            return getattr(t, attr)[i]
+        if key == "price":
+            return kop_to_price(t.prices_kop[i])
+        if key == "name":
+            return t.names[i]
+        if key == "created_at":
+            return t.created_at[i]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        t, i = self._table, self._pos
+        attr = _INT_FIELDS.get(key)
+        if attr is not None:
+            getattr(t, attr)[i] = int(value)
+        elif key == "price":
+            t.prices_kop[i] = price_to_kop(value)
+        elif key in ("name", "created_at"):
+            (t.names if key == "name" else t.created_at)[i] = sys.intern(str(value))
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __repr__(self) -> str:
+        return f"ProductRow({dict(self)!r})"
+
+
+class ProductColumns:
+    """Таблица products по столбцам. Итерация возвращает ProductRow."""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.category_ids = array("q")
+        self.supplier_ids = array("q")
+        self.quantities = array("q")
+        self.prices_kop = array("q")
+        self.names: List[str] = []
+        self.created_at: List[str] = []
+        self._pos_by_id: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def from_records(cls, header: List[str], records: Iterable[List[str]]) -> "ProductColumns":
+        """Построить таблицу из строк CSV (списков полей) без промежуточных словарей."""
+        width = len(header)
+        records = list(records)
+        if records and min(map(len, records)) < width:
+            records = [rec + [""] * (width - len(rec)) for rec in records if rec]
+        if not records:
+            return cls()
+        # Разбор по столбцам: int/intern применяются к целому столбцу (цикл в C)
+        return cls.from_columns(dict(zip(header, zip(*records))))
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Sequence[Any]]) -> "ProductColumns":
+        """
+        Построить таблицу из столбцов: поле → значения (строки CSV или уже целые,
+        например array('q') из двоичного снимка; цена — строкой).
+        """
+        t = cls()
+        intern = sys.intern
+        t.ids = _int_column(columns["id"])
+        t.names = list(map(intern, columns["name"]))
+        t.category_ids = _int_column(columns["category_id"])
+        t.supplier_ids = _int_column(columns["supplier_id"])
+        t.prices_kop = prices_to_kop(columns["price"])
+        t.quantities = _int_column(columns["quantity"])
+        created = columns.get("created_at")
+        t.created_at = list(map(intern, created)) if created is not None else [""] * len(t.ids)
+        return t
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "ProductColumns":
+        """Построить таблицу из списка словарей (формат csv_db.load_table)."""
+        t = cls()
+        for r in rows:
+            t.append(r)
+        return t
+
+    def append(self, row: Dict[str, Any]) -> None:
+        self.ids.append(int(row["id"]))
+        self.names.append(sys.intern(str(row["name"])))
+        self.category_ids.append(int(row["category_id"]))
+        self.supplier_ids.append(int(row["supplier_id"]))
+        self.prices_kop.append(price_to_kop(row["price"]))
+        self.quantities.append(int(row["quantity"]))
+        self.created_at.append(sys.intern(str(row.get("created_at", ""))))
+        self._pos_by_id = None
+
+    def copy(self) -> "ProductColumns":
+        t = ProductColumns()
+        for attr in ("ids", "category_ids", "supplier_ids", "quantities", "prices_kop"):
+            setattr(t, attr, array("q", getattr(self, attr)))
+        t.names = list(self.names)
+        t.created_at = list(self.created_at)
+        return t
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[ProductRow]:
+        return (ProductRow(self, i) for i in range(len(self.ids)))
+
+    def __getitem__(self, pos: int) -> ProductRow:
+        if pos < 0:
+            pos += len(self.ids)
+        if not 0 <= pos < len(self.ids):
+            raise IndexError(pos)
+        return ProductRow(self, pos)
+
+    def position(self, product_id: int) -> Optional[int]:
+        """Позиция строки по id: бинарный поиск, если id возрастают (обычный случай)."""
+        ids = self.ids
+        i = bisect_left(ids, product_id)
+        if i < len(ids) and ids[i] == product_id:
+            return i
+        if self._pos_by_id is None:
+            self._pos_by_id = {v: n for n, v in enumerate(ids)}
+        return self._pos_by_id.get(product_id)
+
+    def row_by_id(self, product_id: int) -> Optional[ProductRow]:
+        i = self.position(product_id)
+        return None if i is None else ProductRow(self, i)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [dict(r) for r in self]
+
+    def stock_by_category(self) -> Dict[int, Tuple[int, int, int]]:
+        """Агрегация по category_id: {id: (кол-во товаров, суммарный остаток, стоимость в копейках)}."""
+        return aggregates.stock_by_category(self.category_ids, self.quantities, self.prices_kop)
@@ -9,3 +9,19 @@ PROJECT_DIR = Path(__file__).resolve().parent
 DATA_DIR = PROJECT_DIR / "data"
 BACKUP_DIR = PROJECT_DIR / "backups"
 REPORTS_DIR = PROJECT_DIR / "reports"
+
+# Движок хранения: "csv" (файлы data/*.csv) или "sqlite" (см. sqlite_db.py)
+STORAGE_BACKEND = "csv"
+SQLITE_PATH = DATA_DIR / "products.db"
+# Хранить products в памяти по столбцам (columnar.ProductColumns) — меньше памяти на больших каталогах
+COLUMNAR_PRODUCTS = False
+# Журнал изменений для восстановления на момент времени (вне data/, см. csv_changelog.py)
+CHANGELOG_DIR = PROJECT_DIR / "changelog"
+
+# Резервное копирование по расписанию (backup_daemon.py).
+# Расписание: "every 30m" / "every 6h" / "every 1d" или cron из пяти полей
+# «минуты часы дни месяцы дни_недели» (*, */n, a-b, a,b), например "0 */4 * * *"
+BACKUP_SCHEDULE = "0 * * * *"
+BACKUP_RATE_MB = 20      # ограничение скорости чтения data/ при копии, МБ/с (0 — без ограничения)
+BACKUP_KEEP_LAST = 24    # хранить столько последних копий
+BACKUP_KEEP_DAILY = 14   # и самую позднюю копию каждого дня за столько дней
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал изменений для восстановления на момент времени (см. restore_db --until).
+Каждая операция записи csv_db дописывает одну строку «время\tJSON-список
+событий» в файл дня ГГГГ-ММ-ДД.log вне data/. События — итог операции,
+а не вызов функции: [таблица, "insert", строка], [таблица, "update", {id, поля}],
+["products", "stock", [[id товара, изменение остатка], ...]], [таблица, "replace",
+все строки], ["*", "restore", {...}] — data/ восстановлена из копии.
+Дозапись входит в операцию журнала csv_journal: при откате операции строка
+отрезается. Копия (backup_db) запоминает позицию журнала — с неё начинается
+повтор изменений поверх копии. Повтор читает файлы потоком и разбирает только
+строки до нужного момента (время в начале строки сравнивается как текст).
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+# Событие: (таблица, операция, данные)
+Event = Tuple[str, str, Any]
+# Позиция журнала: [имя файла дня, смещение]; "" — журнала ещё нет
+Position = List[Any]
+
+_TS_LEN = len("2025-02-16T12:00:00.000000")
+
+
+def timestamp(moment: Optional[datetime] = None) -> str:
+    return (moment or datetime.now()).isoformat(timespec="microseconds")
+
+
+def _segment(ts: str) -> str:
+    return ts[:10] + ".log"
+
+
+def _segments(directory: Path) -> List[str]:
+    return sorted(p.name for p in directory.glob("????-??-??.log"))
+
+
+def segment_path(directory: Path, ts: str) -> Path:
+    """Файл журнала, в который пишется операция со временем ts."""
+    return directory / _segment(ts)
+
+
+def encode(ts: str, events: List[Event]) -> bytes:
+    """Строка журнала одной операции (Decimal и прочие нечисловые значения — строкой)."""
+    return (ts + "\t" + json.dumps(events, ensure_ascii=False, separators=(",", ":"), default=str)
+            + "\n").encode("utf-8")
+
+
+def append(path: Path, line: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def position(directory: Path) -> Position:
+    """Текущий конец журнала (копия данных соответствует этой позиции)."""
+    segments = _segments(directory)
+    if not segments:
+        return ["", 0]
+    return [segments[-1], (directory / segments[-1]).stat().st_size]
+
+
+def prune(directory: Path, start: Position) -> List[Path]:
+    """Удалить файлы журнала до позиции start (изменения, уже вошедшие во все копии)."""
+    segment = start[0]
+    removed = []
+    for name in _segments(directory):
+        if name < segment:
+            (directory / name).unlink()
+            removed.append(directory / name)
+    return removed
+
+
+def read(directory: Path, start: Position, until: Optional[str] = None) -> Iterator[Tuple[str, List[Event]]]:
+    """
+    Операции журнала после позиции start по порядку записи: (время, события).
+    until — время ISO (timestamp()): чтение останавливается на первой более поздней
+    операции. Недописанная последняя строка (сбой при записи) пропускается.
+    """
+    segment, offset = start
+    limit = until.encode("ascii") if until is not None else None
+    segments = _segments(directory)
+    if segment and (segment not in segments or (directory / segment).stat().st_size < offset):
+        raise ValueError(f"Журнал изменений с позиции копии ({segment}) удалён или обрезан")
+    for name in segments:
+        if name < segment:
+            continue
+        if limit is not None and name[:10].encode("ascii") > limit[:10]:
+            return
+        with open(directory / name, "rb") as f:
+            if name == segment:
+                f.seek(offset)
+            for line in f:
+                if limit is not None and line[:_TS_LEN] > limit:
+                    return
+                if not line.endswith(b"\n"):
+                    return
+                yield line[:_TS_LEN].decode("ascii"), json.loads(line[_TS_LEN + 1:])
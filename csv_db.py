@@ -5,12 +5,35 @@
 """
 
 import csv
+import functools
+import gc
+import heapq
+import io
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Any, Optional
+from itertools import compress, islice, repeat
+from operator import itemgetter
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Sequence, Tuple
 
-from config import DATA_DIR
+import aggregates
+import csv_changelog
+import csv_index
+import csv_journal
+import csv_lock
+import csv_partitions
+import csv_snapshot
+import text_index
+from columnar import ProductColumns, price_to_kop
+from config import DATA_DIR, STORAGE_BACKEND, COLUMNAR_PRODUCTS, CHANGELOG_DIR
 
 # Роли (разграничение прав по ТЗ)
 READER = "reader"
@@ -39,11 +62,116 @@ def _require_manager() -> None:
 # Имена таблиц и файлов
 TABLES = ("categories", "suppliers", "products", "deliveries")
 
+# --- Движок хранения ---
+# По умолчанию работа идёт с CSV-файлами (код этого модуля). Если выбран другой
+# движок (например sqlite_db), публичные функции перенаправляются в него.
+BACKENDS = {"csv": None, "sqlite": "sqlite_db"}
+_engine = None
+
+
+def set_backend(name: str) -> None:
+    """Выбрать движок хранения: "csv" или "sqlite"."""
+    global _engine
+    if name not in BACKENDS:
+        raise ValueError(f"Движок должен быть одним из: {', '.join(BACKENDS)}")
+    module = BACKENDS[name]
+    _engine = __import__(module) if module else None
+
+
+def get_backend() -> str:
+    return "csv" if _engine is None else next(k for k, v in BACKENDS.items() if v == _engine.__name__)
+
+
+def _dispatch(func):
+    """Выполнить функцию в активном движке хранения (если это не CSV)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _engine is not None:
+            return getattr(_engine, func.__name__)(*args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
 
 def _table_path(name: str) -> Path:
     return DATA_DIR / f"{name}.csv"
 
 
+# --- Секции по месяцам (см. csv_partitions) ---
+# Таблица deliveries хранится в data/deliveries/ГГГГ-ММ.csv. Часть таблицы —
+# это отдельный файл: "products" → products.csv, "deliveries.2025-02" →
+# deliveries/2025-02.csv. Индексы на диске строятся для каждой части.
+
+PARTITIONED = ("deliveries",)
+_migrating = False
+
+
+def _partition_dir(name: str) -> Path:
+    return DATA_DIR / name
+
+
+def _part_path(part: str) -> Path:
+    name, _, key = part.partition(".")
+    return _partition_dir(name) / f"{key}.csv" if key else _table_path(name)
+
+
+def _part_table(part: str) -> str:
+    return part.partition(".")[0]
+
+
+def _migrate_legacy(name: str) -> None:
+    """
+    Разложить по секциям data/<name>.csv (старый формат или файл из старой резервной копии).
+    Выполняется в _recover под исключительной блокировкой — до любого чтения таблиц.
+    """
+    global _migrating
+    legacy = _table_path(name)
+    if _migrating or _journal is not None or not legacy.exists():
+        return
+    _migrating = True
+    try:
+        with _transaction():
+            _write_table(name, _read_csv(name, legacy))
+            _remove_file(legacy)
+    finally:
+        _migrating = False
+
+
+def _parts(name: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+           row_id: Optional[int] = None) -> List[str]:
+    """Части таблицы; для секционированной — только пересекающиеся с периодом дат и содержащие row_id."""
+    if name not in PARTITIONED:
+        return [name]
+    directory = _partition_dir(name)
+    if date_from is None and date_to is None and row_id is None:
+        return [f"{name}.{key}" for key in csv_partitions.list_keys(directory)]
+    with _lock():
+        manifest = csv_partitions.manifest(directory, _file_signature)
+    result = []
+    for key, entry in manifest.items():
+        if not csv_partitions.overlaps(entry, date_from, date_to):
+            continue
+        if row_id is not None and not entry["min_id"] <= row_id <= entry["max_id"]:
+            continue
+        result.append(f"{name}.{key}")
+    return result
+
+
+def _manifest_appended(name: str, key: str, before: Optional[Tuple[int, ...]], rows: List[Dict[str, Any]]) -> None:
+    """Учесть дописанные строки в манифесте секций (если запись секции была актуальна)."""
+    directory = _partition_dir(name)
+    manifest = csv_partitions.read_manifest(directory)
+    entry = manifest.get(key)
+    if before is None:
+        entry = csv_partitions.new_entry()
+    elif entry is None or tuple(entry["sig"]) != before:
+        return  # запись будет пересчитана при чтении манифеста
+    for row in rows:
+        csv_partitions.note_row(entry, row["id"], row["delivery_date"])
+    entry["sig"] = list(_file_signature(_part_path(f"{name}.{key}")) or ())
+    manifest[key] = entry
+    csv_partitions.write_manifest(directory, manifest)
+
+
 def _cast_row(table: str, row: Dict[str, str]) -> Dict[str, Any]:
     """Приведение типов при чтении CSV."""
     if table == "categories":
@@ -72,29 +200,967 @@ def _cast_row(table: str, row: Dict[str, str]) -> Dict[str, Any]:
     return dict(row)
 
 
-def load_table(name: str) -> List[Dict[str, Any]]:
-    """Загрузить таблицу из CSV. Возвращает список словарей."""
+# Быстрое чтение: csv.reader вместо DictReader, заголовок разбирается один раз —
+# для него составляется план (поле, позиция столбца, приведение типа), и строка
+# собирается по плану (как _cast_row, но без промежуточного словаря и поиска
+# полей по имени на каждой строке).
+
+_FIELD_TYPES = {
+    "categories": (("id", "int"), ("name", "str"), ("description", "str")),
+    "suppliers": (("id", "int"), ("name", "str"), ("contact", "str"), ("address", "str")),
+    "products": (("id", "int"), ("name", "str"), ("category_id", "int"), ("supplier_id", "int"),
+                 ("price", "Decimal"), ("quantity", "int"), ("created_at", "str")),
+    "deliveries": (("id", "int"), ("product_id", "int"), ("supplier_id", "int"), ("quantity", "int"),
+                   ("delivery_date", "str"), ("created_at", "str")),
+}
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {"int": int, "str": str, "Decimal": Decimal}
+_row_readers: Dict[Tuple[str, Tuple[str, ...]], Callable[[List[str]], Dict[str, Any]]] = {}
+
+
+def _missing(value: str) -> str:
+    return ""  # столбца нет в заголовке: как row.get(field, "") в _cast_row
+
+
+def _row_reader(table: str, header: Sequence[str]) -> Callable[[List[str]], Dict[str, Any]]:
+    """Функция «поля записи CSV → строка таблицы» для данного заголовка (кэшируется)."""
+    key = (table, tuple(header))
+    read = _row_readers.get(key)
+    if read is not None:
+        return read
+    if table not in _FIELD_TYPES:
+        fields = tuple(header)
+        read = lambda rec: dict(zip(fields, rec))
+    else:
+        pos = {name: i for i, name in reversed(list(enumerate(header)))}
+        plan = tuple((field, pos[field], _CONVERTERS[kind]) if field in pos else (field, 0, _missing)
+                     for field, kind in _FIELD_TYPES[table])
+
+        def read(rec: List[str]) -> Dict[str, Any]:
+            return {field: convert(rec[i]) for field, i, convert in plan}
+    _row_readers[key] = read
+    return read
+
+
+def _cast_records(table: str, header: Sequence[str], records: Iterable[List[str]]) -> List[Dict[str, Any]]:
+    """Строки таблицы из записей csv.reader (пустые строки пропускаются, короткие дополняются)."""
+    read = _row_reader(table, header)
+    width = len(header)
+    rows = []
+    append = rows.append
+    for rec in records:
+        if len(rec) < width:
+            if not rec:
+                continue
+            rec = rec + [""] * (width - len(rec))
+        append(read(rec))
+    return rows
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Сборщик мусора выключен на время разбора таблицы: миллионы новых списков
+    и словарей иначе запускают всё новые полные проходы по уже прочитанным строкам.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _read_csv(name: str, path: Path) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8", newline="") as f, _gc_paused():
+        reader = csv.reader(f)
+        return _cast_records(name, next(reader, []), reader)
+
+
+# --- Двоичные снимки частей (csv_snapshot) ---
+# После записи части рядом с индексом сохраняется снимок её строк по столбцам;
+# при чтении действительный снимок заменяет разбор CSV. Снимок — производные
+# данные: он не входит в журнал транзакции, а откат или дозапись CSV меняют
+# сигнатуру файла, и снимок перестаёт совпадать (читается CSV, снимок обновляется).
+
+def _snapshot_columns(name: str, rows: Sequence[Dict[str, Any]]) -> Optional[csv_snapshot.Columns]:
+    """Столбцы снимка из строк таблицы (Decimal — строкой, без потери записи числа)."""
+    types = _FIELD_TYPES.get(name)
+    if types is None or not rows:
+        return None
+    columns: csv_snapshot.Columns = {}
+    for field, kind in types:
+        values = list(map(itemgetter(field), rows))
+        if kind == "int":
+            columns[field] = (csv_snapshot.INT, values)
+        else:
+            columns[field] = (csv_snapshot.STR, values if kind == "str" else list(map(str, values)))
+    return columns
+
+
+def _save_snapshot(part: str, rows: Sequence[Dict[str, Any]], sig: Optional[Tuple[int, ...]]) -> None:
+    """Записать снимок части для CSV с сигнатурой sig (ошибка записи снимка не мешает работе с CSV)."""
+    columns = _snapshot_columns(_part_table(part), rows)
+    try:
+        if columns is None or not csv_snapshot.save(_meta_path(""), part, sig, columns):
+            csv_snapshot.remove(_meta_path(""), part)
+    except (OSError, ValueError, OverflowError):
+        pass
+
+
+def _load_snapshot(part: str, sig: Optional[Tuple[int, ...]]) -> Optional[Dict[str, Sequence[Any]]]:
+    """Столбцы действительного снимка части (None — снимка нет, он устарел или повреждён)."""
+    fields = _FIELD_TYPES.get(_part_table(part))
+    if fields is None:
+        return None
+    try:
+        columns = csv_snapshot.load(_meta_path(""), part, sig)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if columns is None or set(columns) != {f for f, _ in fields}:
+        return None
+    return columns
+
+
+def _column_rows(name: str, columns: csv_snapshot.Columns) -> Iterator[Dict[str, Any]]:
+    """
+    Строки таблицы из столбцов снимка (лениво): целые и строки уже готовы,
+    Decimal восстанавливается из текста сразу по всему столбцу.
+    """
+    fields = tuple(field for field, _ in _FIELD_TYPES[name])
+    values = [map(Decimal, columns[field]) if kind == "Decimal" else columns[field]
+              for field, kind in _FIELD_TYPES[name]]
+    return map(dict, map(zip, repeat(fields), zip(*values)))
+
+
+def _read_part(part: str) -> List[Dict[str, Any]]:
+    """Строки части таблицы: из снимка, если он действителен, иначе из CSV (со снимком на будущее)."""
+    name = _part_table(part)
+    path = _part_path(part)
+    sig = _file_signature(path)
+    columns = _load_snapshot(part, sig)
+    if columns is not None:
+        with _gc_paused():
+            return list(_column_rows(name, columns))
+    rows = _read_csv(name, path)
+    if name in _FIELD_TYPES:
+        _save_snapshot(part, rows, sig)
+    return rows
+
+
+def _read_table(name: str) -> List[Dict[str, Any]]:
+    """Прочитать таблицу с диска (для products — с учётом журнала остатков)."""
+    if name in PARTITIONED:
+        # Строки внутри секции идут по возрастанию id: list.sort сливает эти серии
+        # (в C, заметно быстрее heapq.merge на миллионах строк)
+        rows = [r for p in _parts(name) for r in _read_part(p)]
+        rows.sort(key=itemgetter("id"))
+        return rows
     path = _table_path(name)
+    if name == "products" and _columnar:
+        columns = _load_snapshot(name, _file_signature(path))
+        with _gc_paused():
+            if columns is not None:
+                rows = ProductColumns.from_columns(columns)
+            else:
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    reader = csv.reader(f)
+                    rows = ProductColumns.from_records(next(reader, []), reader)
+    else:
+        rows = _read_part(name)
+    if name == "products":
+        deltas = _read_stock_deltas()
+        find = _row_finder(rows, len(deltas))
+        for pid, d in deltas.items():
+            p = find(pid)
+            if p is not None:
+                p["quantity"] += d
+    return rows
+
+
+def _find_by_id(rows, row_id: int):
+    """Строка по id в списке строк или в ProductColumns (там — бинарным поиском)."""
+    if isinstance(rows, ProductColumns):
+        return rows.row_by_id(row_id)
+    for r in rows:
+        if r["id"] == row_id:
+            return r
+    return None
+
+
+def _row_finder(rows, lookups: int) -> Callable[[int], Optional[Dict[str, Any]]]:
+    """Поиск строк по id для нескольких id подряд: словарь по id строится один раз, а не проход на каждый id."""
+    if lookups > 1 and not isinstance(rows, ProductColumns):
+        return build_index_by_id(rows).get
+    return functools.partial(_find_by_id, rows)
+
+
+# Столбцовое хранение products в кэше (см. columnar.py)
+_columnar: bool = COLUMNAR_PRODUCTS
+
+
+def set_columnar(enabled: bool) -> None:
+    """Включить/выключить столбцовое представление products в памяти."""
+    global _columnar
+    if enabled != _columnar:
+        _columnar = enabled
+        _table_cache.pop("products", None)
+
+
+# --- Атомарная запись и журнал операций (см. csv_journal) ---
+# Файлы таблиц заменяются целиком через временный файл (fsync + os.replace),
+# дозаписи и замены внутри операции отмечаются в журнале: операция из нескольких
+# файлов (поставка + остаток) либо фиксируется целиком, либо откатывается —
+# при исключении сразу, при сбое процесса — при следующем запуске.
+
+# Между процессами (см. csv_lock) операция записи держит исключительную
+# блокировку data/_meta/lock, чтение файлов с диска — разделяемую.
+
+# Восстановление после сбоя и перенос старого формата выполняются не при импорте,
+# а при первом обращении к каталогу данных (первая блокировка) и перед каждой записью.
+
+_journal: Optional[csv_journal.Journal] = None
+_locks: Dict[Path, csv_lock.DirLock] = {}
+_prepared: Optional[Path] = None
+_prepare_mutex = threading.Lock()
+_preparing: Optional[int] = None  # поток, выполняющий _prepare
+
+
+def _lock(exclusive: bool = False):
+    """
+    Блокировка каталога данных: with _lock(): ... (разделяемая) или _lock(exclusive=True).
+    Читать из несуществующего каталога нечего: _meta/ и файл блокировки не создаются.
+    """
+    if not exclusive and not DATA_DIR.exists():
+        return nullcontext()
+    _prepare()
+    path = _meta_path("lock")
+    lock = _locks.get(path)
+    if lock is None:
+        lock = _locks[path] = csv_lock.DirLock(path)
+    return lock.hold(exclusive)
+
+
+def _lock_held() -> Optional[str]:
+    """Режим блокировки каталога данных у текущего потока (csv_lock.SHARED, EXCLUSIVE или None)."""
+    lock = _locks.get(_meta_path("lock"))
+    return lock.held() if lock is not None else None
+
+
+def _prepare() -> None:
+    """Один раз для каталога данных: _recover до первого чтения или записи (если каталог есть)."""
+    global _prepared, _preparing
+    if _prepared == DATA_DIR or _preparing == threading.get_ident():
+        return
+    with _prepare_mutex:
+        if _prepared == DATA_DIR or not DATA_DIR.exists():
+            return
+        _preparing = threading.get_ident()
+        try:
+            _recover()
+        finally:
+            _preparing = None
+        _prepared = DATA_DIR
+
+
+def _recover() -> bool:
+    """
+    Откатить операцию, прерванную сбоем (если журнал остался на диске), и разложить
+    по секциям таблицы в старом формате. Вызывается при первом обращении к каталогу
+    данных и перед каждой записью.
+    """
+    with _lock(exclusive=True):
+        recovered = csv_journal.recover(DATA_DIR, _meta_path("journal"))
+        for name in PARTITIONED:
+            _migrate_legacy(name)
+        return recovered
+
+
+@contextmanager
+def _transaction():
+    """Операция над несколькими файлами. Вложенные вызовы входят во внешнюю операцию."""
+    global _journal
+    if _journal is not None:
+        yield _journal
+        return
+    with _lock(exclusive=True):
+        _recover()
+        before = {name: _table_signature(name) for name in TABLES}
+        journal = csv_journal.Journal(DATA_DIR, _meta_path("journal"))
+        _journal = journal
+        try:
+            yield journal
+            _write_changelog(journal)
+        except BaseException:
+            _journal = None
+            _pending_changes.clear()
+            _pending_log.clear()
+            journal.rollback()
+            raise
+        _journal = None
+        # Версии повышаются до фиксации: после сбоя лишнее повышение безвредно
+        _bump_versions([name for name in TABLES if _table_signature(name) != before[name]])
+        journal.commit()
+        _search_index_changed(before["products"], _pending_changes)
+    # Подписчики узнают об изменениях после фиксации и снятия блокировки
+    changes = list(_pending_changes)
+    _pending_changes.clear()
+    _notify(changes)
+
+
+# --- Версии таблиц ---
+# Счётчик изменений каждой таблицы (data/_meta/versions.json), повышается при
+# каждой операции записи через csv_db. Другой процесс сравнивает версию с
+# запомненной и перечитывает только изменившиеся таблицы.
+
+def _versions_path() -> Path:
+    return _meta_path("versions.json")
+
+
+def _bump_versions(names: List[str]) -> None:
+    if not names:
+        return
+    versions = _read_json(_versions_path()) or {}
+    for name in names:
+        versions[name] = versions.get(name, 0) + 1
+    _write_json(_versions_path(), versions)
+
+
+def table_version(name: str) -> int:
+    """Номер версии таблицы (растёт при каждой записи через csv_db; для движка CSV)."""
+    return (_read_json(_versions_path()) or {}).get(name, 0)
+
+
+def table_versions() -> Dict[str, int]:
+    """Версии всех таблиц одним чтением."""
+    versions = _read_json(_versions_path()) or {}
+    return {name: versions.get(name, 0) for name in TABLES}
+
+
+# --- Уведомления об изменениях ---
+# Функции записи сообщают, какие строки изменились: (таблица, операция, id, поля).
+# Операция "insert" или "update" (поля — изменённые столбцы, None — неизвестно),
+# "replace" — таблица записана целиком (id = None). Подписчики (GUI) получают
+# список изменений операции после её фиксации и обновляют только затронутые строки.
+
+Change = Tuple[str, str, Optional[int], Optional[Tuple[str, ...]]]
+_subscribers: List[Callable[[List[Change]], None]] = []
+_pending_changes: List[Change] = []
+
+
+def subscribe(callback: Callable[[List[Change]], None]) -> Callable[[], None]:
+    """Подписаться на изменения (для любого движка хранения). Возвращает функцию отписки."""
+    _subscribers.append(callback)
+    return lambda: _subscribers.remove(callback) if callback in _subscribers else None
+
+
+def _changed(table: str, op: str, row_id: Optional[int] = None, fields: Optional[Iterable[str]] = None) -> None:
+    change = (table, op, row_id, tuple(fields) if fields is not None else None)
+    if _journal is None:
+        _notify([change])
+    else:
+        _pending_changes.append(change)
+
+
+def _notify(changes: List[Change]) -> None:
+    if not changes:
+        return
+    for callback in list(_subscribers):
+        callback(changes)
+
+
+# --- Журнал изменений (см. csv_changelog) ---
+# Функции записи сообщают итог операции событиями; при фиксации операции они
+# дописываются одной строкой в журнал изменений — в той же операции журнала
+# csv_journal, что и файлы данных. Журнал хранится вне data/ (восстановление
+# data/ из копии его не затирает); для другого каталога данных (стресс-проверка,
+# временные копии) — рядом с этим каталогом.
+
+_DEFAULT_DATA_DIR = DATA_DIR
+_pending_log: List[csv_changelog.Event] = []
+
+
+def changelog_dir() -> Path:
+    """Каталог журнала изменений для текущего каталога данных."""
+    return CHANGELOG_DIR if DATA_DIR == _DEFAULT_DATA_DIR else DATA_DIR.parent / CHANGELOG_DIR.name
+
+
+def _log_change(table: str, op: str, data: Any) -> None:
+    _pending_log.append((table, op, data))
+
+
+def _write_changelog(journal: csv_journal.Journal) -> None:
+    if not _pending_log:
+        return
+    events = list(_pending_log)
+    _pending_log.clear()
+    ts = csv_changelog.timestamp()
+    path = csv_changelog.segment_path(changelog_dir(), ts)
+    journal.appending(path)
+    csv_changelog.append(path, csv_changelog.encode(ts, events))
+
+
+def _atomic(func):
+    """Выполнить функцию записи как одну операцию журнала."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _transaction():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _replace_file(path: Path, write: Callable[[Any], None]) -> None:
+    """Записать файл целиком: во временный файл, fsync, затем os.replace на место прежнего."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    if _journal is not None:
+        _journal.replacing(path)
+    os.replace(tmp, path)
+    csv_journal.fsync_dir(path.parent)
+
+
+def _remove_file(path: Path) -> None:
     if not path.exists():
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return [_cast_row(name, row) for row in reader]
+        return
+    if _journal is not None:
+        _journal.replacing(path)
+    path.unlink()
+
+
+def _will_append(path: Path) -> None:
+    if _journal is not None:
+        _journal.appending(path)
+
+
+# --- Служебные файлы: счётчики id, журнал изменений остатков ---
+
+def _meta_path(filename: str) -> Path:
+    return DATA_DIR / "_meta" / filename
+
+
+def _write_json(path: Path, data: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> Any:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# Журнал остатков: поставки не переписывают products.csv, а дописывают строку
+# "product_id,delta". Первая строка журнала — сигнатура products.csv, к которой
+# он относится: после перезаписи или подмены products.csv журнал игнорируется.
+STOCK_LOG = "_meta/products_stock.log"  # относительно DATA_DIR
+STOCK_LOG_COMPACT_BYTES = 256 * 1024
+
+
+def _stock_log_path() -> Path:
+    return DATA_DIR / STOCK_LOG
+
+
+def _signature_line(sig: Optional[Tuple[int, ...]]) -> str:
+    return "#" + ",".join(str(x) for x in (sig or ()))
+
+
+def _read_stock_deltas() -> Dict[int, int]:
+    """Суммарные изменения остатков из журнала (если журнал относится к текущему products.csv)."""
+    try:
+        f = open(_stock_log_path(), "r", encoding="utf-8")
+    except FileNotFoundError:
+        return {}
+    deltas: Dict[int, int] = {}
+    with f:
+        header = f.readline().rstrip("\n")
+        if header != _signature_line(_file_signature(_table_path("products"))):
+            return {}
+        for line in f:
+            pid, _, delta = line.rstrip("\n").partition(",")
+            if not delta:
+                continue  # недописанная строка
+            deltas[int(pid)] = deltas.get(int(pid), 0) + int(delta)
+    return deltas
+
+
+def _append_stock_delta(product_id: int, delta: int) -> None:
+    """Изменить остаток товара дописыванием строки в журнал (без перезаписи products.csv)."""
+    _append_stock_deltas({product_id: delta})
+
+
+def _append_stock_deltas(deltas: Dict[int, int]) -> None:
+    """Изменить остатки товаров одной дозаписью в журнал остатков."""
+    deltas = {pid: d for pid, d in deltas.items() if d}
+    if not deltas:
+        return
+    path = _stock_log_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    before = _table_signature("products")
+    expected = _signature_line(_file_signature(_table_path("products")))
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            valid = f.readline().rstrip("\n") == expected
+    except FileNotFoundError:
+        valid = False
+    lines = "".join(f"{pid},{d}\n" for pid, d in deltas.items())
+    if valid:
+        _will_append(path)
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        _replace_file(path, lambda f: f.write((expected + "\n" + lines).encode("utf-8")))
+    # Кэш products обновляется на месте, если он соответствовал состоянию до записи
+    entry = _table_cache.get("products")
+    if entry is not None and entry[0] == before:
+        find = _row_finder(entry[1], len(deltas))
+        for pid, d in deltas.items():
+            p = find(pid)
+            if p is not None:
+                p["quantity"] += d
+        _table_cache["products"] = (_table_signature("products"), entry[1])
+    if path.stat().st_size > STOCK_LOG_COMPACT_BYTES:
+        _compact_stock_log()
+
+
+def _compact_stock_log() -> None:
+    """Перенести накопленные изменения остатков в products.csv и очистить журнал."""
+    with _transaction():
+        _write_table("products", load_table("products"))
+        _changed("products", "replace")
+
+
+def _sequences_path() -> Path:
+    return _meta_path("sequences.json")
+
+
+def _store_sequence(name: str, max_id: int) -> None:
+    """Запомнить максимальный id таблицы вместе с сигнатурой её файла."""
+    sig = _storage_signature(name)
+    if sig is None:
+        return
+    seqs = _read_json(_sequences_path()) or {}
+    seqs[name] = {"max_id": max_id, "sig": list(sig)}
+    _write_json(_sequences_path(), seqs)
+
+
+# --- Кэш таблиц на время сессии (общий для процесса) ---
+# Ключ — имя таблицы, значение — (сигнатура, разобранные строки).
+# Сигнатура (mtime_ns, size, inode файла; для products ещё и размер журнала
+# остатков) меняется при любой записи, поэтому повторное чтение с диска
+# происходит только после изменения данных.
+
+_table_cache: Dict[str, Tuple[Tuple[int, ...], List[Dict[str, Any]]]] = {}
+_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0, "reloads": 0}
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _storage_signature(name: str) -> Optional[Tuple[int, ...]]:
+    """Сигнатура файла таблицы; для секционированной — всех файлов секций подряд."""
+    if name not in PARTITIONED:
+        return _file_signature(_table_path(name))
+    sig: Tuple[int, ...] = ()
+    for part in _parts(name):
+        sig += _file_signature(_part_path(part)) or ()
+    return sig or None
+
+
+def _table_signature(name: str) -> Optional[Tuple[int, ...]]:
+    sig = _storage_signature(name)
+    if sig is None or name != "products":
+        return sig
+    log_sig = _file_signature(_stock_log_path())
+    return sig + (log_sig[1] if log_sig else 0,)
+
 
+def _cached_rows(name: str) -> List[Dict[str, Any]]:
+    """Строки таблицы из кэша (общие объекты — только для чтения)."""
+    # Сигнатура снимается до чтения: если файл изменится во время чтения,
+    # следующий вызов увидит расхождение и перечитает его.
+    sig = _table_signature(name)
+    entry = _table_cache.get(name)
+    if sig is not None and entry is not None and entry[0] == sig:
+        _cache_stats["hits"] += 1
+        return entry[1]
+    with _lock():
+        # Под блокировкой файлы не дописываются: снимок сигнатуры и чтение согласованы
+        sig = _table_signature(name)
+        if sig is None:
+            _table_cache.pop(name, None)
+            return []
+        _cache_stats["misses" if entry is None else "reloads"] += 1
+        rows = _read_table(name)
+    _table_cache[name] = (sig, rows)
+    return rows
 
+
+def cache_stats() -> Dict[str, int]:
+    """Счётчики кэша таблиц: hits (из памяти), misses (первая загрузка), reloads (файл изменился)."""
+    return dict(_cache_stats)
+
+
+def clear_cache() -> None:
+    """Сбросить кэш таблиц и счётчики."""
+    _table_cache.clear()
+    for k in _cache_stats:
+        _cache_stats[k] = 0
+
+
+def set_data_dir(path: Path) -> None:
+    """
+    Работать с другим каталогом данных (например с временной копией для замеров).
+    Действует на csv_db; все кэши сбрасываются, журнал каталога проверяется заново.
+    """
+    global DATA_DIR, _date_index_cache, _prepared
+    DATA_DIR = Path(path)
+    _prepared = None
+    clear_cache()
+    _index_cache.clear()
+    _column_cache.clear()
+    _view_order_cache.clear()
+    _filter_cache.clear()
+    _selection_cache.clear()
+    _date_index_cache = None
+    _prepare()
+
+
+@_dispatch
+def load_table(name: str, columnar: bool = False) -> List[Dict[str, Any]]:
+    """
+    Загрузить таблицу из CSV (через кэш). Возвращает список словарей-копий.
+    Для products при columnar=True возвращается копия ProductColumns.
+    """
+    rows = _cached_rows(name)
+    if columnar and name == "products":
+        return rows.copy() if isinstance(rows, ProductColumns) else ProductColumns.from_rows(rows)
+    return [dict(r) for r in rows]
+
+
+@_dispatch
+@_atomic
 def save_table(name: str, rows: List[Dict[str, Any]]) -> None:
     """Сохранить таблицу в CSV. Требуется роль manager."""
     _require_manager()
+    _write_table(name, rows)
+    _log_change(name, "replace", rows)
+    _changed(name, "replace")
+
+
+def _write_table(name: str, rows: List[Dict[str, Any]]) -> None:
+    if name in PARTITIONED:
+        _write_partitions(name, rows)
+        return
     path = _table_path(name)
     path.parent.mkdir(parents=True, exist_ok=True)
     if not rows:
         return
+    cached = _write_part(name, rows)
+    if name == "products":
+        # Остатки уже учтены в rows — журнал изменений больше не нужен
+        _remove_file(_stock_log_path())
+    _store_sequence(name, max(int(r["id"]) for r in cached))
+    if name == "products" and _columnar:
+        cached = ProductColumns.from_rows(cached)
+    # Кэш сразу получает записанное состояние — без повторного чтения файла
+    sig = _table_signature(name)
+    if sig is not None:
+        _table_cache[name] = (sig, cached)
+
+
+def _take_encoded(buf: io.StringIO) -> bytes:
+    """Содержимое буфера записи CSV в UTF-8; буфер очищается для следующей строки."""
+    data = buf.getvalue().encode("utf-8")
+    buf.seek(0)
+    buf.truncate()
+    return data
+
+
+def _write_part(part: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Записать файл части таблицы и её индекс. Возвращает строки с приведёнными типами."""
+    name = _part_table(part)
+    path = _part_path(part)
     fieldnames = list(rows[0].keys())
-    with open(path, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+    keys = csv_index.INDEXED_KEYS.get(name)
+    idx = csv_index.TableIndex(fieldnames, keys) if keys else None
+    cached = []
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames)
+
+    def write(f) -> None:
+        writer.writeheader()
+        chunk = [_take_encoded(buf)]
+        offset = len(chunk[0])
+        for row in rows:
+            text_row = {k: str(v) for k, v in row.items()}
+            writer.writerow(text_row)
+            line = _take_encoded(buf)
+            if idx is not None:
+                idx.add(int(text_row["id"]), offset, text_row)
+            offset += len(line)
+            chunk.append(line)
+            cached.append(_cast_row(name, text_row))
+            if len(chunk) >= 1000:
+                f.write(b"".join(chunk))
+                chunk = []
+        f.write(b"".join(chunk))
+
+    _replace_file(path, write)
+    _save_snapshot(part, cached, _file_signature(path))
+    if idx is not None:
+        idx.sig = _file_signature(path)
+        csv_index.save(idx, _meta_path(""), part)
+        _index_cache[part] = idx
+    return cached
+
+
+def _write_partitions(name: str, rows: List[Dict[str, Any]]) -> None:
+    """Переписать секции таблицы: строки раскладываются по месяцам, пустые секции удаляются."""
+    directory = _partition_dir(name)
+    directory.mkdir(parents=True, exist_ok=True)
+    groups = csv_partitions.group_rows(rows)
+    manifest = {}
+    cached = []
+    for key, group in groups.items():
+        part = f"{name}.{key}"
+        entry = csv_partitions.new_entry()
+        for r in _write_part(part, group):
+            csv_partitions.note_row(entry, r["id"], r["delivery_date"])
+            cached.append(r)
+        entry["sig"] = list(_file_signature(_part_path(part)) or ())
+        manifest[key] = entry
+    for key in csv_partitions.list_keys(directory):
+        if key not in groups:
+            _remove_file(_part_path(f"{name}.{key}"))
+            csv_snapshot.remove(_meta_path(""), f"{name}.{key}")
+    csv_partitions.write_manifest(directory, manifest)
+    # Порядок как при чтении с диска (по id)
+    cached.sort(key=lambda r: r["id"])
+    if cached:
+        _store_sequence(name, cached[-1]["id"])
+    sig = _table_signature(name)
+    if sig is None:
+        _table_cache.pop(name, None)
+    else:
+        _table_cache[name] = (sig, cached)
+
+
+def _read_header(path: Path) -> List[str]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _append_row(name: str, row: Dict[str, Any]) -> None:
+    """Дописать одну строку в конец CSV (с fsync), не перечитывая таблицу."""
+    _append_rows(name, [row])
+
+
+def _append_rows(name: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Дописать строки в конец CSV (секционированной таблицы — в файлы их секций)
+    одной записью на файл, с fsync. Возвращает строки с приведёнными типами.
+    """
+    before = _table_signature(name)
+    if name in PARTITIONED:
+        groups = {f"{name}.{k}": g for k, g in csv_partitions.group_rows(rows).items()}
+    else:
+        groups = {name: rows}
+    written = [_append_part(part, group) for part, group in groups.items()]
+    new_rows = []
+    for part, file_before, entries in written:
+        part_rows = [_cast_row(name, text_row) for _, text_row in entries]
+        _index_appended(part, file_before, entries)
+        if name in PARTITIONED:
+            _manifest_appended(name, part.partition(".")[2], file_before, part_rows)
+        new_rows.extend(part_rows)
+    if len(written) > 1:
+        new_rows.sort(key=lambda r: r["id"])
+    _cache_appended(name, before, new_rows)
+    return new_rows
+
+
+def _append_part(part: str, rows: List[Dict[str, Any]]):
+    """Дописать строки в файл части таблицы. Возвращает (часть, сигнатура до записи, [(смещение, поля)])."""
+    path = _part_path(part)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_before = _file_signature(path)
+    fieldnames = _read_header(path) if file_before and file_before[1] > 0 else []
+    new_file = not fieldnames
+    if new_file:
+        fieldnames = list(rows[0].keys())
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames)
+
+    chunks = []
+    if new_file:
         writer.writeheader()
+        chunks.append(_take_encoded(buf))
+    entries = []
+    _will_append(path)
+    with open(path, "a+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if not new_file:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                chunks.append(b"\r\n")  # последняя строка файла без перевода строки
+        offset = size + sum(len(c) for c in chunks)
         for row in rows:
-            writer.writerow({k: str(v) for k, v in row.items()})
+            text_row = {k: str(row.get(k, "")) for k in fieldnames}
+            writer.writerow(text_row)
+            line = _take_encoded(buf)
+            entries.append((offset, text_row))
+            offset += len(line)
+            chunks.append(line)
+        f.write(b"".join(chunks))
+        f.flush()
+        os.fsync(f.fileno())
+    return part, None if new_file else file_before, entries
+
+
+def _cache_appended(name: str, before: Optional[Tuple[int, ...]], new_rows: List[Dict[str, Any]]) -> None:
+    """Дополнить кэши таблицы дописанными строками (если они соответствовали состоянию до записи)."""
+    after = _table_signature(name)
+    entry = _table_cache.get(name)
+    if entry is not None and entry[0] == before:
+        entry[1].extend(new_rows)
+        _table_cache[name] = (after, entry[1])
+    if name != "deliveries":
+        return
+    _date_index_appended(before, new_rows)
+    cols_entry = _column_cache.get(name)
+    if cols_entry is not None and cols_entry[0] == before:
+        cols = cols_entry[1]
+        for r in new_rows:
+            for col, value in zip(("id", "product_id", "supplier_id", "quantity", "date"), _delivery_column_values(r)):
+                cols[col].append(value)
+        _column_cache[name] = (after, cols)
+
+
+# --- Индексы на диске (см. csv_index): смещения строк и вторичные ключи ---
+
+_index_cache: Dict[str, csv_index.TableIndex] = {}
+
+
+def _table_index(part: str) -> Optional[csv_index.TableIndex]:
+    """Индекс части таблицы, соответствующий текущему файлу (при необходимости перестраивается)."""
+    keys = csv_index.INDEXED_KEYS.get(_part_table(part))
+    if keys is None:
+        return None
+    path = _part_path(part)
+    sig = _file_signature(path)
+    if sig is None:
+        return None
+    idx = _index_cache.get(part)
+    if idx is not None and idx.sig == sig:
+        return idx
+    idx = csv_index.load(_meta_path(""), part, sig)
+    if idx is None:
+        idx = csv_index.build(path, keys, sig)
+        csv_index.save(idx, _meta_path(""), part)
+    _index_cache[part] = idx
+    return idx
+
+
+def _index_appended(part: str, before: Optional[Tuple[int, ...]], entries: List[Tuple[int, Dict[str, str]]]) -> None:
+    """Дополнить индекс строками (смещение, поля), дописанными в конец файла (если индекс был актуален)."""
+    if _part_table(part) not in csv_index.INDEXED_KEYS or before is None:
+        return
+    idx = _index_cache.get(part)
+    if idx is None or idx.sig != before:
+        idx = csv_index.load(_meta_path(""), part, before)
+        if idx is None:
+            return  # индекс будет перестроен при следующем обращении
+        _index_cache[part] = idx
+    csv_index.append(idx, _meta_path(""), part, [(int(t["id"]), offset, t) for offset, t in entries],
+                     _file_signature(_part_path(part)))
+
+
+def _indexed_rows(name: str, select: Callable[[csv_index.TableIndex], List[int]],
+                  **prune: Any) -> Optional[List[Dict[str, Any]]]:
+    """
+    Строки, отобранные по индексам частей таблицы: select(индекс) → список id.
+    prune — date_from/date_to/row_id для отбора секций. None — у таблицы нет индекса.
+    """
+    if name not in csv_index.INDEXED_KEYS:
+        return None
+    rows: List[Dict[str, Any]] = []
+    with _lock():
+        for part in _parts(name, **prune):
+            idx = _table_index(part)
+            if idx is None:
+                return None
+            rows.extend(_rows_by_ids(part, idx, select(idx)))
+    if name in PARTITIONED:
+        rows.sort(key=lambda r: r["id"])
+    return rows
+
+
+def _fresh_cached(name: str) -> Optional[List[Dict[str, Any]]]:
+    """Строки из кэша, если он актуален; None — таблица в памяти не загружена."""
+    entry = _table_cache.get(name)
+    if entry is not None and entry[0] == _table_signature(name):
+        return entry[1]
+    return None
+
+
+# --- Столбцы для агрегации (см. aggregates) ---
+# Числовые поля таблицы в array('q'); строятся один раз на версию данных.
+
+_column_cache: Dict[str, Tuple[Tuple[int, ...], Dict[str, array]]] = {}
+_COLUMN_FIELDS = {
+    "products": ("id", "category_id", "supplier_id", "quantity"),
+    "deliveries": ("id", "product_id", "supplier_id", "quantity"),
+}
+
+
+def _delivery_column_values(r: Dict[str, Any]) -> Tuple[int, ...]:
+    return (r["id"], r["product_id"], r["supplier_id"], r["quantity"], aggregates.date_key(r["delivery_date"]))
+
+
+def _columns(name: str) -> Dict[str, array]:
+    """Столбцы таблицы products (+ price_kop) или deliveries (+ date как ГГГГММДД)."""
+    rows = _cached_rows(name)
+    if isinstance(rows, ProductColumns):
+        return {"id": rows.ids, "category_id": rows.category_ids, "supplier_id": rows.supplier_ids,
+                "quantity": rows.quantities, "price_kop": rows.prices_kop}
+    sig = _table_signature(name)
+    entry = _column_cache.get(name)
+    if entry is not None and entry[0] == sig:
+        return entry[1]
+    fields = _COLUMN_FIELDS[name]
+    cols = {f: array("q", (r[f] for r in rows)) for f in fields}
+    if name == "products":
+        cols["price_kop"] = array("q", (price_to_kop(r["price"]) for r in rows))
+    else:
+        cols["date"] = array("q", (aggregates.date_key(r["delivery_date"]) for r in rows))
+    _column_cache[name] = (sig, cols)
+    return cols
+
+
+def _rows_by_ids(part: str, idx: csv_index.TableIndex, ids: List[int]) -> List[Dict[str, Any]]:
+    """Прочитать строки по id через смещения из индекса (без полного чтения CSV)."""
+    name = _part_table(part)
+    offsets = [idx.offsets[i] for i in ids if i in idx.offsets]
+    rows = [_cast_row(name, r) for r in csv_index.read_at(_part_path(part), idx.header, offsets)]
+    if name == "products":
+        deltas = _read_stock_deltas()
+        for p in rows:
+            p["quantity"] += deltas.get(p["id"], 0)
+    return rows
 
 
 # --- Индексы (в памяти для ускорения поиска) ---
@@ -115,120 +1181,893 @@ def build_index_by_key(rows: List[Dict], key: str) -> Dict[Any, List[Dict]]:
     return idx
 
 
+@_dispatch
 def get_next_id(name: str) -> int:
-    """Следующий свободный id в таблице."""
-    rows = load_table(name)
+    """Следующий свободный id в таблице (по сохранённому счётчику, без чтения таблицы)."""
+    seq = (_read_json(_sequences_path()) or {}).get(name)
+    sig = _storage_signature(name)
+    if seq and sig is not None and tuple(seq["sig"]) == sig:
+        return int(seq["max_id"]) + 1
+    # Счётчика нет или файл изменён в обход csv_db — пересчитать по таблице
+    rows = _cached_rows(name)
     if not rows:
         return 1
-    return max(int(r["id"]) for r in rows) + 1
+    max_id = max(int(r["id"]) for r in rows)
+    _store_sequence(name, max_id)
+    return max_id + 1
+
+
+# --- Потоковое чтение (генераторы с постоянной памятью) ---
+# Фильтры: where — функция строки, **equals — равенство полей (поля из индекса
+# читаются по смещениям, без полного прохода по CSV); limit останавливает чтение.
+
+def _iter_part(part: str) -> Iterator[Dict[str, Any]]:
+    """Строки файла части таблицы по одной, без загрузки в память и в кэш."""
+    name = _part_table(part)
+    path = _part_path(part)
+    # Под блокировкой снимается размер файла; строки, дописанные позже, не читаются.
+    # Заменённый файл (os.replace) читается в прежней версии через открытый дескриптор.
+    with _lock():
+        if not path.exists():
+            return
+        deltas = _read_stock_deltas() if name == "products" else {}
+        f = open(path, "rb")
+        st = os.fstat(f.fileno())
+        end = st.st_size
+        # Секция (не больше месяца строк) читается из снимка целиком, если он действителен
+        columns = _load_snapshot(part, (st.st_mtime_ns, st.st_size, st.st_ino)) if name in PARTITIONED else None
+    if columns is not None:
+        f.close()
+        yield from _column_rows(name, columns)
+        return
+    with f:
+        reader = csv.reader(_lines_upto(f, end))
+        header = next(reader, [])
+        read, width = _row_reader(name, header), len(header)
+        for rec in reader:
+            if len(rec) < width:
+                if not rec:
+                    continue
+                rec = rec + [""] * (width - len(rec))
+            row = read(rec)
+            if deltas:
+                row["quantity"] += deltas.get(row["id"], 0)
+            yield row
+
+
+def _lines_upto(f, end: int) -> Iterator[str]:
+    """Строки двоичного файла до смещения end."""
+    pos = 0
+    for line in f:
+        pos += len(line)
+        if pos > end:
+            return
+        yield line.decode("utf-8")
+
+
+def _scan(name: str, equals: Dict[str, Any], date_from: Optional[str] = None,
+          date_to: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Источник строк: кэш (если актуален), индекс (для фильтров по ключам) или файлы.
+    Для секционированной таблицы читаются только секции, пересекающиеся с периодом дат.
+    """
+    rows = _fresh_cached(name)
+    if rows is not None:
+        return (dict(r) for r in rows)
+    indexed = [k for k in equals if k in csv_index.INDEXED_KEYS.get(name, ())]
+    if indexed:
+        def select(idx: csv_index.TableIndex) -> List[int]:
+            ids = set(idx.ids_for(indexed[0], equals[indexed[0]]))
+            for k in indexed[1:]:
+                ids &= set(idx.ids_for(k, equals[k]))
+            return list(ids)
+
+        found = _indexed_rows(name, select, date_from=date_from, date_to=date_to)
+        if found is not None:
+            return iter(found)
+    parts = _parts(name, date_from, date_to)
+    return heapq.merge(*(_iter_part(p) for p in parts), key=lambda r: r["id"])
+
+
+def _select_rows(name: str, where: Optional[Callable[[Dict[str, Any]], bool]], limit: Optional[int],
+                 equals: Dict[str, Any], date_from: Optional[str] = None,
+                 date_to: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    rows = _scan(name, equals, date_from, date_to)
+    if equals:
+        rows = (r for r in rows if all(r.get(k) == v for k, v in equals.items()))
+    if where is not None:
+        rows = filter(where, rows)
+    return islice(rows, limit) if limit is not None else rows
+
+
+@_dispatch
+def iter_table(name: str, where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+               limit: Optional[int] = None, **equals: Any) -> Iterator[Dict[str, Any]]:
+    """Строки таблицы по одной (копии), с фильтрами и ограничением limit."""
+    return _select_rows(name, where, limit, equals)
+
+
+def _product_full(p: Dict[str, Any], categories: Dict[int, Dict], suppliers: Dict[int, Dict]) -> Dict[str, Any]:
+    c = categories.get(p["category_id"], {})
+    s = suppliers.get(p["supplier_id"], {})
+    return {
+        "id": p["id"],
+        "product_name": p["name"],
+        "price": p["price"],
+        "quantity": p["quantity"],
+        "created_at": p.get("created_at"),
+        "category_name": c.get("name", ""),
+        "category_description": c.get("description", ""),
+        "supplier_name": s.get("name", ""),
+        "supplier_contact": s.get("contact", ""),
+    }
+
+
+def _delivery_full(d: Dict[str, Any], products: Dict[int, Dict], suppliers: Dict[int, Dict]) -> Dict[str, Any]:
+    p = products.get(d["product_id"], {})
+    s = suppliers.get(d["supplier_id"], {})
+    return {
+        "id": d["id"],
+        "quantity": d["quantity"],
+        "delivery_date": d.get("delivery_date"),
+        "created_at": d.get("created_at"),
+        "product_name": p.get("name", ""),
+        "price": p.get("price"),
+        "supplier_name": s.get("name", ""),
+    }
+
+
+@_dispatch
+def iter_products_full(limit: Optional[int] = None, where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                       **equals: Any) -> Iterator[Dict[str, Any]]:
+    """Товары с категорией и поставщиком по одной строке; фильтры — по полям products."""
+    categories = build_index_by_id(_cached_rows("categories"))
+    suppliers = build_index_by_id(_cached_rows("suppliers"))
+    rows = (_product_full(p, categories, suppliers) for p in iter_table("products", where, **equals))
+    return islice(rows, limit) if limit is not None else rows
+
+
+@_dispatch
+def iter_deliveries_full(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                         limit: Optional[int] = None, **equals: Any) -> Iterator[Dict[str, Any]]:
+    """Поставки с товаром и поставщиком по одной строке (в порядке файла), с фильтром по датам."""
+    products = build_index_by_id(_cached_rows("products"))
+    suppliers = build_index_by_id(_cached_rows("suppliers"))
+
+    def in_range(d: Dict[str, Any]) -> bool:
+        date = d.get("delivery_date") or ""
+        return (not date_from or date >= date_from) and (not date_to or date <= date_to)
+
+    where = in_range if date_from or date_to else None
+    source = _select_rows("deliveries", where, None, equals, date_from, date_to)
+    rows = (_delivery_full(d, products, suppliers) for d in source)
+    return islice(rows, limit) if limit is not None else rows
 
 
 # --- Представления (VIEW) ---
 
+@_dispatch
 def v_products_full(limit: Optional[int] = None) -> List[Dict[str, Any]]:
-    """Товары с названиями категории и поставщика (аналог VIEW)."""
-    products = load_table("products")
-    categories = build_index_by_id(load_table("categories"))
-    suppliers = build_index_by_id(load_table("suppliers"))
-    result = []
-    for p in products:
-        c = categories.get(p["category_id"], {})
-        s = suppliers.get(p["supplier_id"], {})
-        result.append({
-            "id": p["id"],
-            "product_name": p["name"],
-            "price": p["price"],
-            "quantity": p["quantity"],
-            "created_at": p.get("created_at"),
-            "category_name": c.get("name", ""),
-            "category_description": c.get("description", ""),
-            "supplier_name": s.get("name", ""),
-            "supplier_contact": s.get("contact", ""),
-        })
-    if limit is not None:
-        result = result[:limit]
-    return result
+    """Товары с названиями категории и поставщика (аналог VIEW). Чтение останавливается на limit."""
+    return list(iter_products_full(limit=limit))
+
 
+def _cutoff(days_back: int) -> str:
+    from datetime import timedelta
+    return (datetime.now() - timedelta(days=days_back)).strftime("%Y-%m-%d")
 
+
+@_dispatch
 def v_deliveries_full(days_back: Optional[int] = None) -> List[Dict[str, Any]]:
-    """Поставки с названиями товара и поставщика (аналог VIEW)."""
-    deliveries = load_table("deliveries")
-    products = build_index_by_id(load_table("products"))
-    suppliers = build_index_by_id(load_table("suppliers"))
-    result = []
-    for d in deliveries:
-        p = products.get(d["product_id"], {})
-        s = suppliers.get(d["supplier_id"], {})
-        result.append({
-            "id": d["id"],
-            "quantity": d["quantity"],
-            "delivery_date": d.get("delivery_date"),
-            "created_at": d.get("created_at"),
-            "product_name": p.get("name", ""),
-            "price": p.get("price"),
-            "supplier_name": s.get("name", ""),
-        })
-    result.sort(key=lambda x: (x.get("delivery_date") or ""), reverse=True)
-    if days_back is not None:
-        from datetime import timedelta
-        cutoff = (datetime.now() - timedelta(days=days_back)).strftime("%Y-%m-%d")
-        result = [r for r in result if (r.get("delivery_date") or "") >= cutoff]
-    return result
+    """Поставки с названиями товара и поставщика (аналог VIEW), по убыванию даты."""
+    return _deliveries_full_by_date(_cutoff(days_back) if days_back is not None else None, None)
+
+
+def _deliveries_full_by_date(date_from: Optional[str], date_to: Optional[str]) -> List[Dict[str, Any]]:
+    """Поставки за период по убыванию даты (при равной дате — по возрастанию id)."""
+    if (date_from or date_to) and _fresh_cached("deliveries") is None:
+        # Таблица не в памяти: читаются только секции периода, сортируются k найденных строк
+        result = list(iter_deliveries_full(date_from=date_from, date_to=date_to))
+        result.sort(key=lambda x: (x.get("delivery_date") or ""), reverse=True)
+        return result
+    products = build_index_by_id(_cached_rows("products"))
+    suppliers = build_index_by_id(_cached_rows("suppliers"))
+    return [_delivery_full(d, products, suppliers) for d in _deliveries_by_date(date_from, date_to)]
+
+
+# --- Индекс поставок по дате (в памяти) ---
+# Строки deliveries по возрастанию (delivery_date, -id) и параллельный список дат:
+# границы периода ищутся бинарным поиском, результат уже упорядочен — O(log n + k).
+# Новая поставка вставляется на своё место, полная сортировка — только при перечитывании.
+
+_date_index_cache: Optional[Tuple[Tuple[int, ...], List[str], List[Dict[str, Any]]]] = None
 
 
+def _date_order(r: Dict[str, Any]) -> Tuple[str, int]:
+    return (r["delivery_date"] or "", -r["id"])
+
+
+def _date_index() -> Tuple[List[str], List[Dict[str, Any]]]:
+    global _date_index_cache
+    sig = _table_signature("deliveries")
+    entry = _date_index_cache
+    if entry is not None and entry[0] == sig:
+        return entry[1], entry[2]
+    ordered = sorted(_cached_rows("deliveries"), key=_date_order)
+    dates = [r["delivery_date"] or "" for r in ordered]
+    _date_index_cache = (sig, dates, ordered)
+    return dates, ordered
+
+
+def _date_index_appended(before: Optional[Tuple[int, ...]], rows: List[Dict[str, Any]]) -> None:
+    """Вставить дописанные поставки в индекс по дате (если он соответствовал состоянию до записи)."""
+    global _date_index_cache
+    entry = _date_index_cache
+    if entry is None or entry[0] != before:
+        return
+    _, dates, ordered = entry
+    if len(rows) == 1:
+        row = rows[0]
+        date = row["delivery_date"] or ""
+        # Обычно id новой строки максимален, и среди равных дат она встаёт первой
+        i = bisect_left(dates, date)
+        while i < len(dates) and dates[i] == date and ordered[i]["id"] > row["id"]:
+            i += 1
+        dates.insert(i, date)
+        ordered.insert(i, row)
+    else:
+        # Пакет: сортируются только новые строки, затем слияние за один проход
+        ordered = list(heapq.merge(ordered, sorted(rows, key=_date_order), key=_date_order))
+        dates = [r["delivery_date"] or "" for r in ordered]
+    _date_index_cache = (_table_signature("deliveries"), dates, ordered)
+
+
+def _deliveries_by_date(date_from: Optional[str], date_to: Optional[str]) -> List[Dict[str, Any]]:
+    """Строки deliveries с датой в [date_from, date_to] по убыванию даты (общие объекты кэша)."""
+    dates, ordered = _date_index()
+    lo = bisect_left(dates, date_from) if date_from else 0
+    hi = bisect_right(dates, date_to) if date_to else len(dates)
+    return ordered[lo:hi][::-1]
+
+
+@_dispatch
 def v_stock_by_category() -> List[Dict[str, Any]]:
     """Остатки по категориям: название, кол-во товаров, суммарное кол-во, стоимость (аналог VIEW)."""
-    categories = load_table("categories")
-    products = load_table("products")
-    by_cat = build_index_by_key(products, "category_id")
+    categories = _cached_rows("categories")
+    # Материализованные агрегаты: стоимость в копейках, без чтения products
+    stock = _materialized()["stock"]
     result = []
     for c in categories:
-        cid = c["id"]
-        prods = by_cat.get(cid, [])
-        total_qty = sum(p["quantity"] for p in prods)
-        total_value = sum(float(p["price"]) * p["quantity"] for p in prods)
+        count, total_qty, value_kop = stock.get(str(c["id"]), (0, 0, 0))
         result.append({
             "category_name": c["name"],
-            "products_count": len(prods),
+            "products_count": count,
             "total_quantity": total_qty,
-            "total_value": round(total_value, 2),
+            "total_value": round(value_kop / 100, 2),
+        })
+    return result
+
+
+# --- Постраничное чтение представлений (виртуальная таблица GUI) ---
+# Строки представления (словари) создаются только для запрошенной страницы.
+# Сортировка по столбцу — перестановка позиций строк таблицы в array('q'),
+# вычисляемая один раз на версию данных. Пока таблица не загружена в память,
+# страница в порядке по умолчанию читается потоком с начала файла (для поставок —
+# с последних секций), чтобы первый экран не ждал загрузки всей таблицы.
+
+VIEW_COLUMNS = {
+    "products_full": ("id", "product_name", "category_name", "supplier_name", "price", "quantity", "created_at"),
+    "deliveries_full": ("id", "product_name", "supplier_name", "quantity", "delivery_date", "price", "created_at"),
+    "categories": ("id", "name", "description"),
+    "suppliers": ("id", "name", "contact", "address"),
+    "stock_by_category": ("category_name", "products_count", "total_quantity", "total_value"),
+}
+
+# Таблица-источник строк представления и справочники, от которых зависит порядок
+_VIEW_TABLES = {
+    "products_full": ("products", "categories", "suppliers"),
+    "deliveries_full": ("deliveries", "products", "suppliers"),
+    "categories": ("categories",),
+    "suppliers": ("suppliers",),
+}
+
+# Столбец представления → (поле строки таблицы, справочник, поле справочника)
+_VIEW_FIELDS = {
+    "products_full": {
+        "id": ("id", None, None), "product_name": ("name", None, None), "price": ("price", None, None),
+        "quantity": ("quantity", None, None), "created_at": ("created_at", None, None),
+        "category_name": ("category_id", "categories", "name"),
+        "supplier_name": ("supplier_id", "suppliers", "name"),
+    },
+    "deliveries_full": {
+        "id": ("id", None, None), "quantity": ("quantity", None, None),
+        "delivery_date": ("delivery_date", None, None), "created_at": ("created_at", None, None),
+        "product_name": ("product_id", "products", "name"), "price": ("product_id", "products", "price"),
+        "supplier_name": ("supplier_id", "suppliers", "name"),
+    },
+}
+
+_PRODUCT_ARRAYS = {"id": "ids", "name": "names", "category_id": "category_ids", "supplier_id": "supplier_ids",
+                   "price": "prices_kop", "quantity": "quantities", "created_at": "created_at"}
+
+_view_order_cache: Dict[str, Tuple[Any, array]] = {}
+
+
+def _view_signature(view: str) -> Tuple[Any, ...]:
+    return tuple(_table_signature(t) for t in _VIEW_TABLES.get(view, ()))
+
+
+def _check_view(view: str, order_by: Optional[str]) -> None:
+    if view not in VIEW_COLUMNS:
+        raise ValueError(f"Неизвестное представление: {view}")
+    if order_by is not None and order_by not in VIEW_COLUMNS[view]:
+        raise ValueError(f"Неизвестный столбец {view}.{order_by}")
+
+
+def _view_source(view: str) -> Tuple[Any, Callable[[Any], Dict[str, Any]], bool]:
+    """
+    Строки-источник представления, функция строка → строка представления и признак
+    обратного порядка (порядок по умолчанию — от последней строки источника к первой).
+    """
+    if view == "products_full":
+        categories = build_index_by_id(_cached_rows("categories"))
+        suppliers = build_index_by_id(_cached_rows("suppliers"))
+        return _cached_rows("products"), lambda p: _product_full(p, categories, suppliers), False
+    if view == "deliveries_full":
+        products = build_index_by_id(_cached_rows("products"))
+        suppliers = build_index_by_id(_cached_rows("suppliers"))
+        # Индекс по дате упорядочен по возрастанию, представление — по убыванию
+        return _date_index()[1], lambda d: _delivery_full(d, products, suppliers), True
+    if view == "stock_by_category":
+        return v_stock_by_category(), dict, False
+    return _cached_rows(view), dict, False
+
+
+def _sort_values(view: str, rows: Any, column: str) -> List[Any]:
+    """Значения столбца представления по позициям строк источника (ключи сортировки)."""
+    field, ref, ref_field = _VIEW_FIELDS.get(view, {}).get(column, (column, None, None))
+    if isinstance(rows, ProductColumns):
+        values = getattr(rows, _PRODUCT_ARRAYS[field])
+    else:
+        values = [r[field] for r in rows]
+    if ref is None:
+        return values
+    lookup = {r["id"]: r[ref_field] for r in _cached_rows(ref)}
+    # Строки без записи в справочнике — в начале (при сортировке по возрастанию), как NULL в SQL
+    return [(1, lookup[v]) if v in lookup else (0,) for v in values]
+
+
+def _view_order(view: str, rows: Any, order_by: str, descending: bool, reverse: bool) -> array:
+    """Позиции строк источника в порядке сортировки (кэшируется до изменения таблиц)."""
+    key = (_view_signature(view), order_by, descending)
+    entry = _view_order_cache.get(view)
+    if entry is not None and entry[0] == key and len(entry[1]) == len(rows):
+        return entry[1]
+    values = _sort_values(view, rows, order_by)
+    # Равные значения остаются в порядке по умолчанию (сортировка устойчива)
+    base = range(len(values) - 1, -1, -1) if reverse else range(len(values))
+    order = array("q", sorted(base, key=values.__getitem__, reverse=descending))
+    if view in _VIEW_TABLES:
+        _view_order_cache[view] = (key, order)
+    return order
+
+
+# --- Фильтры представлений (строка поиска GUI) ---
+# Текст ищется по названиям товара, категории и поставщика: каждое слово запроса
+# должно найтись хотя бы в одном из них (см. text_index). Названия товаров
+# индексируются один раз на процесс (индекс дополняется при записи через csv_db),
+# справочники невелики и просматриваются целиком. Диапазоны цены и количества
+# проверяются по столбцам (см. _columns). Результат — маска строк источника,
+# кэшируется до изменения таблиц.
+
+VIEW_FILTERS = {
+    "products_full": ("text", "price_min", "price_max", "qty_min", "qty_max"),
+    "deliveries_full": ("text", "price_min", "price_max", "qty_min", "qty_max"),
+    "categories": ("text",),
+    "suppliers": ("text",),
+    "stock_by_category": (),
+}
+
+# Ключ фильтра: (слова запроса, цена от/до в копейках, количество от/до)
+FilterKey = Tuple[Tuple[str, ...], Optional[int], Optional[int], Optional[int], Optional[int]]
+
+_search_index: Optional[Tuple[Tuple[int, ...], text_index.TextIndex]] = None
+_search_lock = threading.Lock()
+_filter_cache: Dict[str, Tuple[Any, Any]] = {}
+_selection_cache: Dict[str, Tuple[Any, Any]] = {}
+_date_column_cache: Optional[Tuple[Tuple[int, ...], Dict[str, array]]] = None
+
+
+def _filter_key(view: str, filters: Optional[Dict[str, Any]]) -> Optional[FilterKey]:
+    """Проверить фильтры представления и привести к ключу; None — фильтров нет."""
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    unknown = sorted(set(filters) - set(VIEW_FILTERS[view]))
+    if unknown:
+        raise ValueError(f"Представление {view} не поддерживает фильтры: {', '.join(unknown)}")
+    words = tuple(text_index.terms(str(filters.get("text", ""))))
+    bounds: List[Optional[int]] = []
+    for field in ("price_min", "price_max", "qty_min", "qty_max"):
+        value = filters.get(field)
+        try:
+            if value is not None and field.startswith("price"):
+                value = price_to_kop(value)
+            elif value is not None:
+                value = int(value)
+        except (ArithmeticError, ValueError):
+            raise ValueError(f"Некорректное значение фильтра {field}: {filters[field]!r}") from None
+        bounds.append(value)
+    if not words and all(b is None for b in bounds):
+        return None
+    return (words, *bounds)
+
+
+def _name_index() -> Tuple[Any, text_index.TextIndex]:
+    """Товары из кэша и индекс их названий по позициям строк (строится при первом поиске)."""
+    global _search_index
+    rows = _cached_rows("products")
+    sig = _table_signature("products")
+    entry = _search_index
+    if entry is None or entry[0] != sig or len(entry[1]) != len(rows):
+        names = rows.names if isinstance(rows, ProductColumns) else [r["name"] for r in rows]
+        _search_index = (sig, text_index.TextIndex(names))
+    return rows, _search_index[1]
+
+
+def _product_position(rows: Any, row_id: int) -> int:
+    if isinstance(rows, ProductColumns):
+        ids = rows.ids
+    else:
+        ids = (r["id"] for r in rows)
+    return next((i for i, v in enumerate(ids) if v == row_id), -1)
+
+
+def _search_index_changed(before: Optional[Tuple[int, ...]], changes: List[Change]) -> None:
+    """Обновить индекс названий по изменениям операции записи (вызывается после фиксации)."""
+    global _search_index
+    with _search_lock:
+        entry = _search_index
+        if entry is None or entry[0] != before:
+            return
+        renamed = [c for c in changes if c[0] == "products"
+                   and not (c[1] == "update" and c[3] is not None and "name" not in c[3])]
+        index = entry[1]
+        if renamed:
+            # Позиции строк — как в кэше products, который записан вместе с файлом
+            rows = _fresh_cached("products")
+            if rows is None or any(op == "replace" for _, op, _, _ in renamed):
+                _search_index = None
+                return
+            columnar = isinstance(rows, ProductColumns)
+            for _, op, row_id, _ in renamed:
+                pos = len(index) if op == "insert" else _product_position(rows, row_id)
+                if not 0 <= pos < len(rows) or (rows.ids[pos] if columnar else rows[pos]["id"]) != row_id:
+                    _search_index = None
+                    return
+                name = rows.names[pos] if columnar else rows[pos]["name"]
+                if pos == len(index):
+                    index.append(name)
+                else:
+                    index.replace(pos, name)
+            if len(index) != len(rows):
+                _search_index = None
+                return
+        # Остатки и цены не входят в индекс: достаточно новой сигнатуры
+        _search_index = (_table_signature("products"), index)
+
+
+def _ref_matches(table: str, word: str) -> set:
+    """id строк справочника, название которых подходит под слово запроса."""
+    return {r["id"] for r in _cached_rows(table) if text_index.matches(r["name"], word)}
+
+
+def _date_columns() -> Dict[str, array]:
+    """Столбцы поставок в порядке индекса по дате (см. _date_index)."""
+    global _date_column_cache
+    sig = _table_signature("deliveries")
+    entry = _date_column_cache
+    if entry is not None and entry[0] == sig:
+        return entry[1]
+    ordered = _date_index()[1]
+    cols = {f: array("q", (r[f] for r in ordered)) for f in ("product_id", "supplier_id", "quantity")}
+    _date_column_cache = (sig, cols)
+    return cols
+
+
+def _and(mask, other):
+    return other if mask is None else aggregates.mask_and(mask, other)
+
+
+def _product_mask(key: FilterKey):
+    """Маска строк products (в порядке кэша) по словам запроса и диапазонам."""
+    words, price_lo, price_hi, qty_lo, qty_hi = key
+    mask = None
+    found: List[array] = []
+    cols = _columns("products")
+    if words:
+        with _search_lock:
+            rows, index = _name_index()
+            found = [index.search(w) for w in words]
+        if len(rows) != len(cols["id"]):
+            raise RuntimeError("Таблица products изменилась во время поиска")
+    for word, positions in zip(words, found):
+        m = aggregates.mask_positions(len(cols["id"]), positions)
+        for field, ref in (("category_id", "categories"), ("supplier_id", "suppliers")):
+            ids = _ref_matches(ref, word)
+            if ids:
+                m = aggregates.mask_or(m, aggregates.mask_in(cols[field], ids))
+        mask = _and(mask, m)
+    if price_lo is not None or price_hi is not None:
+        mask = _and(mask, aggregates.mask_range(cols["price_kop"], price_lo, price_hi))
+    if qty_lo is not None or qty_hi is not None:
+        mask = _and(mask, aggregates.mask_range(cols["quantity"], qty_lo, qty_hi))
+    return mask
+
+
+def _delivery_mask(key: FilterKey):
+    """Маска поставок в порядке индекса по дате."""
+    words, price_lo, price_hi, qty_lo, qty_hi = key
+    cols = _date_columns()
+    mask = None
+    if words or price_lo is not None or price_hi is not None:
+        products = _columns("products")
+        for word in words:
+            with _search_lock:
+                _, index = _name_index()
+                positions = index.search(word)
+            product_ids = {products["id"][i] for i in positions}
+            m = aggregates.mask_in(cols["product_id"], product_ids)
+            supplier_ids = _ref_matches("suppliers", word)
+            if supplier_ids:
+                m = aggregates.mask_or(m, aggregates.mask_in(cols["supplier_id"], supplier_ids))
+            mask = _and(mask, m)
+        if price_lo is not None or price_hi is not None:
+            in_range = aggregates.mask_range(products["price_kop"], price_lo, price_hi)
+            product_ids = set(compress(products["id"], in_range))
+            mask = _and(mask, aggregates.mask_in(cols["product_id"], product_ids))
+    if qty_lo is not None or qty_hi is not None:
+        mask = _and(mask, aggregates.mask_range(cols["quantity"], qty_lo, qty_hi))
+    return mask
+
+
+def _filter_mask(view: str, rows: Any, key: FilterKey):
+    """Маска строк источника представления (см. _view_source), подходящих под фильтр."""
+    entry = _filter_cache.get(view)
+    cache_key = (_view_signature(view), key)
+    if entry is not None and entry[0] == cache_key and len(entry[1]) == len(rows):
+        return entry[1]
+    if view == "products_full":
+        mask = _product_mask(key)
+    elif view == "deliveries_full":
+        mask = _delivery_mask(key)
+    else:
+        words = key[0]
+        mask = aggregates.mask_positions(len(rows), [
+            i for i, r in enumerate(rows) if all(text_index.matches(r["name"], w) for w in words)])
+    if len(mask) != len(rows):
+        raise RuntimeError(f"Таблица изменилась во время отбора строк {view}")
+    _filter_cache[view] = (cache_key, mask)
+    return mask
+
+
+def _view_selection(view: str, rows: Any, key: FilterKey, order_by: Optional[str], descending: bool,
+                    reverse: bool):
+    """Позиции отобранных строк источника в порядке вывода (кэшируется до изменения таблиц)."""
+    cache_key = (_view_signature(view), key, order_by, descending)
+    entry = _selection_cache.get(view)
+    if entry is not None and entry[0] == cache_key:
+        return entry[1]
+    mask = _filter_mask(view, rows, key)
+    if order_by is None:
+        selected = aggregates.positions(mask)
+        if reverse:
+            selected = selected[::-1]
+    else:
+        selected = aggregates.take(_view_order(view, rows, order_by, descending, reverse), mask)
+    _selection_cache[view] = (cache_key, selected)
+    return selected
+
+
+def _latest_deliveries(count: int) -> List[Dict[str, Any]]:
+    """Первые count поставок по убыванию даты: секции читаются от последнего месяца."""
+    parts = _parts("deliveries")
+    undated = f"deliveries.{csv_partitions.UNDATED}"
+    # Строки без корректной даты могут оказаться в любом месте порядка — читаются всегда
+    rows = list(_iter_part(undated)) if undated in parts else []
+    dated = 0
+    for part in reversed([p for p in parts if p != undated]):
+        if dated >= count:
+            break
+        before = len(rows)
+        rows.extend(_iter_part(part))
+        dated += len(rows) - before
+    rows.sort(key=_date_order, reverse=True)
+    return rows[:count]
+
+
+# Глубже этой строки страницы не читаются потоком: каждая такая страница читала бы
+# все предыдущие строки, выгоднее один раз загрузить таблицу в кэш
+STREAM_ROWS = 10_000
+
+
+def _stream_page(view: str, offset: int, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Страница в порядке по умолчанию без загрузки таблицы в память; None — таблица
+    уже в кэше или страница дальше STREAM_ROWS.
+    """
+    table = _VIEW_TABLES.get(view, (None,))[0]
+    if table is None or offset + limit > STREAM_ROWS or _fresh_cached(table) is not None:
+        return None
+    if view == "products_full":
+        return list(islice(iter_products_full(), offset, offset + limit))
+    if view == "deliveries_full":
+        page = _latest_deliveries(offset + limit)[offset:]
+        # Товары страницы — по индексу products, без загрузки всей таблицы
+        product_ids = {d["product_id"] for d in page}
+        found = _indexed_rows("products", lambda idx: list(product_ids))
+        products = build_index_by_id(found if found is not None else _cached_rows("products"))
+        suppliers = build_index_by_id(_cached_rows("suppliers"))
+        return [_delivery_full(d, products, suppliers) for d in page]
+    return list(islice(iter_table(view), offset, offset + limit))
+
+
+@_dispatch
+def view_page(view: str, offset: int, limit: int, order_by: Optional[str] = None,
+              descending: bool = False, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Строки представления [offset, offset + limit) для виртуальной таблицы GUI.
+    view — ключ VIEW_COLUMNS; order_by — столбец сортировки (None — порядок по умолчанию:
+    по id, для поставок — по убыванию даты); filters — отбор строк (ключи VIEW_FILTERS:
+    text, price_min, price_max, qty_min, qty_max).
+    """
+    _check_view(view, order_by)
+    key = _filter_key(view, filters)
+    offset = max(0, offset)
+    if order_by is None and key is None:
+        page = _stream_page(view, offset, limit)
+        if page is not None:
+            return page
+    rows, full, reverse = _view_source(view)
+    if key is not None:
+        positions = _view_selection(view, rows, key, order_by, descending, reverse)[offset:offset + limit]
+    elif order_by is None:
+        positions = range(offset, min(len(rows), offset + limit))
+        if reverse:
+            positions = [len(rows) - 1 - i for i in positions]
+    else:
+        positions = _view_order(view, rows, order_by, descending, reverse)[offset:offset + limit]
+    return [full(rows[i]) for i in positions]
+
+
+@_dispatch
+def view_rows(view: str, ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """Строки представления с данными id (точечное обновление строк на экране после изменения)."""
+    _check_view(view, None)
+    if view not in _VIEW_TABLES:
+        raise ValueError(f"У представления {view} нет id строк")
+    table = _VIEW_TABLES[view][0]
+    rows = [r for r in (get_row(table, i) for i in ids) if r is not None]
+    if view == "products_full":
+        categories = build_index_by_id(_cached_rows("categories"))
+        suppliers = build_index_by_id(_cached_rows("suppliers"))
+        return [_product_full(p, categories, suppliers) for p in rows]
+    if view == "deliveries_full":
+        found = (get_row("products", pid) for pid in {d["product_id"] for d in rows})
+        products = build_index_by_id(p for p in found if p is not None)
+        suppliers = build_index_by_id(_cached_rows("suppliers"))
+        return [_delivery_full(d, products, suppliers) for d in rows]
+    return rows
+
+
+@_dispatch
+def view_count(view: str, filters: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Число строк представления. Без фильтров таблица не загружается, если число строк
+    известно из манифеста секций или заголовка снимка (быстрый первый показ в GUI).
+    """
+    _check_view(view, None)
+    key = _filter_key(view, filters)
+    if key is not None:
+        rows, _, reverse = _view_source(view)
+        return len(_view_selection(view, rows, key, None, False, reverse))
+    if view == "stock_by_category":
+        return _row_count("categories")
+    return _row_count(_VIEW_TABLES[view][0])
+
+
+def _row_count(name: str) -> int:
+    """Число строк таблицы: из кэша, манифеста секций или снимка; иначе таблица загружается."""
+    rows = _fresh_cached(name)
+    if rows is not None:
+        return len(rows)
+    if name in PARTITIONED:
+        with _lock():
+            manifest = csv_partitions.manifest(_partition_dir(name), _file_signature)
+        return sum(entry["rows"] for entry in manifest.values())
+    try:
+        count = csv_snapshot.row_count(_meta_path(""), name, _file_signature(_table_path(name)))
+    except (OSError, ValueError, KeyError, TypeError):
+        count = None
+    return count if count is not None else len(_cached_rows(name))
+
+
+@_dispatch
+def deliveries_stats(by: str = "supplier_id") -> List[Dict[str, Any]]:
+    """
+    Статистика поставок по группам: by = supplier_id, product_id или период
+    даты (day, month, year). Для каждой группы — число поставок, сумма,
+    минимум и максимум количества.
+    """
+    cols = _columns("deliveries")
+    if by in aggregates.DATE_BUCKETS:
+        keys = aggregates.bucket_dates(cols["date"], by)
+    elif by in ("supplier_id", "product_id"):
+        keys = cols[by]
+    else:
+        raise ValueError("by должен быть supplier_id, product_id, day, month или year")
+    stats = aggregates.group_by(keys, cols["quantity"])
+    result = []
+    for key in sorted(stats):
+        count, total, lo, hi = stats[key]
+        result.append({
+            by: aggregates.bucket_label(key, by) if by in aggregates.DATE_BUCKETS else key,
+            "deliveries_count": count,
+            "total_quantity": total,
+            "min_quantity": lo,
+            "max_quantity": hi,
         })
     return result
 
 
+# --- Материализованные агрегаты (остатки по категориям, поставки по поставщикам) ---
+# Хранятся в data/_meta/aggregates.json вместе с сигнатурами products и deliveries.
+# Функции записи изменяют их на дельту (+остаток в одной категории, +1 поставка
+# у поставщика), поэтому чтение не зависит от объёма истории. Если сигнатуры не
+# совпадают (файлы изменены в обход csv_db, сбой между записями), агрегаты
+# пересчитываются полностью.
+
+def _aggregates_path() -> Path:
+    return _meta_path("aggregates.json")
+
+
+def _aggregates_signature() -> List[List[int]]:
+    return [list(_table_signature("products") or ()), list(_table_signature("deliveries") or ())]
+
+
+def rebuild_aggregates() -> Dict[str, Any]:
+    """Полностью пересчитать материализованные агрегаты по таблицам и сохранить их."""
+    data = _compute_aggregates()
+    _save_aggregates(data)
+    return data
+
+
+def _compute_aggregates() -> Dict[str, Any]:
+    sig = _aggregates_signature()
+    pcols = _columns("products")
+    dcols = _columns("deliveries")
+    stock = aggregates.stock_by_category(pcols["category_id"], pcols["quantity"], pcols["price_kop"])
+    by_supplier = aggregates.group_by(dcols["supplier_id"], dcols["quantity"])
+    data = {
+        "sig": sig,
+        "stock": {str(cid): list(v) for cid, v in stock.items()},
+        "supplier_deliveries": {str(sid): v[0] for sid, v in by_supplier.items()},
+    }
+    return data
+
+
+def _save_aggregates(data: Dict[str, Any]) -> None:
+    """
+    Записать пересчитанные агрегаты — только под исключительной блокировкой
+    и только если данные не изменились с пересчёта (иначе их пересчитает следующее чтение).
+    """
+    if not DATA_DIR.exists():
+        return
+    with _lock(exclusive=True):
+        if data["sig"] == _aggregates_signature():
+            _write_json(_aggregates_path(), data)
+
+
+def _materialized() -> Dict[str, Any]:
+    data = _read_json(_aggregates_path())
+    if data is None or data.get("sig") != _aggregates_signature():
+        data = _compute_aggregates()
+        # Внутри чтения исключительную блокировку не взять (csv_lock): сохранит следующее чтение
+        if _lock_held() != csv_lock.SHARED:
+            _save_aggregates(data)
+    return data
+
+
+def verify_aggregates() -> List[str]:
+    """Сравнить материализованные агрегаты с полным пересчётом. Пустой список — расхождений нет."""
+    stored = _read_json(_aggregates_path())
+    fresh = rebuild_aggregates()
+    if stored is None:
+        return ["агрегаты отсутствовали и были построены заново"]
+    if stored.get("sig") != fresh["sig"]:
+        return ["агрегаты устарели (данные изменены в обход csv_db) и были построены заново"]
+    problems = []
+    for key in ("stock", "supplier_deliveries"):
+        old, new = stored.get(key, {}), fresh[key]
+        for k in sorted(set(old) | set(new), key=int):
+            zero = [0, 0, 0] if key == "stock" else 0
+            if old.get(k, zero) != new.get(k, zero):
+                problems.append(f"{key}[{k}]: сохранено {old.get(k)}, пересчитано {new.get(k)}")
+    return problems
+
+
+def _product_stock(p: Optional[Dict[str, Any]], sign: int = 1) -> List[Tuple[int, int, int, int]]:
+    """Вклад товара в остатки по категории: (category_id, товаров, остаток, стоимость в копейках)."""
+    if p is None:
+        return []
+    return [(p["category_id"], sign, sign * p["quantity"], sign * price_to_kop(p["price"]) * p["quantity"])]
+
+
+def _stock_change(p: Optional[Dict[str, Any]], quantity: int) -> List[Tuple[int, int, int, int]]:
+    """Изменение остатка товара p на quantity (число товаров в категории не меняется)."""
+    if p is None or not quantity:
+        return []
+    return [(p["category_id"], 0, quantity, price_to_kop(p["price"]) * quantity)]
+
+
+def _update_aggregates(before: List[List[int]], stock=(), suppliers=()) -> None:
+    """
+    Применить дельты к материализованным агрегатам, если они соответствовали
+    состоянию до записи (before). stock — (category_id, товаров, остаток, копейки),
+    suppliers — (supplier_id, поставок).
+    """
+    data = _read_json(_aggregates_path())
+    if data is None or data.get("sig") != before:
+        _aggregates_path().unlink(missing_ok=True)  # будут пересчитаны при чтении
+        return
+    for cid, count, qty, value in stock:
+        a = data["stock"].setdefault(str(cid), [0, 0, 0])
+        a[0] += count
+        a[1] += qty
+        a[2] += value
+    for sid, count in suppliers:
+        key = str(sid)
+        data["supplier_deliveries"][key] = data["supplier_deliveries"].get(key, 0) + count
+    data["sig"] = _aggregates_signature()
+    _write_json(_aggregates_path(), data)
+
+
 # --- Запросы для анализа производительности ---
 
+@_dispatch
 def query_products_by_category_name(category_name: str) -> List[Dict]:
     """Товары по имени категории (с использованием индекса по категории)."""
-    categories = load_table("categories")
+    categories = _cached_rows("categories")
     cat_id = next((c["id"] for c in categories if c["name"] == category_name), None)
     if cat_id is None:
         return []
-    products = load_table("products")
+    products = _fresh_cached("products")
+    if products is None:
+        # Таблица не в памяти — читаем только строки категории по индексу на диске
+        found = _indexed_rows("products", lambda idx: idx.ids_for("category_id", cat_id))
+        if found is not None:
+            return found
+        products = _cached_rows("products")
     by_cat = build_index_by_key(products, "category_id")
-    return by_cat.get(cat_id, [])
+    return [dict(p) for p in by_cat.get(cat_id, [])]
 
 
+@_dispatch
 def query_products_price_above(price_min: float) -> List[Dict]:
     """Товары с ценой выше заданной, по убыванию цены."""
-    products = load_table("products")
-    return sorted([p for p in products if float(p["price"]) > price_min], key=lambda p: float(p["price"]), reverse=True)
+    products = _cached_rows("products")
+    return sorted([dict(p) for p in products if float(p["price"]) > price_min], key=lambda p: float(p["price"]), reverse=True)
 
 
+@_dispatch
 def query_suppliers_delivery_count() -> List[Dict[str, Any]]:
-    """Поставщики с количеством поставок (агрегация)."""
-    suppliers = load_table("suppliers")
-    deliveries = load_table("deliveries")
-    by_supplier = build_index_by_key(deliveries, "supplier_id")
-    result = []
-    for s in suppliers:
-        sid = s["id"]
-        result.append({"name": s["name"], "deliveries_count": len(by_supplier.get(sid, []))})
-    return result
+    """Поставщики с количеством поставок (из материализованных агрегатов, без чтения поставок)."""
+    counts = _materialized()["supplier_deliveries"]
+    return [{"name": s["name"], "deliveries_count": counts.get(str(s["id"]), 0)} for s in _cached_rows("suppliers")]
 
 
 # --- Триггер: при добавлении поставки обновить остаток товара ---
 
+@_dispatch
+@_atomic
 def add_delivery(product_id: int, supplier_id: int, quantity: int, delivery_date: Optional[str] = None) -> Dict[str, Any]:
     """
     Добавить поставку и автоматически увеличить остаток товара (логика триггера).
@@ -237,7 +2076,7 @@ def add_delivery(product_id: int, supplier_id: int, quantity: int, delivery_date
     _require_manager()
     if delivery_date is None:
         delivery_date = datetime.now().strftime("%Y-%m-%d")
-    deliveries = load_table("deliveries")
+    before = _aggregates_signature()
     new_id = get_next_id("deliveries")
     new_row = {
         "id": new_id,
@@ -247,47 +2086,159 @@ def add_delivery(product_id: int, supplier_id: int, quantity: int, delivery_date
         "delivery_date": delivery_date,
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
-    deliveries.append(new_row)
-    save_table("deliveries", deliveries)
-
-    # Триггер: обновить quantity в products
-    products = load_table("products")
-    for p in products:
-        if p["id"] == product_id:
-            p["quantity"] = p["quantity"] + quantity
-            break
-    save_table("products", products)
+    _append_row("deliveries", new_row)
+    _store_sequence("deliveries", new_id)
+
+    # Триггер: обновить quantity в products (строкой в журнале остатков)
+    _append_stock_delta(product_id, quantity)
+    _update_aggregates(before, _stock_change(get_row("products", product_id), quantity), [(supplier_id, 1)])
+    _log_change("deliveries", "insert", new_row)
+    _log_change("products", "stock", [[product_id, quantity]])
+    _changed("deliveries", "insert", new_id)
+    _changed("products", "update", product_id, ("quantity",))
     return new_row
 
 
+# --- Пакетная загрузка поставок ---
+
+def _table_ids(name: str) -> set:
+    """Множество id таблицы (для products без загрузки — из индекса на диске)."""
+    rows = _fresh_cached(name)
+    if rows is None:
+        idx = _table_index(name)
+        if idx is not None:
+            return set(idx.offsets)
+        rows = _cached_rows(name)
+    return {r["id"] for r in rows}
+
+
+def _validate_deliveries(rows: Iterable[Dict[str, Any]], product_ids: set, supplier_ids: set) -> List[Dict[str, Any]]:
+    """Проверить и привести строки пакета поставок. Ошибки всех строк — одним ValueError."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    valid_dates = {today}  # даты в пакете повторяются — каждая проверяется один раз
+    batch, errors = [], []
+    for n, r in enumerate(rows, 1):
+        try:
+            pid, sid, qty = int(r["product_id"]), int(r["supplier_id"]), int(r["quantity"])
+            date = str(r.get("delivery_date") or "").strip() or today
+            if date not in valid_dates:
+                datetime.strptime(date, "%Y-%m-%d")
+                valid_dates.add(date)
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f"строка {n}: некорректные данные ({e})")
+            continue
+        if pid not in product_ids:
+            errors.append(f"строка {n}: товар id={pid} не найден")
+        elif sid not in supplier_ids:
+            errors.append(f"строка {n}: поставщик id={sid} не найден")
+        elif qty <= 0:
+            errors.append(f"строка {n}: количество должно быть больше нуля")
+        else:
+            batch.append({"product_id": pid, "supplier_id": sid, "quantity": qty, "delivery_date": date})
+    if errors:
+        more = f" (и ещё {len(errors) - 10})" if len(errors) > 10 else ""
+        raise ValueError("Пакет поставок не принят: " + "; ".join(errors[:10]) + more)
+    return batch
+
+
+def _bulk_result(count: int, first_id: int, started: float) -> Dict[str, Any]:
+    seconds = time.perf_counter() - started
+    return {
+        "count": count,
+        "first_id": first_id if count else None,
+        "last_id": first_id + count - 1 if count else None,
+        "seconds": seconds,
+        "rows_per_sec": count / seconds if seconds > 0 else 0.0,
+    }
+
+
+@_dispatch
+@_atomic
+def add_deliveries_bulk(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Добавить пакет поставок с обновлением остатков (логика триггера для пакета).
+    Все строки проверяются заранее, id выдаются одним блоком, поставки дописываются
+    одной записью на секцию, остатки — одной записью сумм по товарам в журнал.
+    Пакет записывается одной операцией журнала — целиком или никак. Требуется роль manager.
+    Возвращает {"count", "first_id", "last_id", "seconds", "rows_per_sec"}.
+    """
+    _require_manager()
+    started = time.perf_counter()
+    batch = _validate_deliveries(rows, _table_ids("products"), _table_ids("suppliers"))
+    if not batch:
+        return _bulk_result(0, 0, started)
+    before = _aggregates_signature()
+    first_id = get_next_id("deliveries")
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    new_rows = [{"id": first_id + i, **r, "created_at": created_at} for i, r in enumerate(batch)]
+    stock: Dict[int, int] = {}
+    suppliers: Dict[int, int] = {}
+    for r in batch:
+        stock[r["product_id"]] = stock.get(r["product_id"], 0) + r["quantity"]
+        suppliers[r["supplier_id"]] = suppliers.get(r["supplier_id"], 0) + 1
+    _append_rows("deliveries", new_rows)
+    _append_stock_deltas(stock)
+    _store_sequence("deliveries", new_rows[-1]["id"])
+    products = build_index_by_id(_cached_rows("products"))
+    changes = [c for pid, qty in stock.items() for c in _stock_change(products.get(pid), qty)]
+    _update_aggregates(before, changes, suppliers.items())
+    for r in new_rows:
+        _log_change("deliveries", "insert", r)
+    _log_change("products", "stock", [[pid, qty] for pid, qty in stock.items()])
+    for r in new_rows:
+        _changed("deliveries", "insert", r["id"])
+    for pid in stock:
+        _changed("products", "update", pid, ("quantity",))
+    return _bulk_result(len(new_rows), first_id, started)
+
+
 # --- Редактирование и добавление записей (сохранение в CSV) ---
 
+@_dispatch
 def get_row(table: str, row_id: int) -> Optional[Dict[str, Any]]:
-    """Получить одну запись по id."""
-    rows = load_table(table)
-    for r in rows:
-        if int(r["id"]) == row_id:
-            return r
-    return None
+    """Получить одну запись по id (из кэша или чтением одной строки по индексу)."""
+    rows = _fresh_cached(table)
+    if rows is None:
+        found = _indexed_rows(table, lambda idx: [row_id], row_id=row_id)
+        if found is not None:
+            return found[0] if found else None
+        rows = _cached_rows(table)
+    r = _find_by_id(rows, row_id)
+    return dict(r) if r is not None else None
 
 
+@_dispatch
+@_atomic
 def update_row(table: str, row_id: int, updates: Dict[str, Any]) -> None:
     """Обновить запись в таблице. Изменения сохраняются в CSV. Требуется роль manager."""
     _require_manager()
+    before = _aggregates_signature()
     rows = load_table(table)
     for r in rows:
         if int(r["id"]) == row_id:
+            old = dict(r)
             for k, v in updates.items():
                 if k in r:
                     if table == "products" and k == "price":
                         r[k] = Decimal(str(v))
                     else:
                         r[k] = v
-            save_table(table, rows)
+            _write_table(table, rows)
+            fields = [k for k in updates if k in r]
+            _log_change(table, "update", {"id": row_id, **{k: r[k] for k in fields}})
+            _changed(table, "update", row_id, fields)
+            if table == "products":
+                _update_aggregates(before, _product_stock(old, -1) + _product_stock(r))
+            elif table == "deliveries":
+                _update_aggregates(before, suppliers=[(old["supplier_id"], -1), (r["supplier_id"], 1)])
+            else:
+                _update_aggregates(before)
             return
     raise ValueError(f"Запись с id={row_id} не найдена в {table}")
 
 
+@_dispatch
+@_atomic
 def add_category(name: str, description: str = "") -> Dict[str, Any]:
     """Добавить категорию. Сохраняется в CSV."""
     _require_manager()
@@ -295,10 +2246,14 @@ def add_category(name: str, description: str = "") -> Dict[str, Any]:
     new_id = get_next_id("categories")
     row = {"id": new_id, "name": name, "description": description}
     rows.append(row)
-    save_table("categories", rows)
+    _write_table("categories", rows)
+    _log_change("categories", "insert", row)
+    _changed("categories", "insert", new_id)
     return row
 
 
+@_dispatch
+@_atomic
 def add_supplier(name: str, contact: str = "", address: str = "") -> Dict[str, Any]:
     """Добавить поставщика. Сохраняется в CSV."""
     _require_manager()
@@ -306,13 +2261,18 @@ def add_supplier(name: str, contact: str = "", address: str = "") -> Dict[str, A
     new_id = get_next_id("suppliers")
     row = {"id": new_id, "name": name, "contact": contact, "address": address}
     rows.append(row)
-    save_table("suppliers", rows)
+    _write_table("suppliers", rows)
+    _log_change("suppliers", "insert", row)
+    _changed("suppliers", "insert", new_id)
     return row
 
 
+@_dispatch
+@_atomic
 def add_product(name: str, category_id: int, supplier_id: int, price: float, quantity: int = 0) -> Dict[str, Any]:
     """Добавить товар. Сохраняется в CSV."""
     _require_manager()
+    before = _aggregates_signature()
     rows = load_table("products")
     new_id = get_next_id("products")
     row = {
@@ -325,10 +2285,15 @@ def add_product(name: str, category_id: int, supplier_id: int, price: float, qua
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
     rows.append(row)
-    save_table("products", rows)
+    _write_table("products", rows)
+    _update_aggregates(before, _product_stock(row))
+    _log_change("products", "insert", row)
+    _changed("products", "insert", new_id)
     return row
 
 
+@_dispatch
+@_atomic
 def update_delivery(
     delivery_id: int,
     product_id: Optional[int] = None,
@@ -341,6 +2306,7 @@ def update_delivery(
     Сохраняется в CSV.
     """
     _require_manager()
+    before = _aggregates_signature()
     deliveries = load_table("deliveries")
     old_row = None
     for d in deliveries:
@@ -351,6 +2317,7 @@ def update_delivery(
         raise ValueError(f"Поставка с id={delivery_id} не найдена")
     old_qty = int(old_row["quantity"])
     old_pid = int(old_row["product_id"])
+    old_sid = int(old_row["supplier_id"])
     new_pid = int(product_id) if product_id is not None else old_pid
     new_qty = int(quantity) if quantity is not None else old_qty
     if product_id is not None:
@@ -365,27 +2332,172 @@ def update_delivery(
         if int(d["id"]) == delivery_id:
             d.update(old_row)
             break
-    save_table("deliveries", deliveries)
-    products = load_table("products")
+    _write_table("deliveries", deliveries)
+    fields = [k for k, v in (("product_id", product_id), ("supplier_id", supplier_id),
+                             ("quantity", quantity), ("delivery_date", delivery_date)) if v is not None]
+    _changed("deliveries", "update", delivery_id, fields)
+    _log_change("deliveries", "update", {"id": delivery_id, **{k: old_row[k] for k in fields}})
+    stock = []
     if old_pid != new_pid or old_qty != new_qty:
-        for p in products:
-            if p["id"] == old_pid:
-                p["quantity"] = p["quantity"] - old_qty
-                break
-        for p in products:
-            if p["id"] == new_pid:
-                p["quantity"] = p["quantity"] + new_qty
-                break
-        save_table("products", products)
+        _append_stock_delta(old_pid, -old_qty)
+        _append_stock_delta(new_pid, new_qty)
+        _log_change("products", "stock", [[old_pid, -old_qty], [new_pid, new_qty]])
+        stock = _stock_change(get_row("products", old_pid), -old_qty) + _stock_change(get_row("products", new_pid), new_qty)
+        for pid in {old_pid, new_pid}:
+            _changed("products", "update", pid, ("quantity",))
+    _update_aggregates(before, stock, [(old_sid, -1), (int(old_row["supplier_id"]), 1)])
+
+
+# --- Повтор журнала изменений (восстановление на момент времени) ---
+
+def _logged_row(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка из события журнала изменений: Decimal записан строкой."""
+    for field, kind in _FIELD_TYPES.get(table, ()):
+        if kind == "Decimal" and field in row:
+            row[field] = Decimal(str(row[field]))
+    return row
+
+
+def replay_changes(operations: Iterable[Tuple[str, List[csv_changelog.Event]]]) -> Dict[str, Any]:
+    """
+    Повторить операции журнала изменений (csv_changelog.read) поверх текущих данных.
+    Строки затронутых таблиц меняются в памяти, каждая таблица записывается один
+    раз, всё — одной операцией журнала. ValueError — операцию повторить нельзя
+    (например, data/ восстанавливалась из копии позже начала повтора).
+    Возвращает {"operations", "events", "last" (время последней операции), "rows"}.
+    """
+    _require_manager()
+    state: Dict[str, Dict[int, Dict[str, Any]]] = {}
+
+    def table(name: str) -> Dict[int, Dict[str, Any]]:
+        rows = state.get(name)
+        if rows is None:
+            rows = state[name] = {r["id"]: r for r in load_table(name)}
+        return rows
+
+    done = events = 0
+    last = None
+    with _transaction(), _gc_paused():
+        for ts, batch in operations:
+            for name, op, data in batch:
+                if op == "insert":
+                    table(name)[data["id"]] = _logged_row(name, data)
+                elif op == "update":
+                    row = table(name).get(data["id"])
+                    if row is None:
+                        raise ValueError(f"Журнал изменений, {ts}: нет записи id={data['id']} в {name}")
+                    row.update(_logged_row(name, data))
+                elif op == "stock":
+                    products = table("products")
+                    for pid, delta in data:
+                        p = products.get(pid)
+                        if p is not None:
+                            p["quantity"] += delta
+                elif op == "replace":
+                    state[name] = {int(r["id"]): _logged_row(name, r) for r in data}
+                elif op == "restore":
+                    raise ValueError(f"Журнал изменений, {ts}: данные восстанавливались из копии"
+                                     " — выберите копию, сделанную после этого")
+                else:
+                    raise ValueError(f"Журнал изменений, {ts}: неизвестная операция {op}")
+                events += 1
+            done += 1
+            last = ts
+        for name, rows in state.items():
+            _write_table(name, sorted(rows.values(), key=lambda r: int(r["id"])))
+            _changed(name, "replace")
+    return {"operations": done, "events": events, "last": last,
+            "rows": {name: len(rows) for name, rows in state.items()}}
+
+
+# --- Резервное копирование и восстановление (backup_db, restore_db) ---
+
+def field_types(name: str) -> Tuple[Tuple[str, str], ...]:
+    """Поля таблицы и их типы ("int", "str", "Decimal"); пусто для неизвестной таблицы."""
+    return _FIELD_TYPES.get(name, ())
+
+
+def stock_log_header(products: Path) -> str:
+    """Первая строка журнала остатков, относящая его к файлу products (сигнатура файла)."""
+    return _signature_line(_file_signature(products))
+
+
+@contextmanager
+def data_snapshot_lock():
+    """
+    Согласованное состояние data/ для снимка: прерванная операция откатывается,
+    затем держится разделяемая блокировка (запись ждёт, чтение — нет).
+    """
+    _recover()
+    with _lock():
+        yield
+
+
+def replace_tables(staging: Path, source: str, replay: Optional[Callable[[], None]] = None) -> List[str]:
+    """
+    Перенести файлы из staging (таблицы *.csv, секции, журнал остатков — пути
+    относительно data/) в data/ одной операцией журнала: os.replace каждого
+    файла, секции и журнал остатков, которых нет в staging, удаляются.
+    replay — повтор журнала изменений поверх перенесённых файлов в той же
+    операции; source — имя копии для отметки в журнале изменений.
+    Возвращает перенесённые таблицы.
+    """
+    staged = sorted(p.relative_to(staging).as_posix() for p in staging.rglob("*") if p.is_file())
+    tables = sorted({rel.partition("/")[0].removesuffix(".csv") for rel in staged if rel != STOCK_LOG})
+    with _transaction() as journal:
+        for rel in staged:
+            dest = DATA_DIR / rel
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            journal.replacing(dest)
+            os.replace(staging / rel, dest)
+        for name in PARTITIONED:
+            if name not in tables:
+                continue
+            for path in sorted(_partition_dir(name).glob("*.csv")):
+                if f"{name}/{path.name}" not in staged:
+                    _remove_file(path)
+            legacy = _table_path(name)
+            if f"{name}.csv" in staged:
+                # Внутри операции _recover не раскладывает файл старого формата сам
+                _write_table(name, _read_csv(name, legacy))
+            _remove_file(legacy)
+        if "products" in tables and STOCK_LOG not in staged:
+            _remove_file(_stock_log_path())
+        for directory in {(DATA_DIR / rel).parent for rel in staged}:
+            csv_journal.fsync_dir(directory)
+        for name in tables:
+            if name in TABLES:
+                _changed(name, "replace")
+        if replay is not None:
+            replay()
+        # Отметка в журнале изменений: повтор через восстановление невозможен
+        _log_change("*", "restore", {"source": source})
+    return tables
 
 
 # --- Хранимая процедура (отчёт по поставкам за период) ---
 
+@_dispatch
 def sp_deliveries_report(date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
     """Отчёт по поставкам за период (аналог хранимой процедуры)."""
-    deliveries = v_deliveries_full()
-    if date_from:
-        deliveries = [d for d in deliveries if (d.get("delivery_date") or "") >= date_from]
-    if date_to:
-        deliveries = [d for d in deliveries if (d.get("delivery_date") or "") <= date_to]
-    return deliveries
+    return _deliveries_full_by_date(date_from, date_to)
+
+
+if STORAGE_BACKEND != "csv":
+    set_backend(STORAGE_BACKEND)
+
+
+if __name__ == "__main__":
+    commands = ("rebuild-aggregates", "verify-aggregates")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("Использование: python csv_db.py rebuild-aggregates | verify-aggregates")
+        sys.exit(1)
+    if sys.argv[1] == "rebuild-aggregates":
+        rebuild_aggregates()
+        print("Агрегаты пересчитаны.")
+    else:
+        problems = verify_aggregates()
+        for p in problems:
+            print("  " + p)
+        print("Расхождений нет." if not problems else f"Найдено расхождений: {len(problems)}")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Постоянные индексы для CSV-таблиц: id → смещение строки в файле (байты)
+и вторичные индексы «значение поля → список id».
+Хранятся рядом с данными в data/_meta/: <таблица>.idx.json — основа,
+<таблица>.idx.log — записи о дописанных строках. Индекс действителен, пока
+сигнатура CSV-файла совпадает с записанной в последней строке журнала
+(или в основе, если журнал пуст).
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Какие поля индексируются (помимо id) для каждой таблицы
+INDEXED_KEYS: Dict[str, Tuple[str, ...]] = {
+    "products": ("category_id", "supplier_id"),
+    "deliveries": ("product_id", "supplier_id", "delivery_date"),
+}
+
+# После стольких дописанных записей журнал переносится в основу
+INDEX_LOG_COMPACT_LINES = 10000
+
+
+class TableIndex:
+    """Индекс одной таблицы: смещения строк по id и списки id по значениям полей."""
+
+    def __init__(self, header: List[str], keys: Sequence[str], sig: Optional[Tuple[int, ...]] = None):
+        self.header = header
+        self.keys = tuple(keys)
+        self.sig = sig
+        self.offsets: Dict[int, int] = {}
+        self.by_key: Dict[str, Dict[str, List[int]]] = {k: {} for k in self.keys}
+        self.log_lines = 0
+
+    def add(self, row_id: int, offset: int, values: Dict[str, str]) -> None:
+        self.offsets[row_id] = offset
+        for k in self.keys:
+            self.by_key[k].setdefault(values.get(k, ""), []).append(row_id)
+
+    def ids_for(self, key: str, value) -> List[int]:
+        """Список id строк, у которых поле key равно value."""
+        return self.by_key[key].get(str(value), [])
+
+
+def _paths(meta_dir: Path, name: str) -> Tuple[Path, Path]:
+    return meta_dir / f"{name}.idx.json", meta_dir / f"{name}.idx.log"
+
+
+def _read_record(f, first: bytes) -> bytes:
+    """Дочитать запись CSV, если поле в кавычках содержит перевод строки."""
+    line = first
+    while line.count(b'"') % 2:
+        more = f.readline()
+        if not more:
+            break
+        line += more
+    return line
+
+
+def _parse(raw: bytes) -> List[str]:
+    return next(csv.reader(io.StringIO(raw.decode("utf-8"), newline="")), [])
+
+
+def scan(path: Path) -> Tuple[List[str], Iterator[Tuple[int, List[str]]]]:
+    """Заголовок и итератор (смещение, поля) по строкам данных CSV."""
+    f = open(path, "rb")
+    header = _parse(_read_record(f, f.readline()))
+
+    def rows() -> Iterator[Tuple[int, List[str]]]:
+        with f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    return
+                raw = _read_record(f, line)
+                if raw.strip():
+                    yield offset, _parse(raw)
+
+    return header, rows()
+
+
+def build(path: Path, keys: Sequence[str], sig: Tuple[int, ...]) -> TableIndex:
+    """Построить индекс полным проходом по файлу (без приведения типов)."""
+    header, rows = scan(path)
+    idx = TableIndex(header, keys, sig)
+    id_pos = header.index("id")
+    key_pos = [(k, header.index(k)) for k in idx.keys if k in header]
+    for offset, fields in rows:
+        values = {k: fields[i] for k, i in key_pos if i < len(fields)}
+        idx.add(int(fields[id_pos]), offset, values)
+    return idx
+
+
+def save(idx: TableIndex, meta_dir: Path, name: str) -> None:
+    """Записать основу индекса и очистить журнал дописанных строк."""
+    base, log = _paths(meta_dir, name)
+    meta_dir.mkdir(parents=True, exist_ok=True)
+    data = {
+        "sig": list(idx.sig or ()),
+        "header": idx.header,
+        "keys": list(idx.keys),
+        "offsets": list(idx.offsets.items()),
+        "by_key": idx.by_key,
+    }
+    tmp = base.with_name(f"{base.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, base)
+    log.unlink(missing_ok=True)
+    idx.log_lines = 0
+
+
+def load(meta_dir: Path, name: str, sig: Tuple[int, ...]) -> Optional[TableIndex]:
+    """Прочитать индекс с диска. None — индекса нет или он не соответствует файлу."""
+    base, log = _paths(meta_dir, name)
+    try:
+        data = json.loads(base.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    idx = TableIndex(data["header"], data["keys"], tuple(data["sig"]))
+    idx.offsets = {int(i): off for i, off in data["offsets"]}
+    idx.by_key = {k: data["by_key"].get(k, {}) for k in idx.keys}
+    try:
+        with open(log, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row_id, offset, values, entry_sig = json.loads(line)
+                except ValueError:
+                    break  # недописанная запись — индекс будет проверен по сигнатуре
+                idx.add(row_id, offset, values)
+                idx.sig = tuple(entry_sig)
+                idx.log_lines += 1
+    except FileNotFoundError:
+        pass
+    if idx.sig != tuple(sig):
+        return None
+    return idx
+
+
+def append(idx: TableIndex, meta_dir: Path, name: str,
+           entries: Sequence[Tuple[int, int, Dict[str, str]]], sig: Tuple[int, ...]) -> None:
+    """
+    Учесть строки (id, смещение, поля), дописанные в конец CSV: в памяти и в журнале индекса.
+    Новая сигнатура файла пишется только в последнюю запись журнала, поэтому
+    недописанный журнал не совпадёт с файлом и индекс будет перестроен.
+    """
+    prev = list(idx.sig or ())
+    lines = []
+    for n, (row_id, offset, values) in enumerate(entries, 1):
+        values = {k: values.get(k, "") for k in idx.keys}
+        idx.add(row_id, offset, values)
+        entry_sig = list(sig) if n == len(entries) else prev
+        lines.append(json.dumps([row_id, offset, values, entry_sig], ensure_ascii=False))
+    idx.sig = tuple(sig)
+    if idx.log_lines + len(lines) >= INDEX_LOG_COMPACT_LINES:
+        save(idx, meta_dir, name)
+        return
+    _, log = _paths(meta_dir, name)
+    with open(log, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    idx.log_lines += len(lines)
+
+
+def read_at(path: Path, header: List[str], offsets: Sequence[int]) -> List[Dict[str, str]]:
+    """Прочитать строки по смещениям (одним открытием файла, по возрастанию смещений)."""
+    rows = []
+    with open(path, "rb") as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            fields = _parse(_read_record(f, f.readline()))
+            rows.append(dict(zip(header, fields)))
+    return rows
+
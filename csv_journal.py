@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал упреждающей записи (write-ahead) для операций над несколькими файлами
+(поставка: строка в deliveries + изменение остатка в products).
+Перед первым изменением файла в журнал data/_meta/journal/journal.log с fsync
+записывается, как вернуть файл: для дописываемого — прежний размер, для
+заменяемого или удаляемого — жёсткая ссылка на прежнее содержимое.
+Удаление журнала — момент фиксации операции. Если процесс прервался раньше,
+recover() при следующем запуске возвращает все файлы к состоянию до операции.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List
+
+JOURNAL = "journal.log"
+
+
+def fsync_dir(directory: Path) -> None:
+    """Сбросить на диск запись каталога (после os.replace / удаления). В Windows не требуется."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Журнал одной операции. Пути в записях — относительно каталога данных root."""
+
+    def __init__(self, root: Path, directory: Path):
+        self.root = root
+        self.directory = directory
+        self.entries: List[Dict[str, Any]] = []
+        self._appended = set()
+        self._replaced = set()
+
+    def _record(self, entry: Dict[str, Any]) -> None:
+        first = not self.entries
+        if first:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / JOURNAL, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if first:
+            fsync_dir(self.directory)
+        self.entries.append(entry)
+
+    def _rel(self, path: Path) -> str:
+        return os.path.relpath(path, self.root)
+
+    def appending(self, path: Path) -> None:
+        """Файл будет дописан: запомнить прежний размер (None — файла не было)."""
+        rel = self._rel(path)
+        if rel in self._appended or rel in self._replaced:
+            return
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = None
+        self._record({"op": "append", "path": rel, "size": size})
+        self._appended.add(rel)
+
+    def replacing(self, path: Path) -> None:
+        """Файл будет заменён (os.replace) или удалён: сохранить ссылку на прежнее содержимое."""
+        rel = self._rel(path)
+        if rel in self._replaced:
+            return
+        backup = None
+        if path.exists():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            backup = f"{len(self.entries)}.pre"
+            target = self.directory / backup
+            target.unlink(missing_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)  # ФС без жёстких ссылок
+            fsync_dir(self.directory)
+        self._record({"op": "replace", "path": rel, "backup": backup})
+        self._replaced.add(rel)
+
+    def commit(self) -> None:
+        """Зафиксировать операцию: удалить журнал и прежние версии файлов."""
+        if self.entries:
+            (self.directory / JOURNAL).unlink(missing_ok=True)
+            fsync_dir(self.directory)
+            _cleanup(self.directory)
+
+    def rollback(self) -> None:
+        """Вернуть файлы к состоянию до операции."""
+        _undo(self.root, self.directory, self.entries)
+        self.commit()
+
+
+def _undo(root: Path, directory: Path, entries: List[Dict[str, Any]]) -> None:
+    for entry in reversed(entries):
+        path = root / entry["path"]
+        if entry["op"] == "append":
+            if entry["size"] is None:
+                path.unlink(missing_ok=True)
+            elif path.exists():
+                os.truncate(path, entry["size"])
+        elif entry["backup"] is None:
+            path.unlink(missing_ok=True)
+        else:
+            os.replace(directory / entry["backup"], path)
+    if entries:
+        fsync_dir(root)
+
+
+def _cleanup(directory: Path) -> None:
+    for f in directory.glob("*.pre"):
+        f.unlink(missing_ok=True)
+
+
+def recover(root: Path, directory: Path) -> bool:
+    """Откатить операцию, прерванную до фиксации. True — был выполнен откат."""
+    log = directory / JOURNAL
+    try:
+        f = open(log, "r", encoding="utf-8")
+    except FileNotFoundError:
+        if directory.exists():
+            _cleanup(directory)
+        return False
+    entries = []
+    with f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break  # недописанная запись: файл ещё не изменялся
+    _undo(root, directory, entries)
+    log.unlink()
+    fsync_dir(directory)
+    _cleanup(directory)
+    return bool(entries)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Блокировка каталога данных между процессами (несколько окон GUI, импорт из CLI):
+разделяемая — на время чтения файлов, исключительная — на время операции записи.
+Блокируется файл data/_meta/lock через fcntl.flock; в Windows (msvcrt.locking)
+обе блокировки исключительные. Внутри процесса чтения разных потоков идут
+параллельно, запись ждёт их окончания (и новые чтения ждут ожидающую запись).
+Чтение внутри записи того же потока допускается; запись внутри чтения — ошибка:
+flock повышает разделяемую блокировку до исключительной не атомарно (снимает её),
+и между ними успела бы записать другая программа.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SHARED = "sh"
+EXCLUSIVE = "ex"
+
+
+class DirLock:
+    """Блокировка одного файла-замка. Мьютекс защищает только счётчики, не время удержания."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._pid = 0
+        self._held: Optional[str] = None
+        self._cond = threading.Condition()
+        self._owner: Optional[int] = None  # поток, держащий исключительную блокировку
+        self._depth = 0  # вложенность блоков владельца
+        self._readers: Dict[int, int] = {}  # поток -> число вложенных разделяемых блоков
+        self._writers_waiting = 0
+
+    def _open(self) -> None:
+        if self._fd is not None and self._pid == os.getpid():
+            return
+        # После fork дескриптор родителя разделяет с ним блокировку — открыть свой
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._pid = os.getpid()
+        self._held = None
+        self._owner = None
+        self._depth = 0
+        self._readers = {}
+        self._writers_waiting = 0
+
+    def _apply(self, mode: Optional[str]) -> None:
+        if fcntl is not None:
+            op = {None: fcntl.LOCK_UN, SHARED: fcntl.LOCK_SH, EXCLUSIVE: fcntl.LOCK_EX}[mode]
+            fcntl.flock(self._fd, op)
+        elif mode is None:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        self._held = mode
+
+    def _acquire(self, exclusive: bool) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            self._open()
+            if self._owner == me:
+                self._depth += 1
+            elif me in self._readers:
+                if exclusive:
+                    raise RuntimeError(f"Запись внутри чтения: {self.path} уже заблокирован этим потоком для чтения")
+                self._readers[me] += 1
+            elif exclusive:
+                self._writers_waiting += 1
+                try:
+                    while self._owner is not None or self._readers:
+                        self._cond.wait()
+                    self._apply(EXCLUSIVE)
+                finally:
+                    self._writers_waiting -= 1
+                self._owner, self._depth = me, 1
+            else:
+                while self._owner is not None or self._writers_waiting:
+                    self._cond.wait()
+                if not self._readers:
+                    self._apply(SHARED)
+                self._readers[me] = 1
+
+    def _release(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth -= 1
+                if self._depth:
+                    return
+                self._owner = None
+            else:
+                self._readers[me] -= 1
+                if self._readers[me]:
+                    return
+                del self._readers[me]
+                if self._readers:
+                    return
+            self._apply(None)
+            self._cond.notify_all()
+
+    def held(self) -> Optional[str]:
+        """Режим, в котором блокировку держит текущий поток (SHARED, EXCLUSIVE или None)."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._pid != os.getpid():
+                return None
+            if self._owner == me:
+                return EXCLUSIVE
+            return SHARED if me in self._readers else None
+
+    @contextmanager
+    def hold(self, exclusive: bool = False):
+        """
+        Держать блокировку на время блока with (разделяемую или исключительную).
+        RuntimeError — исключительная запрошена потоком, который держит разделяемую.
+        """
+        self._acquire(exclusive)
+        try:
+            yield
+        finally:
+            self._release()
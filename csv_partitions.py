@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Секционирование таблицы по месяцам даты: data/deliveries/ГГГГ-ММ.csv
+(строки без корректной даты — undated.csv) и манифест _manifest.json
+с диапазоном дат, диапазоном id и числом строк каждой секции.
+Запрос за период открывает только секции, пересекающиеся с периодом.
+Запись манифеста хранит сигнатуру файла секции: если файл изменён в обход
+csv_db, запись пересчитывается чтением этой секции.
+"""
+
+import csv
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+UNDATED = "undated"
+MANIFEST = "_manifest.json"
+
+# Запись манифеста: {"sig": [...], "rows": n, "min_date", "max_date", "min_id", "max_id"}
+Entry = Dict[str, Any]
+
+
+def partition_key(date: str) -> str:
+    """Дата 'ГГГГ-ММ-ДД' → ключ секции 'ГГГГ-ММ' (undated, если дата пустая или некорректная)."""
+    date = date or ""
+    if len(date) >= 7 and date[4] == "-" and date[:4].isdigit() and date[5:7].isdigit():
+        return date[:7]
+    return UNDATED
+
+
+def list_keys(directory: Path) -> List[str]:
+    """Ключи существующих секций (по возрастанию; undated — последней)."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    keys = [n[:-4] for n in names if n.endswith(".csv")]
+    return sorted(keys, key=lambda k: (k == UNDATED, k))
+
+
+def new_entry() -> Entry:
+    return {"sig": [], "rows": 0, "min_date": None, "max_date": None, "min_id": None, "max_id": None}
+
+
+def note_row(entry: Entry, row_id: int, date: str) -> None:
+    """Учесть строку секции в записи манифеста."""
+    entry["rows"] += 1
+    for lo, hi, value in (("min_date", "max_date", date or ""), ("min_id", "max_id", row_id)):
+        if entry[lo] is None or value < entry[lo]:
+            entry[lo] = value
+        if entry[hi] is None or value > entry[hi]:
+            entry[hi] = value
+
+
+def scan_entry(path: Path, date_field: str = "delivery_date") -> Entry:
+    """Запись манифеста полным чтением файла секции."""
+    entry = new_entry()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            note_row(entry, int(row["id"]), row.get(date_field) or "")
+    return entry
+
+
+def read_manifest(directory: Path) -> Dict[str, Entry]:
+    try:
+        return json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_manifest(directory: Path, manifest: Dict[str, Entry]) -> None:
+    path = directory / MANIFEST
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def manifest(directory: Path, sig_of: Callable[[Path], Optional[Tuple[int, ...]]]) -> Dict[str, Entry]:
+    """Манифест, сверенный с файлами секций: устаревшие записи пересчитываются, лишние удаляются."""
+    stored = read_manifest(directory)
+    result: Dict[str, Entry] = {}
+    for key in list_keys(directory):
+        path = directory / f"{key}.csv"
+        sig = sig_of(path)
+        entry = stored.get(key)
+        if entry is None or tuple(entry["sig"]) != sig:
+            entry = scan_entry(path)
+            entry["sig"] = list(sig or ())
+        result[key] = entry
+    if result != stored:
+        write_manifest(directory, result)
+    return result
+
+
+def overlaps(entry: Entry, date_from: Optional[str], date_to: Optional[str]) -> bool:
+    """Может ли секция содержать строки с датой в [date_from, date_to]."""
+    if not entry["rows"]:
+        return False
+    if date_from and entry["max_date"] < date_from:
+        return False
+    if date_to and entry["min_date"] > date_to:
+        return False
+    return True
+
+
+def group_rows(rows: Iterable[Dict[str, Any]], date_field: str = "delivery_date") -> Dict[str, List[Dict[str, Any]]]:
+    """Разложить строки по секциям (порядок строк внутри секции сохраняется)."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        groups.setdefault(partition_key(str(r.get(date_field) or "")), []).append(r)
+    return groups
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Двоичные снимки частей таблиц для быстрого открытия: data/_meta/<часть>.snap.
+Снимок хранит уже разобранные столбцы: целые — массивом array('i') или ('q'),
+строки — таблицей строк в UTF-8 с разделителем NUL; столбец с частыми повторами
+(даты, created_at) — таблицей различных строк и массивом их номеров. Файл
+открывается через mmap, столбцы копируются из него целиком, без разбора CSV.
+CSV остаётся источником данных: снимок действителен, пока сигнатура CSV-файла
+совпадает с записанной в снимке, иначе он игнорируется и перезаписывается.
+
+Формат: MAGIC, длина заголовка (4 байта, little-endian), заголовок JSON
+({"sig", "rows", "byteorder", "columns": [{"name", "kind", "blobs"}]}, где blobs —
+[смещение от начала файла, размер, код типа array или "s" для строк]), затем данные.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MAGIC = b"CSVSNAP1"
+INT = "int"
+STR = "str"
+_SEP = "\x00"
+
+# Столбцы снимка: имя → (вид INT/STR, значения)
+Columns = Dict[str, Tuple[str, Sequence[Any]]]
+
+
+def path_for(meta_dir: Path, name: str) -> Path:
+    return meta_dir / f"{name}.snap"
+
+
+def _typecode(values: Sequence[int]) -> str:
+    if not values or (min(values) >= -2 ** 31 and max(values) < 2 ** 31):
+        return "i"
+    return "q"
+
+
+def _strings(values: Sequence[str]) -> Optional[bytes]:
+    """Таблица строк; None — строка содержит NUL и не представима."""
+    text = _SEP.join(values)
+    if text.count(_SEP) != max(len(values) - 1, 0):
+        return None
+    return text.encode("utf-8")
+
+
+def save(meta_dir: Path, name: str, sig: Optional[Tuple[int, ...]], columns: Columns) -> bool:
+    """
+    Записать снимок (через временный файл и os.replace). False — снимок не записан:
+    нет сигнатуры CSV или строка содержит NUL (не представима в таблице строк).
+    """
+    if sig is None:
+        return False
+    rows = len(next(iter(columns.values()))[1]) if columns else 0
+    blobs: List[bytes] = []
+    described = []
+    for col, (kind, values) in columns.items():
+        if len(values) != rows:
+            raise ValueError(f"Столбец {col}: {len(values)} значений, ожидалось {rows}")
+        parts: List[Tuple[bytes, str]] = []
+        if kind == INT:
+            code = _typecode(values)
+            parts.append((array(code, values).tobytes(), code))
+        else:
+            distinct = dict.fromkeys(values)
+            if len(distinct) * 2 <= rows:
+                number = {v: i for i, v in enumerate(distinct)}
+                code = _typecode((0, len(distinct)))
+                parts.append((_strings(list(distinct)), "s"))
+                parts.append((array(code, map(number.__getitem__, values)).tobytes(), code))
+            else:
+                parts.append((_strings(values), "s"))
+            if parts[0][0] is None:
+                return False
+        described.append({"name": col, "kind": kind, "blobs": [[0, len(data), code] for data, code in parts]})
+        blobs.extend(data for data, _ in parts)
+    meta = {"sig": list(sig), "rows": rows, "byteorder": sys.byteorder, "columns": described}
+    # Данные выравниваются по 8 байт; смещения известны после размещения заголовка,
+    # место под заголовок берётся с запасом на длину чисел-смещений
+    head = json.dumps(meta).encode("utf-8")
+    offset = len(MAGIC) + 4 + len(head) + 16 * len(blobs) + 8
+    offset += -offset % 8
+    start = offset
+    for blob_meta in (b for d in described for b in d["blobs"]):
+        blob_meta[0] = offset
+        offset += blob_meta[1] + (-blob_meta[1] % 8)
+    head = json.dumps(meta).encode("utf-8")
+    path = path_for(meta_dir, name)
+    meta_dir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head)
+        f.write(b"\0" * (start - f.tell()))
+        for data in blobs:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+    os.replace(tmp, path)
+    return True
+
+
+def _read_meta(mm) -> Optional[Dict[str, Any]]:
+    if mm[:len(MAGIC)] != MAGIC:
+        return None
+    (size,) = struct.unpack_from("<I", mm, len(MAGIC))
+    try:
+        return json.loads(mm[len(MAGIC) + 4:len(MAGIC) + 4 + size])
+    except ValueError:
+        return None
+
+
+def _open(meta_dir: Path, name: str, sig: Optional[Tuple[int, ...]]):
+    """(файл, mmap, заголовок) действительного снимка или None."""
+    if sig is None:
+        return None
+    try:
+        f = open(path_for(meta_dir, name), "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # пустой файл
+        f.close()
+        return None
+    meta = _read_meta(mm)
+    if meta is None or meta["sig"] != list(sig) or meta["byteorder"] != sys.byteorder:
+        mm.close()
+        f.close()
+        return None
+    return f, mm, meta
+
+
+def row_count(meta_dir: Path, name: str, sig: Optional[Tuple[int, ...]]) -> Optional[int]:
+    """Число строк по заголовку снимка (None — снимка нет или он устарел)."""
+    opened = _open(meta_dir, name, sig)
+    if opened is None:
+        return None
+    f, mm, meta = opened
+    with f, mm:
+        return meta["rows"]
+
+
+def _blob(mm, blob: List[Any]) -> Sequence[Any]:
+    offset, size, code = blob
+    if offset + size > len(mm):
+        raise ValueError("Снимок обрезан")
+    if code == "s":
+        return str(mm[offset:offset + size], "utf-8").split(_SEP)
+    values = array(code)
+    values.frombytes(mm[offset:offset + size])
+    return values
+
+
+def load(meta_dir: Path, name: str, sig: Optional[Tuple[int, ...]]) -> Optional[Dict[str, Sequence[Any]]]:
+    """Столбцы снимка: INT — array, STR — список строк. None — снимка нет, он устарел или повреждён."""
+    opened = _open(meta_dir, name, sig)
+    if opened is None:
+        return None
+    f, mm, meta = opened
+    with f, mm:
+        n = meta["rows"]
+        columns: Dict[str, Sequence[Any]] = {}
+        try:
+            for d in meta["columns"]:
+                blobs = [_blob(mm, b) for b in d["blobs"]]
+                if len(blobs) == 2:  # таблица различных строк и номера строк в ней
+                    distinct, numbers = blobs
+                    values = list(map(distinct.__getitem__, numbers))
+                else:
+                    values = blobs[0] if n or d["kind"] == INT else []
+                if len(values) != n:
+                    return None
+                columns[d["name"]] = values
+        except (ValueError, IndexError, UnicodeDecodeError):
+            return None
+        return columns
+
+
+def remove(meta_dir: Path, name: str) -> None:
+    try:
+        os.remove(path_for(meta_dir, name))
+    except FileNotFoundError:
+        pass
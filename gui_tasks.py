@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновые задачи GUI: загрузка таблиц и расчёт представлений в пуле потоков.
+Tk не потокобезопасен, поэтому результаты передаются в главный поток через
+очередь, которую опрашивает after() (только пока есть незавершённые задачи).
+Задачи именуются ключом: новая задача с тем же ключом отменяет предыдущую —
+её результат отбрасывается (смена вида в списке «Данные» во время загрузки).
+post() передаёт в главный поток вызов из потока задачи (например, уведомление
+csv_db о записи, выполненной в фоне).
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+POLL_MS = 16          # ~60 кадров/с
+FRAME_BUDGET = 0.008  # доля кадра на обработку результатов
+
+
+class BackgroundTasks:
+    """Пул фоновых задач, привязанный к окну Tk (widget — источник after())."""
+
+    def __init__(self, widget, workers: int = 2):
+        self._widget = widget
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gui-load")
+        self._done: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._calls: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._gens: Dict[str, int] = {}
+        self._pending: Dict[str, Future] = {}
+        self._polling = False
+        self._closed = False
+
+    def submit(self, key: str, func: Callable[[], Any], on_done: Callable[[Any], None],
+               on_error: Optional[Callable[[BaseException], None]] = None) -> int:
+        """Выполнить func в пуле; on_done / on_error вызываются в главном потоке. Возвращает поколение задачи."""
+        gen = self.cancel(key)
+        fut = self._pool.submit(func)
+        self._pending[key] = fut
+        fut.add_done_callback(lambda f: self._done.put((key, gen, f, on_done, on_error)))
+        self._schedule()
+        return gen
+
+    def post(self, func: Callable[..., Any], *args: Any) -> None:
+        """
+        Вызвать func(*args) в главном потоке: сразу, если вызов из него, иначе при
+        ближайшем опросе (вызов из потока пула — пока его задача не завершена).
+        """
+        if threading.current_thread() is threading.main_thread():
+            func(*args)
+        elif not self._closed:
+            self._calls.put((func, args))
+
+    def cancel(self, key: str) -> int:
+        """Отменить задачу по ключу. Возвращает новое поколение ключа."""
+        gen = self._gens.get(key, 0) + 1
+        self._gens[key] = gen
+        old = self._pending.pop(key, None)
+        if old is not None:
+            old.cancel()  # ещё не начата — не выполнится; уже идёт — результат будет отброшен
+        return gen
+
+    def current(self, key: str, gen: int) -> bool:
+        """Актуально ли поколение gen (не было ли новой задачи или отмены по ключу)."""
+        return not self._closed and self._gens.get(key) == gen
+
+    def busy(self, key: str) -> bool:
+        return key in self._pending
+
+    def shutdown(self) -> None:
+        """Остановить пул (при закрытии окна): незапущенные задачи отменяются."""
+        self._closed = True
+        self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _schedule(self) -> None:
+        if not self._polling and not self._closed:
+            self._polling = True
+            self._widget.after(POLL_MS, self._poll)
+
+    def _poll(self) -> None:
+        self._polling = False
+        if self._closed:
+            return
+        deadline = time.perf_counter() + FRAME_BUDGET
+        # Вызовы из задач — раньше их результатов: задача ставит их до завершения
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        while time.perf_counter() < deadline:
+            try:
+                key, gen, fut, on_done, on_error = self._done.get_nowait()
+            except queue.Empty:
+                break
+            if fut.cancelled() or not self.current(key, gen):
+                continue
+            self._pending.pop(key, None)
+            exc = fut.exception()
+            if exc is None:
+                on_done(fut.result())
+            elif on_error is not None:
+                on_error(exc)
+        if self._pending or not self._done.empty():
+            self._schedule()
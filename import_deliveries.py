@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетный импорт поставок из CSV-файла со столбцами product_id, supplier_id,
+quantity и (необязательно) delivery_date в формате ГГГГ-ММ-ДД.
+Пакет проверяется целиком и записывается целиком или не записывается вовсе.
+Запуск: python import_deliveries.py <файл.csv>
+"""
+
+import csv
+import sys
+from pathlib import Path
+
+from csv_db import set_role, add_deliveries_bulk, MANAGER
+
+
+def run_import(path: Path) -> dict:
+    """Импортировать поставки из файла. Возвращает статистику add_deliveries_bulk."""
+    if not path.is_file():
+        print(f"Файл не найден: {path}")
+        sys.exit(1)
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        try:
+            stats = add_deliveries_bulk(csv.DictReader(f))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    if stats["count"]:
+        print(f"Импортировано поставок: {stats['count']} (id {stats['first_id']}–{stats['last_id']})")
+    else:
+        print("В файле нет поставок.")
+    print(f"Время: {stats['seconds']:.3f} с, {stats['rows_per_sec']:,.0f} строк/с")
+    return stats
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python import_deliveries.py <файл.csv>")
+        print("Столбцы: product_id, supplier_id, quantity[, delivery_date]")
+        sys.exit(1)
+    set_role(MANAGER)
+    run_import(Path(sys.argv[1]))
@@ -28,21 +28,28 @@ def run_init():
 
 def run_backup():
     from backup_db import run_backup
-    run_backup()
+    try:
+        run_backup()
+    except FileNotFoundError as e:
+        print(f"  Ошибка: {e}")
 
 
 def run_restore():
     path = input("  Введите папку бэкапа (например backups/products_db_20250216_120000): ").strip()
-    if not path:
+    moment = input("  Момент времени ГГГГ-ММ-ДД ЧЧ:ММ (Enter — на момент копии): ").strip()
+    if not path and not moment:
         print("  Отменено.")
         return
-    from restore_db import run_restore
+    from restore_db import run_restore, parse_moment
     from pathlib import Path
     from config import PROJECT_DIR
-    p = Path(path)
-    if not p.is_absolute():
+    p = Path(path) if path else None
+    if p is not None and not p.is_absolute():
         p = PROJECT_DIR / p
-    run_restore(p)
+    try:
+        run_restore(p, parse_moment(moment) if moment else None)
+    except ValueError as e:
+        print(f"  Ошибка: {e}")
 
 
 def run_performance():
@@ -3,13 +3,35 @@
 Анализ производительности запросов к БД на CSV.
 Замеряет время выполнения представлений и запросов, формирует отчёт.
 Запуск: python performance_analysis.py
+Замер агрегации на синтетических данных: python performance_analysis.py bench-agg
+Замер разбора products.csv и чтения снимка: python performance_analysis.py bench-parse [строк]
+Проверка одновременной записи из нескольких процессов:
+python performance_analysis.py stress [процессов] [поставок_на_процесс]
+Побайтовая сверка резервных копий, сделанных во время записи:
+python performance_analysis.py check-backups [копий] [товаров]
 """
 
+import contextlib
+import csv
+import filecmp
+import io
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
 import time
+import tracemalloc
+from array import array
 from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
 
-from config import REPORTS_DIR
+import aggregates
+import backup_db
+import csv_db
+import csv_snapshot
+from config import COLUMNAR_PRODUCTS, DATA_DIR, REPORTS_DIR
 from csv_db import (
     v_products_full,
     v_deliveries_full,
@@ -20,7 +42,12 @@ from csv_db import (
     load_table,
     build_index_by_id,
     build_index_by_key,
+    cache_stats,
+    clear_cache,
+    get_backend,
+    set_columnar,
 )
+from columnar import ProductColumns
 
 
 def measure(name: str, func, *args, **kwargs):
@@ -32,12 +59,15 @@ def measure(name: str, func, *args, **kwargs):
 
 
 def main():
+    if not DATA_DIR.exists():
+        print("Каталог data/ не найден. Сначала выполните: python create_database.py")
+        sys.exit(1)
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
     report_path = REPORTS_DIR / f"performance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     lines = []
     lines.append("=" * 60)
     lines.append("ОТЧЁТ ПО АНАЛИЗУ ПРОИЗВОДИТЕЛЬНОСТИ ЗАПРОСОВ")
-    lines.append("БД: учёт товаров (CSV)")
+    lines.append(f"БД: учёт товаров (движок: {get_backend()})")
     lines.append(f"Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     lines.append("=" * 60)
 
@@ -72,9 +102,32 @@ def main():
     lines.append("Загрузка таблиц и индексов")
     lines.append("-" * 60)
     for table in ("products", "categories", "suppliers", "deliveries"):
+        clear_cache()
         rows, t_load = measure("load", load_table, table)
+        _, t_cached = measure("load", load_table, table)
         _, t_idx = measure("index", build_index_by_id, rows)
-        lines.append(f"  {table}: загрузка {t_load:.4f} с, индекс по id {t_idx:.4f} с, строк {len(rows)}")
+        lines.append(f"  {table}: загрузка {t_load:.4f} с, из кэша {t_cached:.4f} с, индекс по id {t_idx:.4f} с, строк {len(rows)}")
+    stats = cache_stats()
+    lines.append(f"  Кэш таблиц: попаданий {stats['hits']}, промахов {stats['misses']}, перечитываний {stats['reloads']}")
+
+    # Память под products в кэше: список словарей и столбцовое представление
+    lines.append("")
+    lines.append("-" * 60)
+    lines.append("Память под таблицу products (кэш после v_stock_by_category)")
+    lines.append("-" * 60)
+    n_products = len(load_table("products"))
+    for columnar in (False, True):
+        set_columnar(columnar)
+        clear_cache()
+        tracemalloc.start()
+        _, elapsed = measure("stock", v_stock_by_category)
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        per_row = used / n_products if n_products else 0
+        kind = "столбцы (ProductColumns)" if columnar else "словари"
+        lines.append(f"  {kind}: {used / 1024:.1f} КБ, ~{per_row:.0f} байт на товар, v_stock_by_category {elapsed:.4f} с")
+    set_columnar(COLUMNAR_PRODUCTS)
+    clear_cache()
 
     lines.append("")
     lines.append("=" * 60)
@@ -84,16 +137,33 @@ def main():
 1. Индексы: в csv_db используются индексы в памяти (build_index_by_id,
    build_index_by_key) для быстрого поиска по id, category_id, supplier_id.
    Запросы по категории/поставщику выполняются через индекс, без полного перебора.
+   Индексы по id (смещение строки), category_id, supplier_id, product_id и
+   delivery_date хранятся на диске (data/_meta/*.idx.json, модуль csv_index),
+   поэтому get_row и выборка по категории читают только нужные строки CSV.
 
 2. Представления (VIEW): v_products_full и v_deliveries_full делают один проход
-   по основной таблице и подстановку по индексам — аналог JOIN. При росте данных
-   можно кэшировать загруженные таблицы в памяти на время сессии.
+   по основной таблице и подстановку по индексам — аналог JOIN. Загруженные
+   таблицы кэшируются на время сессии и перечитываются только при изменении файла.
+   Для больших каталогов включите COLUMNAR_PRODUCTS в config.py: products хранится
+   по столбцам (массивы чисел, цены в копейках), память на товар в разы меньше.
+   Остатки по категориям и поставки по поставщикам — материализованные агрегаты
+   (data/_meta/aggregates.json), которые обновляются на дельту при каждой записи.
+   Поставки хранятся по месяцам (data/deliveries/ГГГГ-ММ.csv): отчёт за период
+   и v_deliveries_full(days_back) читают только секции, попадающие в период.
+   После каждой записи рядом с CSV сохраняется двоичный снимок части таблицы
+   (data/_meta/*.snap, модуль csv_snapshot): при запуске таблицы читаются из него,
+   а не разбором CSV; устаревший снимок (файл изменён) пропускается.
 
-3. Резервное копирование: backup_db.py копирует папку data/ в backups/.
-   Рекомендуется запускать по расписанию.
+3. Резервное копирование: backup_db.py делает инкрементную копию — манифест
+   в backups/products_db_*, части файлов в общем хранилище backups/chunks/;
+   неизменённые файлы не перечитываются. По расписанию копии делает
+   backup_daemon.py (BACKUP_SCHEDULE, BACKUP_RATE_MB и сроки хранения — в
+   config.py): data/ блокируется только на мгновенный снимок, старые копии и
+   ненужные части удаляются. Восстановление на момент времени — restore_db.py --until.
 
-4. Для больших объёмов данных рассмотрите хранение в SQLite или PostgreSQL
-   с индексами на диске.
+4. Для больших объёмов данных используйте движок SQLite (sqlite_db.py):
+   перенос — python sqlite_db.py migrate, затем STORAGE_BACKEND = "sqlite"
+   в config.py. JOIN, агрегаты и отчёты по датам выполняются по индексам.
 """)
     report_text = "\n".join(lines)
     report_path.write_text(report_text, encoding="utf-8")
@@ -101,5 +171,253 @@ def main():
     print(report_text[:1800] + "\n... (см. файл полностью)")
 
 
+def bench_aggregation(sizes=(100_000, 1_000_000, 10_000_000)) -> None:
+    """
+    Замер группировки поставок (aggregates.group_by) на синтетических столбцах
+    разного размера: время на строку должно оставаться примерно постоянным.
+    Без NumPy размеры больше 1 млн пропускаются (чистый Python слишком долог).
+    """
+    print(f"Агрегация поставок, NumPy: {'да' if aggregates.has_numpy() else 'нет'}")
+    for n in sizes:
+        if not aggregates.has_numpy() and n > 1_000_000:
+            print(f"  {n:>11,} строк: пропуск (нужен NumPy)")
+            continue
+        rnd = random.Random(n)
+        if aggregates.has_numpy():
+            gen = aggregates.np.random.default_rng(n)
+            supplier = array("q", gen.integers(1, 1_000, n).tobytes())
+            product = array("q", gen.integers(1, 100_000, n).tobytes())
+            qty = array("q", gen.integers(1, 500, n).tobytes())
+            dates = array("q", (20200101 + gen.integers(0, 6, n) * 10000 + gen.integers(1, 13, n) * 100).tobytes())
+        else:
+            supplier = array("q", (rnd.randint(1, 999) for _ in range(n)))
+            product = array("q", (rnd.randint(1, 99_999) for _ in range(n)))
+            qty = array("q", (rnd.randint(1, 499) for _ in range(n)))
+            dates = array("q", (20200101 + rnd.randint(0, 5) * 10000 + rnd.randint(1, 12) * 100 for _ in range(n)))
+        for label, keys in (
+            ("по поставщику", supplier),
+            ("по товару", product),
+            ("по месяцу", aggregates.bucket_dates(dates, "month")),
+        ):
+            _, elapsed = measure(label, aggregates.group_by, keys, qty)
+            print(f"  {n:>11,} строк, {label:<14}: {elapsed:.4f} с ({elapsed / n * 1e9:.1f} нс/строку)")
+
+
+def _write_products_csv(path: Path, n: int) -> None:
+    """Синтетический products.csv из n строк (формат create_database)."""
+    rnd = random.Random(n)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "name", "category_id", "supplier_id", "price", "quantity", "created_at"])
+        for i in range(1, n + 1):
+            w.writerow([i, f"Товар {rnd.randint(1, 99_999)}", rnd.randint(1, 50), rnd.randint(1, 200),
+                        f"{rnd.randint(1, 99_999)}.{rnd.randint(0, 99):02d}", rnd.randint(0, 500),
+                        "2025-01-01 10:00:00"])
+
+
+def bench_parse(n: int = 1_000_000) -> None:
+    """
+    Разбор products.csv из n строк: прежний путь (csv.DictReader + _cast_row),
+    быстрый (csv.reader и план столбцов заголовка, csv_db._read_csv)
+    и столбцовый (ProductColumns: цена в копейках, Decimal — только при чтении цены);
+    для сравнения — чтение тех же строк из двоичного снимка (csv_snapshot).
+    """
+    def dict_reader(path):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return [csv_db._cast_row("products", row) for row in csv.DictReader(f)]
+
+    def columnar(path):
+        with open(path, "r", encoding="utf-8", newline="") as f, csv_db._gc_paused():
+            reader = csv.reader(f)
+            return ProductColumns.from_records(next(reader, []), reader)
+
+    def snapshot(path):
+        columns = csv_snapshot.load(path.parent, "products", csv_db._file_signature(path))
+        with csv_db._gc_paused():
+            return list(csv_db._column_rows("products", columns))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "products.csv"
+        _write_products_csv(path, n)
+        csv_snapshot.save(path.parent, "products", csv_db._file_signature(path),
+                          csv_db._snapshot_columns("products", csv_db._read_csv("products", path)))
+        size = csv_snapshot.path_for(path.parent, "products").stat().st_size
+        print(f"Разбор products.csv: {n:,} строк, {path.stat().st_size / 2**20:.0f} МБ (снимок {size / 2**20:.0f} МБ)")
+        base = None
+        for label, func in (
+            ("DictReader + _cast_row", dict_reader),
+            ("быстрый разбор (словари)", lambda p: csv_db._read_csv("products", p)),
+            ("столбцы, Decimal по запросу", columnar),
+            ("двоичный снимок (словари)", snapshot),
+        ):
+            rows, elapsed = measure(label, func, path)
+            assert len(rows) == n
+            base = base or elapsed
+            print(f"  {label:<28}: {elapsed:6.2f} с, {n / elapsed:>10,.0f} строк/с (x{base / elapsed:.1f})")
+            del rows
+
+
+def _stress_worker(args) -> dict:
+    """Процесс стресс-проверки: count поставок подряд в каталог data_dir."""
+    data_dir, count, seed, product_ids, supplier_ids = args
+    csv_db.set_data_dir(Path(data_dir))
+    csv_db.set_role(csv_db.MANAGER)
+    rnd = random.Random(seed)
+    ids, stock = [], {}
+    for _ in range(count):
+        pid = rnd.choice(product_ids)
+        qty = rnd.randint(1, 10)
+        row = csv_db.add_delivery(pid, rnd.choice(supplier_ids), qty)
+        ids.append(row["id"])
+        stock[pid] = stock.get(pid, 0) + qty
+    return {"ids": ids, "stock": stock}
+
+
+def stress_concurrency(processes: int = 8, per_process: int = 50) -> bool:
+    """
+    Несколько процессов одновременно добавляют поставки во временную копию data/.
+    Проверяется, что ни одно изменение остатка не потеряно, id поставок
+    не повторяются, материализованные агрегаты сходятся с пересчётом.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        shutil.copytree(DATA_DIR, data_dir, ignore=shutil.ignore_patterns("_meta"))
+        csv_db.set_data_dir(data_dir)
+        try:
+            before = {p["id"]: p["quantity"] for p in load_table("products")}
+            n_before = len(load_table("deliveries"))
+            suppliers = [s["id"] for s in load_table("suppliers")]
+            csv_db.rebuild_aggregates()
+            jobs = [(str(data_dir), per_process, seed, list(before), suppliers) for seed in range(processes)]
+            start = time.perf_counter()
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(_stress_worker, jobs)
+            elapsed = time.perf_counter() - start
+
+            expected = dict(before)
+            ids = []
+            for r in results:
+                ids.extend(r["ids"])
+                for pid, qty in r["stock"].items():
+                    expected[pid] += qty
+            actual = {p["id"]: p["quantity"] for p in load_table("products")}
+            deliveries = load_table("deliveries")
+            problems = []
+            if len(set(ids)) != len(ids):
+                problems.append(f"повторяющиеся id поставок: {len(ids) - len(set(ids))}")
+            if len(deliveries) != n_before + len(ids):
+                problems.append(f"поставок {len(deliveries)}, ожидалось {n_before + len(ids)}")
+            lost = {pid: expected[pid] - actual.get(pid, 0) for pid in expected if expected[pid] != actual.get(pid)}
+            if lost:
+                problems.append(f"расхождение остатков (товар: потеряно): {lost}")
+            problems.extend(csv_db.verify_aggregates())
+        finally:
+            csv_db.set_data_dir(DATA_DIR)
+    total = processes * per_process
+    print(f"Процессов: {processes}, поставок: {total}, время {elapsed:.2f} с ({total / elapsed:,.0f} поставок/с)")
+    for p in problems:
+        print(f"  ОШИБКА: {p}")
+    print("Потерянных изменений нет." if not problems else "Проверка не пройдена.")
+    return not problems
+
+
+def _backup_writer(data_dir: str, stop, seed: int) -> None:
+    """Процесс проверки копий: дописывает поставки, переписывает products.csv и секции поставок."""
+    csv_db.set_data_dir(Path(data_dir))
+    csv_db.set_role(csv_db.MANAGER)
+    rnd = random.Random(seed)
+    products = [p["id"] for p in load_table("products")]
+    suppliers = [s["id"] for s in load_table("suppliers")]
+    deliveries = []
+    while not stop.is_set():
+        op = rnd.random()
+        if op < 0.7 or not deliveries:
+            row = csv_db.add_delivery(rnd.choice(products), rnd.choice(suppliers), rnd.randint(1, 10))
+            deliveries.append(row["id"])
+        elif op < 0.85:
+            price = Decimal(f"{rnd.randint(1, 9_999_999)}.{rnd.randint(0, 99):02d}")
+            csv_db.update_row("products", rnd.choice(products), {"price": price})
+        else:
+            csv_db.update_delivery(rnd.choice(deliveries), quantity=rnd.randint(1, 10))
+
+
+def _reuse_inodes(backup_path: Path, data_dir: Path) -> None:
+    """
+    Имитация повторного использования inode (ext4 отдаёт номер файла, заменённого
+    через os.replace, следующему новому файлу): в манифесте копии номер inode
+    каждого файла заменяется текущим. Переписанный файл выглядит для следующей
+    копии «тем же» — она не должна на это полагаться.
+    """
+    manifest = backup_db.read_manifest(backup_path)
+    for rel, entry in manifest["files"].items():
+        if (data_dir / rel).exists():
+            entry["sig"][2] = (data_dir / rel).stat().st_ino
+    backup_db._write_manifest(backup_path / backup_db.MANIFEST, manifest)
+
+
+def check_backups(backups: int = 5, products: int = 200_000) -> bool:
+    """
+    Резервные копии временной копии data/ (products.csv на products строк), пока
+    другой процесс дописывает и переписывает её файлы. Каждая копия распаковывается
+    и сверяется побайтово со снимком, с которого она сделана (run_backup(snapshot_to=...)).
+    Копии инкрементные: проверяется и повторное использование частей прошлой копии,
+    в том числе когда переписанный файл получил прежний inode (_reuse_inodes).
+    """
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        data_dir = root / "data"
+        shutil.copytree(DATA_DIR, data_dir, ignore=shutil.ignore_patterns("_meta"))
+        _write_products_csv(data_dir / "products.csv", products)
+        csv_db.set_data_dir(data_dir)
+        stop = multiprocessing.Event()
+        writer = multiprocessing.Process(target=_backup_writer, args=(str(data_dir), stop, 0))
+        pause = random.Random(1)
+        try:
+            csv_db.rebuild_aggregates()
+            writer.start()
+            print(f"Копий: {backups}, товаров: {products:,}; запись идёт во время копий")
+            for i in range(backups):
+                time.sleep(pause.uniform(0.5, 3))  # между копиями файлы меняются
+                if i:
+                    _reuse_inodes(root / "backups" / f"products_db_{i - 1}", data_dir)
+                snapshot = root / f"snapshot_{i}"
+                extracted = root / f"extract_{i}"
+                with contextlib.redirect_stdout(io.StringIO()):
+                    path, elapsed = measure("backup", backup_db.run_backup, root / "backups" / f"products_db_{i}",
+                                            snapshot_to=snapshot)
+                backup_db.extract(path, extracted)
+                expected = {p.relative_to(snapshot).as_posix() for p in snapshot.rglob("*") if p.is_file()}
+                actual = {p.relative_to(extracted).as_posix() for p in extracted.rglob("*") if p.is_file()}
+                bad = sorted(expected ^ actual | {rel for rel in expected & actual
+                                                  if not filecmp.cmp(snapshot / rel, extracted / rel, shallow=False)})
+                print(f"  копия {i + 1}: файлов {len(expected)}, {elapsed:.2f} с, расхождений {len(bad)}")
+                problems.extend(f"копия {i + 1}: {rel}" for rel in bad)
+                shutil.rmtree(snapshot)
+                shutil.rmtree(extracted)
+        finally:
+            stop.set()
+            if writer.pid is not None:
+                writer.join()
+            csv_db.set_data_dir(DATA_DIR)
+    if writer.exitcode:
+        problems.append(f"процесс записи завершился с ошибкой (код {writer.exitcode})")
+    for p in problems:
+        print(f"  ОШИБКА: {p}")
+    print("Все копии совпадают со снимками." if not problems else "Проверка не пройдена.")
+    return not problems
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-agg":
+        bench_aggregation()
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench-parse":
+        bench_parse(*(int(a) for a in sys.argv[2:3]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "stress":
+        ok = stress_concurrency(*(int(a) for a in sys.argv[2:4]))
+        sys.exit(0 if ok else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "check-backups":
+        ok = check_backups(*(int(a) for a in sys.argv[2:4]))
+        sys.exit(0 if ok else 1)
+    else:
+        main()
@@ -1,44 +1,362 @@
 # -*- coding: utf-8 -*-
 """
 Восстановление БД из резервной копии (CSV).
-Восстанавливает файлы из указанной папки бэкапа в data/.
-Запуск: python restore_db.py <папка_бэкапа>
+Источник — папка копии с манифестом (backup_db), её сжатый архив (backup_archive)
+или полная копия папки data/ старого формата. data/ не меняется, пока копия
+не проверена:
+1. таблицы *.csv, секции (data/deliveries/) и журнал остатков собираются
+   в промежуточном каталоге рядом с data/: части копии и архив — с проверкой
+   SHA-256, файлы папки старого формата копируются параллельно;
+2. таблицы проверяются быстрым проходом: заголовок, число полей в строках,
+   целые и неповторяющиеся id;
+3. файлы переносятся в data/ одной операцией журнала csv_db (os.replace каждого
+   файла, без копирования данных). Сбой посреди переноса откатывается при
+   следующем обращении к данным: data/ не остаётся восстановленным наполовину.
+Таблица deliveries из копии старого формата (один файл deliveries.csv)
+раскладывается по секциям в той же операции.
+Восстановление на момент времени (--until): поверх копии с манифестом
+повторяются операции журнала изменений (csv_changelog) с позиции копии до
+указанного момента — в той же операции журнала, что и перенос файлов. Без папки
+копии берётся последняя копия, сделанная не позже этого момента.
+При движке SQLite восстанавливается база products.db из копии: она проверяется
+(PRAGMA integrity_check, таблицы) и переносится в рабочую базу sqlite3 backup
+API (sqlite_db.restore_from); восстановление на момент времени недоступно.
+Запуск: python restore_db.py [папка_бэкапа | архив] [--until "ГГГГ-ММ-ДД ЧЧ:ММ[:СС]"]
 """
 
+import csv
+import os
+import re
 import shutil
 import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
-from config import DATA_DIR, BACKUP_DIR, PROJECT_DIR
+import backup_archive
+import csv_changelog
+import csv_db
+import sqlite_db
+from backup_db import SQLITE_FILE, data_files, extract, read_manifest, remove_stale_dirs
+from config import BACKUP_DIR, PROJECT_DIR
+from csv_db import PARTITIONED, STOCK_LOG
 
+COPY_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+SCAN_BLOCK = 16 * 1024 * 1024
+# Проверка в нескольких процессах окупается только на больших таблицах
+SCAN_PARALLEL_BYTES = 64 * 1024 * 1024
+# id в начале строки; блок дополняется спереди переводом строки (так быстрее, чем re.M)
+_LINE_ID = re.compile(rb"\n(-?\d+),")
 
-def run_restore(backup_path: Path) -> None:
-    """Восстановить БД из папки с CSV-файлами."""
+
+def _restorable(rel: str) -> bool:
+    """Файлы копии, которые восстанавливаются: таблицы, секции и журнал остатков."""
+    top, _, rest = rel.partition("/")
+    if not rest:
+        return rel.endswith(".csv")
+    return (top in PARTITIONED and "/" not in rest and rest.endswith(".csv")) or rel == STOCK_LOG
+
+
+# --- Проверка таблиц ---
+
+def scan_table(path: Path) -> Tuple[List[str], int, array]:
+    """
+    Заголовок, число строк и id CSV-таблицы. Быстрый путь (id в первом столбце,
+    в файле нет кавычек): строки и запятые считаются по блокам, id находятся
+    регулярным выражением. Иначе или при расхождении — точная проверка csv.reader.
+    ValueError — строка с лишними полями или нецелым id.
+    """
+    with open(path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8")]), [])
+        if header[:1] == ["id"]:
+            found = _scan_plain(f, len(header))
+            if found is not None:
+                return header, len(found), found
+    rows, ids = _scan_exact(path, header)
+    return header, rows, ids
+
+
+def _scan_plain(f, width: int) -> Optional[array]:
+    ids = array("q")
+    lines = commas = 0
+    rest = b""
+    while True:
+        block = f.read(SCAN_BLOCK)
+        if not block:
+            if not rest:
+                break
+            block, rest = rest + b"\n", b""
+        else:
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            block, rest = block[:cut], block[cut:]
+        if b'"' in block:
+            return None
+        lines += block.count(b"\n")
+        commas += block.count(b",")
+        ids.extend(map(int, _LINE_ID.findall(b"\n" + block)))
+    # Каждая строка начинается с целого id и содержит столько же полей, сколько заголовок
+    if len(ids) != lines or commas != lines * (width - 1):
+        return None
+    return ids
+
+
+def _scan_exact(path: Path, header: List[str]) -> Tuple[int, array]:
+    ids = array("q")
+    rows = 0
+    width = len(header)
+    pos = header.index("id") if "id" in header else None
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for rec in reader:
+            if not rec:
+                continue
+            rows += 1
+            if len(rec) > width:
+                raise ValueError(f"{path.name}, строка {reader.line_num}: {len(rec)} полей при {width} в заголовке")
+            if pos is not None:
+                try:
+                    ids.append(int(rec[pos]))
+                except (ValueError, IndexError):
+                    raise ValueError(f"{path.name}, строка {reader.line_num}: id не целое число") from None
+    return rows, ids
+
+
+def _scan_all(paths: List[Path]) -> List[Tuple[List[str], int, array]]:
+    if len(paths) > 1 and sum(p.stat().st_size for p in paths) > SCAN_PARALLEL_BYTES:
+        with ProcessPoolExecutor() as pool:
+            return list(pool.map(scan_table, paths))
+    return [scan_table(p) for p in paths]
+
+
+def validate(staging: Path) -> Dict[str, int]:
+    """Проверить таблицы собранной копии. Возвращает число строк по таблицам; ValueError — копия негодна."""
+    tables: Dict[str, List[Path]] = {}
+    for path in sorted(staging.glob("*.csv")):
+        tables.setdefault(path.stem, []).append(path)
+    for name in PARTITIONED:
+        parts = sorted((staging / name).glob("*.csv"))
+        if parts:
+            tables.setdefault(name, []).extend(parts)
+    paths = [p for group in tables.values() for p in group]
+    if not paths:
+        raise ValueError("В копии нет CSV-файлов.")
+    scanned = dict(zip(paths, _scan_all(paths)))
+    counts = {}
+    for name, group in tables.items():
+        required = [f for f, kind in csv_db.field_types(name) if kind != "str"]
+        ids = array("q")
+        rows = 0
+        for path in group:
+            header, n, part_ids = scanned[path]
+            missing = [f for f in required if f not in header]
+            if missing:
+                raise ValueError(f"{path.relative_to(staging)}: нет столбцов {', '.join(missing)}")
+            rows += n
+            ids.extend(part_ids)
+        if len(set(ids)) != len(ids):
+            seen: set = set()
+            duplicate = next(i for i in ids if i in seen or seen.add(i))
+            raise ValueError(f"Таблица {name}: повторяется id {duplicate}")
+        counts[name] = rows
+    return counts
+
+
+# --- Сборка и перенос ---
+
+def _stage(source: Path, staging: Path, select: Callable[[str], bool] = _restorable) -> Dict[str, Optional[List[int]]]:
+    """Собрать файлы копии (select — отбор по пути) в staging. Возвращает исходные сигнатуры файлов (если известны)."""
+    if backup_archive.is_archive(source):
+        sums = backup_archive.extract(source, staging, select=select)
+        return {rel: entry.get("sig") for rel, entry in sums.items()}
+    manifest = read_manifest(source)
+    if manifest is not None:
+        extract(source, staging, select=select, workers=COPY_WORKERS)
+        return {rel: entry["sig"] for rel, entry in manifest["files"].items() if select(rel)}
+    files = [(rel, path) for rel, path in data_files(source) if select(rel)]
+
+    def copy(item: Tuple[str, Path]) -> None:
+        rel, path = item
+        target = staging / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)  # копирование в ядре (sendfile), без GIL
+
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+        list(pool.map(copy, files))
+    # Полная копия делалась copy2: время изменения и размер — как у исходного файла
+    return {rel: [st.st_mtime_ns, st.st_size] for rel, path in files for st in (path.stat(),)}
+
+
+def _adopt_stock_log(staging: Path, origin: Dict[str, Optional[List[int]]]) -> None:
+    """
+    Журнал остатков относится к products.csv по сигнатуре файла (см. csv_db).
+    Если в копии он относился к её products.csv, заголовок переписывается на
+    сигнатуру восстановленного файла (os.replace её не меняет) — изменения
+    остатков после последней перезаписи products.csv не теряются. Иначе журнал
+    отбрасывается.
+    """
+    log, products = staging / STOCK_LOG, staging / "products.csv"
+    if not log.exists():
+        return
+    with open(log, "r", encoding="utf-8", newline="") as f:
+        header = f.readline().rstrip("\n")
+        body = f.read()
+    sig = origin.get("products.csv")
+    recorded = [int(x) for x in header[1:].split(",") if x.strip().lstrip("-").isdigit()]
+    if not products.exists() or not header.startswith("#") or (sig is not None and recorded[:len(sig)] != list(sig)):
+        log.unlink()
+        return
+    log.write_text(csv_db.stock_log_header(products) + "\n" + body, encoding="utf-8")
+
+
+def _restore_sqlite(backup_path: Path) -> Dict[str, int]:
+    """Движок SQLite: проверить базу из копии и перенести её в рабочую базу. Возвращает число строк по таблицам."""
+    parent = sqlite_db.db_path().parent
+    parent.mkdir(parents=True, exist_ok=True)
+    remove_stale_dirs(parent, ".restore_")
+    staging = Path(tempfile.mkdtemp(dir=parent, prefix=f".restore_{os.getpid()}_"))
+    try:
+        _stage(backup_path, staging, select=lambda rel: rel == SQLITE_FILE)
+        path = staging / SQLITE_FILE
+        if not path.exists():
+            raise ValueError("В копии нет базы SQLite: она сделана при движке CSV. Выберите копию,"
+                             ' сделанную при STORAGE_BACKEND = "sqlite", или переключите движок на "csv"')
+        counts = sqlite_db.check_file(path)
+        sqlite_db.restore_from(path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    for name, n in counts.items():
+        print(f"  Восстановлена таблица {name}: {n} строк")
+    return counts
+
+
+def parse_moment(text: str) -> datetime:
+    """Момент времени для --until: «ГГГГ-ММ-ДД ЧЧ:ММ[:СС]» (или ISO 8601)."""
+    try:
+        return datetime.fromisoformat(text.strip())
+    except ValueError:
+        raise ValueError(f"Неверный момент времени: {text} (ожидается ГГГГ-ММ-ДД ЧЧ:ММ[:СС])") from None
+
+
+def nearest_backup(until: datetime, backup_dir: Path = BACKUP_DIR) -> Path:
+    """Последняя копия с позицией журнала изменений, сделанная не позже until."""
+    limit = csv_changelog.timestamp(until)
+    best, best_time = None, None
+    for path in backup_dir.iterdir() if backup_dir.exists() else ():
+        manifest = read_manifest(path)
+        changelog = manifest.get("changelog") if manifest is not None else None
+        if changelog is not None and changelog["time"] <= limit and (best is None or changelog["time"] > best_time):
+            best, best_time = path, changelog["time"]
+    if best is None:
+        raise ValueError(f"Нет резервной копии, сделанной до {until:%Y-%m-%d %H:%M:%S}, с журналом изменений")
+    return best
+
+
+def _replay_from(backup_path: Path, until: datetime):
+    """Повтор журнала изменений от позиции копии до until (для csv_db.replace_tables)."""
+    manifest = read_manifest(backup_path)
+    changelog = manifest.get("changelog") if manifest is not None else None
+    if changelog is None:
+        raise ValueError("Восстановление на момент времени возможно только из папки копии с манифестом,"
+                         " сделанной при включённом журнале изменений")
+    limit = csv_changelog.timestamp(until)
+    if limit < changelog["time"]:
+        raise ValueError(f"Копия {backup_path.name} сделана позже {until:%Y-%m-%d %H:%M:%S}")
+
+    def replay() -> None:
+        started = time.perf_counter()
+        result = csv_db.replay_changes(
+            csv_changelog.read(csv_db.changelog_dir(), changelog["position"], limit))
+        seconds = time.perf_counter() - started
+        print(f"  Повторено операций журнала изменений: {result['operations']} (событий {result['events']},"
+              f" {seconds:.1f} с с записью таблиц)" + (f", последняя — {result['last']}" if result["last"] else ""))
+        replayed.update(result["rows"])
+
+    replayed: Dict[str, int] = {}
+    return replay, replayed
+
+
+def run_restore(backup_path: Optional[Path] = None, until: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Восстановить БД из папки копии или её архива; until — на этот момент времени
+    (повтором журнала изменений поверх копии; без backup_path — от последней
+    копии до until). Возвращает число строк по таблицам. ValueError — копия не
+    найдена, повреждена или не прошла проверку (data/ при этом не изменяется).
+    При движке SQLite восстанавливается база (until недоступен).
+    """
+    sqlite = csv_db.get_backend() == "sqlite"
+    if sqlite and until is not None:
+        raise ValueError("Восстановление на момент времени возможно только при движке CSV:"
+                         " движок SQLite не ведёт журнал изменений")
+    if backup_path is None:
+        if until is None:
+            raise ValueError("Укажите папку с резервной копией или момент времени")
+        backup_path = nearest_backup(until)
+        print(f"Копия: {backup_path}")
     if not backup_path.exists():
-        print(f"Папка не найдена: {backup_path}")
-        sys.exit(1)
-    if not backup_path.is_dir():
-        print("Укажите папку с резервной копией (например backups/products_db_20250216_120000)")
-        sys.exit(1)
-    csv_files = list(backup_path.glob("*.csv"))
-    if not csv_files:
-        print("В указанной папке нет CSV-файлов.")
-        sys.exit(1)
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    for f in csv_files:
-        dest = DATA_DIR / f.name
-        shutil.copy2(f, dest)
-        print(f"  Восстановлен {f.name}")
+        raise ValueError(f"Папка не найдена: {backup_path}")
+    if not backup_path.is_dir() and not backup_archive.is_archive(backup_path):
+        raise ValueError("Укажите папку с резервной копией (например backups/products_db_20250216_120000)"
+                         " или её архив (products_db_20250216_120000.tar.gz)")
+    if sqlite:
+        counts = _restore_sqlite(backup_path)
+        print(f"Восстановление из {backup_path} завершено.")
+        return counts
+    replay, replayed = _replay_from(backup_path, until) if until is not None else (None, {})
+    data_dir = csv_db.DATA_DIR
+    data_dir.parent.mkdir(parents=True, exist_ok=True)
+    remove_stale_dirs(data_dir.parent, ".restore_")
+    # Промежуточный каталог — на том же диске, что data/: перенос без копирования
+    staging = Path(tempfile.mkdtemp(dir=data_dir.parent, prefix=f".restore_{os.getpid()}_"))
+    try:
+        origin = _stage(backup_path, staging)
+        counts = validate(staging)
+        _adopt_stock_log(staging, origin)
+        restored = csv_db.replace_tables(staging, backup_path.name, replay)
+        counts.update(replayed)
+        for name in restored:
+            if name in counts:
+                suffix = f" ({len(list((data_dir / name).glob('*.csv')))} секций)" if name in PARTITIONED else ""
+                print(f"  Восстановлена таблица {name}: {counts[name]} строк{suffix}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
     print(f"Восстановление из {backup_path} завершено.")
+    return counts
+
+
+def _parse_args(args: List[str]) -> Tuple[Optional[Path], Optional[datetime]]:
+    """[папка | архив] [--until МОМЕНТ | --until=МОМЕНТ] → (путь, момент)."""
+    path, until = None, None
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--until":
+            if not args:
+                raise ValueError("После --until укажите момент времени")
+            until = parse_moment(args.pop(0))
+        elif arg.startswith("--until="):
+            until = parse_moment(arg.partition("=")[2])
+        else:
+            path = Path(arg)
+    if path and not path.is_absolute():
+        candidate = PROJECT_DIR / path
+        path = candidate if candidate.exists() else path
+    return path, until
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Использование: python restore_db.py <папка_бэкапа>")
+        print('Использование: python restore_db.py [папка_бэкапа | архив] [--until "ГГГГ-ММ-ДД ЧЧ:ММ[:СС]"]')
         print("Пример: python restore_db.py backups/products_db_20250216_120000")
+        print('        python restore_db.py --until "2025-02-16 14:32"')
+        sys.exit(1)
+    try:
+        run_restore(*_parse_args(sys.argv[1:]))
+    except ValueError as e:
+        print(f"Ошибка: {e}")
         sys.exit(1)
-    path = Path(sys.argv[1])
-    if not path.is_absolute():
-        candidate = PROJECT_DIR / path
-        path = candidate if candidate.exists() else path
-    run_restore(path)
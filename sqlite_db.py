@@ -0,0 +1,676 @@
+# -*- coding: utf-8 -*-
+"""
+Движок хранения на SQLite для API csv_db: те же функции (load_table, get_row,
+update_row, add_*, add_delivery, представления v_* и запросы), но с индексами
+на диске, JOIN/GROUP BY в SQL и логикой триггера поставки в одной транзакции.
+Включается через config.STORAGE_BACKEND = "sqlite" или csv_db.set_backend("sqlite").
+Перенос данных из data/*.csv: python sqlite_db.py migrate
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+
+import config
+import text_index
+from columnar import ProductColumns
+from csv_db import (
+    TABLES, MANAGER, _require_manager, _cached_rows, set_role, _validate_deliveries, _bulk_result, _check_view,
+    _filter_key, _notify,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS suppliers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    contact TEXT NOT NULL DEFAULT '',
+    address TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    supplier_id INTEGER NOT NULL,
+    price TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL,
+    supplier_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    delivery_date TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ix_categories_name ON categories(name);
+CREATE INDEX IF NOT EXISTS ix_products_category ON products(category_id);
+CREATE INDEX IF NOT EXISTS ix_products_supplier ON products(supplier_id);
+CREATE INDEX IF NOT EXISTS ix_products_price ON products(CAST(price AS REAL));
+CREATE INDEX IF NOT EXISTS ix_deliveries_product ON deliveries(product_id);
+CREATE INDEX IF NOT EXISTS ix_deliveries_supplier ON deliveries(supplier_id);
+CREATE INDEX IF NOT EXISTS ix_deliveries_date_id ON deliveries(delivery_date DESC, id);
+"""
+
+# Порядок столбцов — как в CSV-файлах
+COLUMNS = {
+    "categories": ("id", "name", "description"),
+    "suppliers": ("id", "name", "contact", "address"),
+    "products": ("id", "name", "category_id", "supplier_id", "price", "quantity", "created_at"),
+    "deliveries": ("id", "product_id", "supplier_id", "quantity", "delivery_date", "created_at"),
+}
+
+# Соединение на поток: GUI и фоновые задачи не делят один sqlite3.Connection
+_local = threading.local()
+
+
+def db_path() -> Path:
+    return config.SQLITE_PATH
+
+
+def _conn() -> sqlite3.Connection:
+    path = db_path()
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == path:
+        return conn
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # Поиск по названиям с теми же правилами, что и в csv_db (регистр, ё/е, начало слова)
+    conn.create_function("text_match", 2, text_index.matches, deterministic=True)
+    _local.conn = conn
+    _local.path = path
+    return conn
+
+
+def _check_table(name: str) -> None:
+    if name not in COLUMNS:
+        raise ValueError(f"Неизвестная таблица: {name}")
+
+
+def _row(table: str, r: sqlite3.Row) -> Dict[str, Any]:
+    """Строка SQLite в том же виде, что возвращает csv_db (price — Decimal)."""
+    d = dict(r)
+    if table == "products":
+        d["price"] = Decimal(d["price"])
+    return d
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _values(table: str, row: Dict[str, Any]) -> tuple:
+    return tuple(str(row[c]) if c == "price" else row.get(c, "") for c in COLUMNS[table])
+
+
+# --- Базовые операции ---
+
+def load_table(name: str, columnar: bool = False) -> List[Dict[str, Any]]:
+    """Все строки таблицы (по возрастанию id); для products при columnar=True — ProductColumns."""
+    _check_table(name)
+    cur = _conn().execute(f"SELECT {', '.join(COLUMNS[name])} FROM {name} ORDER BY id")
+    if columnar and name == "products":
+        return ProductColumns.from_records(list(COLUMNS[name]), cur)
+    return [_row(name, r) for r in cur]
+
+
+def save_table(name: str, rows: List[Dict[str, Any]]) -> None:
+    """Заменить содержимое таблицы (одной транзакцией). Требуется роль manager."""
+    _require_manager()
+    _check_table(name)
+    if not rows:
+        return
+    cols = COLUMNS[name]
+    conn = _conn()
+    with conn:
+        conn.execute(f"DELETE FROM {name}")
+        conn.executemany(
+            f"INSERT INTO {name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            (_values(name, r) for r in rows),
+        )
+    _notify([(name, "replace", None, None)])
+
+
+def get_next_id(name: str) -> int:
+    _check_table(name)
+    return _conn().execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {name}").fetchone()[0]
+
+
+def get_row(table: str, row_id: int) -> Optional[Dict[str, Any]]:
+    _check_table(table)
+    r = _conn().execute(f"SELECT {', '.join(COLUMNS[table])} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+    return _row(table, r) if r else None
+
+
+def update_row(table: str, row_id: int, updates: Dict[str, Any]) -> None:
+    """Обновить запись. Требуется роль manager."""
+    _require_manager()
+    _check_table(table)
+    fields = {k: v for k, v in updates.items() if k in COLUMNS[table] and k != "id"}
+    if "price" in fields:
+        fields["price"] = str(Decimal(str(fields["price"])))
+    conn = _conn()
+    with conn:
+        if fields:
+            sets = ", ".join(f"{k} = ?" for k in fields)
+            cur = conn.execute(f"UPDATE {table} SET {sets} WHERE id = ?", (*fields.values(), row_id))
+            found = cur.rowcount > 0
+        else:
+            found = conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (row_id,)).fetchone() is not None
+    if not found:
+        raise ValueError(f"Запись с id={row_id} не найдена в {table}")
+    _notify([(table, "update", row_id, tuple(fields))])
+
+
+def _insert(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Вставить строку; id назначается SQLite (INTEGER PRIMARY KEY)."""
+    cols = [c for c in COLUMNS[table] if c != "id"]
+    conn = _conn()
+    with conn:
+        cur = conn.execute(
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            tuple(str(row[c]) if c == "price" else row[c] for c in cols),
+        )
+    _notify([(table, "insert", cur.lastrowid, None)])
+    return {"id": cur.lastrowid, **row}
+
+
+def add_category(name: str, description: str = "") -> Dict[str, Any]:
+    _require_manager()
+    return _insert("categories", {"name": name, "description": description})
+
+
+def add_supplier(name: str, contact: str = "", address: str = "") -> Dict[str, Any]:
+    _require_manager()
+    return _insert("suppliers", {"name": name, "contact": contact, "address": address})
+
+
+def add_product(name: str, category_id: int, supplier_id: int, price: float, quantity: int = 0) -> Dict[str, Any]:
+    _require_manager()
+    return _insert("products", {
+        "name": name,
+        "category_id": category_id,
+        "supplier_id": supplier_id,
+        "price": Decimal(str(price)),
+        "quantity": quantity,
+        "created_at": _now(),
+    })
+
+
+# --- Триггер поставки: вставка и изменение остатка в одной транзакции ---
+
+def add_delivery(product_id: int, supplier_id: int, quantity: int, delivery_date: Optional[str] = None) -> Dict[str, Any]:
+    _require_manager()
+    if delivery_date is None:
+        delivery_date = datetime.now().strftime("%Y-%m-%d")
+    row = {
+        "product_id": product_id,
+        "supplier_id": supplier_id,
+        "quantity": quantity,
+        "delivery_date": delivery_date,
+        "created_at": _now(),
+    }
+    conn = _conn()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO deliveries (product_id, supplier_id, quantity, delivery_date, created_at) VALUES (?, ?, ?, ?, ?)",
+            (product_id, supplier_id, quantity, delivery_date, row["created_at"]),
+        )
+        conn.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (quantity, product_id))
+    _notify([("deliveries", "insert", cur.lastrowid, None), ("products", "update", product_id, ("quantity",))])
+    return {"id": cur.lastrowid, **row}
+
+
+def add_deliveries_bulk(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Пакет поставок одной транзакцией: вставка всех строк и одно обновление остатка на товар."""
+    _require_manager()
+    started = time.perf_counter()
+    conn = _conn()
+    product_ids = {r[0] for r in conn.execute("SELECT id FROM products")}
+    supplier_ids = {r[0] for r in conn.execute("SELECT id FROM suppliers")}
+    batch = _validate_deliveries(rows, product_ids, supplier_ids)
+    if not batch:
+        return _bulk_result(0, 0, started)
+    created_at = _now()
+    stock: Dict[int, int] = {}
+    for r in batch:
+        stock[r["product_id"]] = stock.get(r["product_id"], 0) + r["quantity"]
+    with conn:
+        first_id = get_next_id("deliveries")
+        conn.executemany(
+            "INSERT INTO deliveries (id, product_id, supplier_id, quantity, delivery_date, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ((first_id + i, r["product_id"], r["supplier_id"], r["quantity"], r["delivery_date"], created_at)
+             for i, r in enumerate(batch)),
+        )
+        conn.executemany("UPDATE products SET quantity = quantity + ? WHERE id = ?",
+                         ((qty, pid) for pid, qty in stock.items()))
+    _notify([("deliveries", "insert", first_id + i, None) for i in range(len(batch))]
+            + [("products", "update", pid, ("quantity",)) for pid in stock])
+    return _bulk_result(len(batch), first_id, started)
+
+
+def update_delivery(
+    delivery_id: int,
+    product_id: Optional[int] = None,
+    supplier_id: Optional[int] = None,
+    quantity: Optional[int] = None,
+    delivery_date: Optional[str] = None,
+) -> None:
+    _require_manager()
+    conn = _conn()
+    with conn:
+        old = conn.execute("SELECT product_id, quantity FROM deliveries WHERE id = ?", (delivery_id,)).fetchone()
+        if old is None:
+            raise ValueError(f"Поставка с id={delivery_id} не найдена")
+        fields = {"product_id": product_id, "supplier_id": supplier_id, "quantity": quantity, "delivery_date": delivery_date}
+        fields = {k: v for k, v in fields.items() if v is not None}
+        if fields:
+            sets = ", ".join(f"{k} = ?" for k in fields)
+            conn.execute(f"UPDATE deliveries SET {sets} WHERE id = ?", (*fields.values(), delivery_id))
+        new_pid = int(product_id) if product_id is not None else old["product_id"]
+        new_qty = int(quantity) if quantity is not None else old["quantity"]
+        stock_changed = new_pid != old["product_id"] or new_qty != old["quantity"]
+        if stock_changed:
+            conn.execute("UPDATE products SET quantity = quantity - ? WHERE id = ?", (old["quantity"], old["product_id"]))
+            conn.execute("UPDATE products SET quantity = quantity + ? WHERE id = ?", (new_qty, new_pid))
+    changes = [("deliveries", "update", delivery_id, tuple(fields))]
+    if stock_changed:
+        changes += [("products", "update", pid, ("quantity",)) for pid in {old["product_id"], new_pid}]
+    _notify(changes)
+
+
+# --- Представления (VIEW) и запросы ---
+
+def _equals_clause(table: str, alias: str, equals: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    """Фильтры равенства → условия WHERE (имена полей проверяются по схеме)."""
+    conds, params = [], []
+    for col, value in equals.items():
+        if col not in COLUMNS[table]:
+            raise ValueError(f"Неизвестное поле {table}.{col}")
+        conds.append(f"{alias}{col} = ?")
+        params.append(str(value) if col == "price" else value)
+    return conds, params
+
+
+def _select(sql: str, conds: List[str], params: List[Any], order: str,
+            limit: Optional[int]) -> Iterator[sqlite3.Row]:
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    sql += f" ORDER BY {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [limit]
+    return _conn().execute(sql, params)
+
+
+def iter_table(name: str, where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+               limit: Optional[int] = None, **equals: Any) -> Iterator[Dict[str, Any]]:
+    """Строки таблицы по одной; равенства и limit выполняются в SQL."""
+    _check_table(name)
+    conds, params = _equals_clause(name, "", equals)
+    cur = _select(f"SELECT {', '.join(COLUMNS[name])} FROM {name}", conds, params, "id",
+                  limit if where is None else None)
+    rows = (_row(name, r) for r in cur)
+    if where is not None:
+        rows = islice(filter(where, rows), limit)
+    return rows
+
+
+_PRODUCTS_FULL = f"""
+    SELECT {', '.join('p.' + c for c in COLUMNS['products'])},
+           COALESCE(c.name, '') AS category_name, COALESCE(c.description, '') AS category_description,
+           COALESCE(s.name, '') AS supplier_name, COALESCE(s.contact, '') AS supplier_contact
+    FROM products p
+    LEFT JOIN categories c ON c.id = p.category_id
+    LEFT JOIN suppliers s ON s.id = p.supplier_id
+"""
+
+
+def _product_full(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": r["id"], "product_name": r["name"], "price": r["price"], "quantity": r["quantity"],
+        "created_at": r["created_at"], "category_name": r["category_name"],
+        "category_description": r["category_description"], "supplier_name": r["supplier_name"],
+        "supplier_contact": r["supplier_contact"],
+    }
+
+
+def iter_products_full(limit: Optional[int] = None, where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                       **equals: Any) -> Iterator[Dict[str, Any]]:
+    """Товары с категорией и поставщиком по одной строке; фильтры — по полям products."""
+    conds, params = _equals_clause("products", "p.", equals)
+    cur = _select(_PRODUCTS_FULL, conds, params, "p.id", limit if where is None else None)
+    rows = (_row("products", r) for r in cur)
+    if where is not None:
+        rows = islice(filter(where, rows), limit)
+    return (_product_full(r) for r in rows)
+
+
+def v_products_full(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    return list(iter_products_full(limit=limit))
+
+
+_DELIVERIES_FULL = """
+    SELECT d.id, d.quantity, d.delivery_date, d.created_at,
+           COALESCE(p.name, '') AS product_name, p.price, COALESCE(s.name, '') AS supplier_name
+    FROM deliveries d
+    LEFT JOIN products p ON p.id = d.product_id
+    LEFT JOIN suppliers s ON s.id = d.supplier_id
+"""
+
+
+def _delivery_row(r: sqlite3.Row) -> Dict[str, Any]:
+    d = dict(r)
+    d["price"] = Decimal(d["price"]) if d["price"] is not None else None
+    return d
+
+
+def _date_conds(date_from: Optional[str], date_to: Optional[str]) -> Tuple[List[str], List[Any]]:
+    conds, params = [], []
+    if date_from:
+        conds.append("d.delivery_date >= ?")
+        params.append(date_from)
+    if date_to:
+        conds.append("d.delivery_date <= ?")
+        params.append(date_to)
+    return conds, params
+
+
+def iter_deliveries_full(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                         limit: Optional[int] = None, **equals: Any) -> Iterator[Dict[str, Any]]:
+    """Поставки с товаром и поставщиком по одной строке (по возрастанию id), с фильтром по датам."""
+    conds, params = _date_conds(date_from, date_to)
+    eq_conds, eq_params = _equals_clause("deliveries", "d.", equals)
+    cur = _select(_DELIVERIES_FULL, conds + eq_conds, params + eq_params, "d.id", limit)
+    return (_delivery_row(r) for r in cur)
+
+
+def _deliveries_full(date_from: Optional[str], date_to: Optional[str]) -> List[Dict[str, Any]]:
+    conds, params = _date_conds(date_from, date_to)
+    cur = _select(_DELIVERIES_FULL, conds, params, "d.delivery_date DESC, d.id", None)
+    return [_delivery_row(r) for r in cur]
+
+
+def v_deliveries_full(days_back: Optional[int] = None) -> List[Dict[str, Any]]:
+    if days_back is None:
+        return _deliveries_full(None, None)
+    cutoff = (datetime.now() - timedelta(days=days_back)).strftime("%Y-%m-%d")
+    return _deliveries_full(cutoff, None)
+
+
+def v_stock_by_category() -> List[Dict[str, Any]]:
+    sql = """
+        SELECT c.name AS category_name, COUNT(p.id) AS products_count,
+               COALESCE(SUM(p.quantity), 0) AS total_quantity,
+               COALESCE(SUM(CAST(ROUND(CAST(p.price AS REAL) * 100) AS INTEGER) * p.quantity), 0) AS value_kop
+        FROM categories c
+        LEFT JOIN products p ON p.category_id = c.id
+        GROUP BY c.id
+        ORDER BY c.id
+    """
+    result = []
+    for r in _conn().execute(sql):
+        d = dict(r)
+        d["total_value"] = round(d.pop("value_kop") / 100, 2)
+        result.append(d)
+    return result
+
+
+# Постраничное чтение представлений: порядок по умолчанию и выражения столбцов для ORDER BY
+_VIEW_ORDER = {
+    "products_full": ("p.id", {
+        "id": "p.id", "product_name": "p.name", "category_name": "category_name",
+        "supplier_name": "supplier_name", "price": "CAST(p.price AS REAL)", "quantity": "p.quantity",
+        "created_at": "p.created_at",
+    }),
+    "deliveries_full": ("d.delivery_date DESC, d.id", {
+        "id": "d.id", "product_name": "product_name", "supplier_name": "supplier_name",
+        "quantity": "d.quantity", "delivery_date": "d.delivery_date", "price": "CAST(p.price AS REAL)",
+        "created_at": "d.created_at",
+    }),
+    "categories": ("id", {c: c for c in COLUMNS["categories"]}),
+    "suppliers": ("id", {c: c for c in COLUMNS["suppliers"]}),
+}
+
+
+# Фильтры представлений: столбцы для поиска по тексту, цена в копейках, количество
+_PRICE_KOP = "CAST(ROUND(CAST(p.price AS REAL) * 100) AS INTEGER)"
+_VIEW_FILTER_EXPRS = {
+    "products_full": (("p.name", "c.name", "s.name"), _PRICE_KOP, "p.quantity"),
+    "deliveries_full": (("p.name", "s.name"), _PRICE_KOP, "d.quantity"),
+    "categories": (("name",), None, None),
+    "suppliers": (("name",), None, None),
+}
+
+
+def _filter_clause(view: str, filters: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """Фильтры представления (см. csv_db.VIEW_FILTERS) → условия WHERE."""
+    key = _filter_key(view, filters)
+    if key is None:
+        return [], []
+    words, price_lo, price_hi, qty_lo, qty_hi = key
+    names, price, qty = _VIEW_FILTER_EXPRS[view]
+    conds, params = [], []
+    for word in words:
+        conds.append("(" + " OR ".join(f"text_match({n}, ?)" for n in names) + ")")
+        params.extend([word] * len(names))
+    for expr, lo, hi in ((price, price_lo, price_hi), (qty, qty_lo, qty_hi)):
+        if lo is not None:
+            conds.append(f"{expr} >= ?")
+            params.append(lo)
+        if hi is not None:
+            conds.append(f"{expr} <= ?")
+            params.append(hi)
+    return conds, params
+
+
+def _view_select(view: str) -> Tuple[str, Callable[[sqlite3.Row], Dict[str, Any]]]:
+    if view == "products_full":
+        return _PRODUCTS_FULL, lambda r: _product_full(_row("products", r))
+    if view == "deliveries_full":
+        return _DELIVERIES_FULL, _delivery_row
+    return f"SELECT {', '.join(COLUMNS[view])} FROM {view}", lambda r: _row(view, r)
+
+
+def view_page(view: str, offset: int, limit: int, order_by: Optional[str] = None,
+              descending: bool = False, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Страница представления: отбор, сортировка, LIMIT и OFFSET выполняются в SQL."""
+    _check_view(view, order_by)
+    conds, params = _filter_clause(view, filters)
+    offset = max(0, offset)
+    if view == "stock_by_category":
+        rows = v_stock_by_category()
+        if order_by is not None:
+            rows.sort(key=lambda r: r[order_by], reverse=descending)
+        return rows[offset:offset + limit]
+    default, exprs = _VIEW_ORDER[view]
+    order = default if order_by is None else f"{exprs[order_by]} {'DESC' if descending else 'ASC'}, {default}"
+    sql, convert = _view_select(view)
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    cur = _conn().execute(f"{sql} ORDER BY {order} LIMIT ? OFFSET ?", params + [limit, offset])
+    return [convert(r) for r in cur]
+
+
+def view_rows(view: str, ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """Строки представления по списку id (одним запросом)."""
+    _check_view(view, None)
+    if view not in _VIEW_ORDER:
+        raise ValueError(f"У представления {view} нет id строк")
+    ids = list(ids)
+    if not ids:
+        return []
+    marks = ", ".join("?" * len(ids))
+    if view == "products_full":
+        cur = _conn().execute(f"{_PRODUCTS_FULL} WHERE p.id IN ({marks}) ORDER BY p.id", ids)
+        return [_product_full(_row("products", r)) for r in cur]
+    if view == "deliveries_full":
+        cur = _conn().execute(f"{_DELIVERIES_FULL} WHERE d.id IN ({marks}) ORDER BY d.id", ids)
+        return [_delivery_row(r) for r in cur]
+    cur = _conn().execute(f"SELECT {', '.join(COLUMNS[view])} FROM {view} WHERE id IN ({marks}) ORDER BY id", ids)
+    return [_row(view, r) for r in cur]
+
+
+def view_count(view: str, filters: Optional[Dict[str, Any]] = None) -> int:
+    _check_view(view, None)
+    conds, params = _filter_clause(view, filters)
+    if conds:
+        sql = _view_select(view)[0] + " WHERE " + " AND ".join(conds)
+        return _conn().execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    table = {"products_full": "products", "deliveries_full": "deliveries", "stock_by_category": "categories"}.get(view, view)
+    return _conn().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+# Выражения группировки для deliveries_stats
+_STATS_KEYS = {
+    "supplier_id": "supplier_id",
+    "product_id": "product_id",
+    "day": "delivery_date",
+    "month": "substr(delivery_date, 1, 7)",
+    "year": "substr(delivery_date, 1, 4)",
+}
+
+
+def deliveries_stats(by: str = "supplier_id") -> List[Dict[str, Any]]:
+    key = _STATS_KEYS.get(by)
+    if key is None:
+        raise ValueError("by должен быть supplier_id, product_id, day, month или year")
+    sql = f"""
+        SELECT {key} AS {by}, COUNT(*) AS deliveries_count, SUM(quantity) AS total_quantity,
+               MIN(quantity) AS min_quantity, MAX(quantity) AS max_quantity
+        FROM deliveries
+        GROUP BY 1
+        ORDER BY 1
+    """
+    return [dict(r) for r in _conn().execute(sql)]
+
+
+def query_products_by_category_name(category_name: str) -> List[Dict]:
+    sql = f"""
+        SELECT {', '.join('p.' + c for c in COLUMNS['products'])}
+        FROM products p
+        WHERE p.category_id = (SELECT id FROM categories WHERE name = ? ORDER BY id LIMIT 1)
+        ORDER BY p.id
+    """
+    return [_row("products", r) for r in _conn().execute(sql, (category_name,))]
+
+
+def query_products_price_above(price_min: float) -> List[Dict]:
+    sql = f"""
+        SELECT {', '.join(COLUMNS['products'])} FROM products
+        WHERE CAST(price AS REAL) > ?
+        ORDER BY CAST(price AS REAL) DESC
+    """
+    return [_row("products", r) for r in _conn().execute(sql, (price_min,))]
+
+
+def query_suppliers_delivery_count() -> List[Dict[str, Any]]:
+    sql = """
+        SELECT s.name, (SELECT COUNT(*) FROM deliveries d WHERE d.supplier_id = s.id) AS deliveries_count
+        FROM suppliers s
+        ORDER BY s.id
+    """
+    return [dict(r) for r in _conn().execute(sql)]
+
+
+def sp_deliveries_report(date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _deliveries_full(date_from, date_to)
+
+
+# --- Резервная копия базы (backup_db, restore_db) ---
+# Файлы базы (.db и -wal) нельзя копировать как есть: запись идёт без блокировки
+# csv_db, и копия окажется рассогласованной. sqlite3 backup API копирует базу
+# постранично и согласованно, не останавливая запись.
+
+def backup_to(path: Path) -> None:
+    """Согласованная копия базы в файл path. FileNotFoundError — базы нет."""
+    source = db_path()
+    if not source.exists():
+        raise FileNotFoundError(f"База SQLite не найдена: {source}")
+    src = sqlite3.connect(str(source))
+    dest = sqlite3.connect(str(path))
+    try:
+        src.backup(dest)
+    finally:
+        dest.close()
+        src.close()
+
+
+def check_file(path: Path) -> Dict[str, int]:
+    """Проверить файл базы (целостность, наличие таблиц). Возвращает число строк по таблицам; ValueError — негоден."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise ValueError(f"База в копии повреждена: {result}")
+        present = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = [name for name in COLUMNS if name not in present]
+        if missing:
+            raise ValueError(f"В базе копии нет таблиц {', '.join(missing)}")
+        return {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in COLUMNS}
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"Файл копии не является базой SQLite: {e}") from None
+    finally:
+        conn.close()
+
+
+def restore_from(path: Path) -> None:
+    """
+    Заменить содержимое базы копией из файла path (backup API в обратную сторону):
+    другие соединения видят базу целиком до или целиком после замены.
+    """
+    src = sqlite3.connect(str(path))
+    try:
+        src.backup(_conn())
+    finally:
+        src.close()
+    _notify([(name, "replace", None, None) for name in COLUMNS])
+
+
+# --- Перенос данных из CSV ---
+
+def migrate_from_csv() -> Dict[str, int]:
+    """
+    Перенести все таблицы из data/*.csv в SQLite (существующие строки заменяются).
+    Возвращает количество перенесённых строк по таблицам.
+    """
+    _require_manager()
+    conn = _conn()
+    counts = {}
+    with conn:
+        for name in TABLES:
+            rows = _cached_rows(name)
+            cols = COLUMNS[name]
+            conn.execute(f"DELETE FROM {name}")
+            conn.executemany(
+                f"INSERT INTO {name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                (_values(name, r) for r in rows),
+            )
+            counts[name] = len(rows)
+    conn.execute("ANALYZE")
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Использование: python sqlite_db.py migrate")
+        sys.exit(1)
+    set_role(MANAGER)
+    for table, n in migrate_from_csv().items():
+        print(f"  {table}: {n} записей")
+    print(f"Данные перенесены в {db_path()}")
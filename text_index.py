@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Поиск по названиям в памяти (строка поиска GUI). Текст нормализуется: casefold
+и ё → е, поэтому «ЁЛКА», «елка» и «Ёлка» совпадают. Запрос делится на слова;
+слово из трёх и более символов ищется как подстрока, более короткое — как начало
+слова в названии. Индекс хранит позиции строк по словам названий: различных
+слов намного меньше, чем строк, и поиск просматривает только словарь слов.
+NameIndex — подсказки при вводе (первые N названий по началу слова).
+"""
+
+import re
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    return str(text).casefold().replace("ё", "е")
+
+
+def terms(query: str) -> List[str]:
+    """Нормализованные слова запроса."""
+    return _WORD.findall(normalize(query))
+
+
+def term_matches(text: str, term: str) -> bool:
+    """Подходит ли нормализованный текст под слово запроса (без индекса)."""
+    if len(term) >= 3:
+        return term in text
+    return any(w.startswith(term) for w in _WORD.findall(text))
+
+
+def matches(text: str, term: str) -> bool:
+    """То же для исходного (ненормализованного) текста."""
+    return term_matches(normalize(text or ""), term)
+
+
+class TextIndex:
+    """
+    Индекс строк по словам: словарь различных слов и для каждого слова — позиции
+    строк (номер строки таблицы в кэше) по возрастанию. Слово запроса состоит
+    только из букв и цифр, поэтому подстрока названия — это подстрока одного из
+    его слов: поиск идёт по словарю слов, а не по всем строкам.
+    """
+
+    def __init__(self, texts: Iterable[str] = ()):
+        self.texts: List[str] = []
+        self._word_ids: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._postings: List[array] = []
+        self._sorted: List[str] = []  # слова по алфавиту (для поиска по началу слова)
+        for text in texts:
+            self._add(len(self.texts), normalize(text), append=True)
+        self._sorted = sorted(self._words)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def _add(self, pos: int, norm: str, append: bool = False) -> None:
+        if append:
+            self.texts.append(norm)
+        word_ids = self._word_ids
+        for w in set(_WORD.findall(norm)):
+            wid = word_ids.get(w)
+            if wid is None:
+                wid = word_ids[w] = len(self._words)
+                self._words.append(w)
+                self._postings.append(array("i"))
+                if not append:
+                    insort(self._sorted, w)
+            p = self._postings[wid]
+            if append:
+                p.append(pos)
+            else:
+                p.insert(bisect_left(p, pos), pos)
+
+    def append(self, text: str) -> None:
+        """Добавить строку в конец (новая строка таблицы)."""
+        self.texts.append(normalize(text))
+        self._add(len(self.texts) - 1, self.texts[-1])
+
+    def replace(self, pos: int, text: str) -> None:
+        """Заменить текст строки pos (переименование)."""
+        old, new = self.texts[pos], normalize(text)
+        if old == new:
+            return
+        for w in set(_WORD.findall(old)):
+            self._postings[self._word_ids[w]].remove(pos)
+        self.texts[pos] = new
+        self._add(pos, new)
+
+    def _matching_words(self, term: str) -> List[int]:
+        if len(term) >= 3:
+            return [self._word_ids[w] for w in self._words if term in w]
+        words = self._sorted
+        lo = bisect_left(words, term)
+        hi = bisect_left(words, term + "\uffff")
+        return [self._word_ids[w] for w in words[lo:hi]]
+
+    def search(self, term: str) -> array:
+        """Позиции строк (по возрастанию), подходящих под нормализованное слово запроса."""
+        lists = [self._postings[wid] for wid in self._matching_words(term)]
+        lists = [p for p in lists if p]
+        if len(lists) == 1:
+            return array("i", lists[0])
+        return array("i", sorted(set().union(*lists)))
+
+
+class NameIndex:
+    """
+    Названия с id для подсказок при вводе. Отсортированный список ключей
+    (нормализованное название с начала каждого его слова, id): запрос — бинарный
+    поиск и первые limit ключей с этим началом, O(log n + limit).
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, str]] = ()):
+        self.names: Dict[int, str] = {}
+        keys = []
+        for item_id, name in items:
+            self.names[item_id] = name
+            keys.extend((k, item_id) for k in _word_starts(name))
+        keys.sort()
+        self._keys: List[Tuple[str, int]] = keys
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, item_id: int, name: str) -> None:
+        """Добавить или переименовать запись."""
+        self.remove(item_id)
+        self.names[item_id] = name
+        for key in _word_starts(name):
+            insort(self._keys, (key, item_id))
+
+    def remove(self, item_id: int) -> None:
+        name = self.names.pop(item_id, None)
+        if name is None:
+            return
+        for key in _word_starts(name):
+            i = bisect_left(self._keys, (key, item_id))
+            if i < len(self._keys) and self._keys[i] == (key, item_id):
+                del self._keys[i]
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, str]]:
+        """
+        Первые limit записей (id, название), у которых слово названия начинается
+        с запроса (запрос из нескольких слов — с этого места названия). Запрос-число
+        сначала сверяется с id.
+        """
+        query = " ".join(normalize(query).split())
+        result: List[Tuple[int, str]] = []
+        seen = set()
+        if query.isdigit() and int(query) in self.names:
+            seen.add(int(query))
+            result.append((int(query), self.names[int(query)]))
+        keys = self._keys
+        i = bisect_left(keys, (query,))
+        while i < len(keys) and len(result) < limit and keys[i][0].startswith(query):
+            item_id = keys[i][1]
+            if item_id not in seen:
+                seen.add(item_id)
+                result.append((item_id, self.names[item_id]))
+            i += 1
+        return result
+
+
+def _word_starts(name: str) -> List[str]:
+    """Нормализованное название с начала каждого слова (пробелы схлопнуты)."""
+    norm = " ".join(normalize(name).split())
+    return [norm[m.start():] for m in _WORD.finditer(norm)] or [norm]
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Поле ввода с подсказками для выбора записи по названию (товар, поставщик).
+На каждое нажатие клавиши вызывается search(запрос, limit) — обычно
+text_index.NameIndex.search — и первые совпадения показываются списком под полем.
+Выбранная запись хранится как id, а не разбирается из текста поля.
+"""
+
+import tkinter as tk
+from typing import Any, Callable, List, Optional, Tuple
+
+import customtkinter as ctk
+
+LIMIT = 12
+ROWS = 8
+
+Search = Callable[[str, int], List[Tuple[Any, str]]]
+
+
+def _label(item: Tuple[Any, str]) -> str:
+    return f"{item[1]}  (id {item[0]})"
+
+
+class Typeahead:
+    """CTkEntry и всплывающий список подсказок; get_id() — id выбранной записи или None."""
+
+    def __init__(self, master, width: int = 250, placeholder: str = "", limit: int = LIMIT):
+        self.entry = ctk.CTkEntry(master, width=width, placeholder_text=placeholder)
+        self.limit = limit
+        self._search: Optional[Search] = None
+        self._items: List[Tuple[Any, str]] = []
+        self._value: Optional[Tuple[Any, str]] = None
+        self._list: Optional[tk.Listbox] = None
+        self.entry.bind("<KeyRelease>", self._on_key)
+        self.entry.bind("<Down>", lambda e: self._move(1))
+        self.entry.bind("<Up>", lambda e: self._move(-1))
+        self.entry.bind("<Return>", lambda e: self._choose())
+        self.entry.bind("<Escape>", lambda e: self._hide())
+        self.entry.bind("<FocusOut>", lambda e: self.entry.after(150, self._hide))
+
+    def grid(self, **kwargs) -> None:
+        self.entry.grid(**kwargs)
+
+    def pack(self, **kwargs) -> None:
+        self.entry.pack(**kwargs)
+
+    def configure(self, **kwargs) -> None:
+        self.entry.configure(**kwargs)
+
+    def set_search(self, search: Optional[Search]) -> None:
+        """Источник подсказок. Выбранная запись сохраняется."""
+        self._search = search
+
+    def get_id(self) -> Optional[Any]:
+        """id выбранной записи (None, если текст поля не соответствует выбору из списка)."""
+        if self._value is not None and self.entry.get() == _label(self._value):
+            return self._value[0]
+        return None
+
+    def set(self, item: Optional[Tuple[Any, str]]) -> None:
+        """Выбрать запись (id, название) или очистить поле."""
+        self._value = item
+        self.entry.delete(0, "end")
+        if item is not None:
+            self.entry.insert(0, _label(item))
+        self._hide()
+
+    def refresh_item(self, item_id: Any, name: Optional[str]) -> None:
+        """Запись переименована (name) или удалена (None): обновить поле, если она выбрана."""
+        if self._value is None or self._value[0] != item_id:
+            return
+        selected = self.get_id() is not None
+        self._value = (item_id, name) if name is not None else None
+        if selected:
+            self.set(self._value)
+
+    # --- Список подсказок ---
+
+    def _on_key(self, event) -> None:
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+            return
+        self._update()
+
+    def _update(self) -> None:
+        if self._search is None or str(self.entry.cget("state")) == "disabled":
+            self._hide()
+            return
+        self._items = self._search(self.entry.get(), self.limit)
+        if not self._items:
+            self._hide()
+            return
+        lb = self._listbox()
+        lb.delete(0, "end")
+        for item in self._items:
+            lb.insert("end", _label(item))
+        lb.configure(height=min(ROWS, len(self._items)))
+        lb.selection_set(0)
+        top = self.entry.winfo_toplevel()
+        x = self.entry.winfo_rootx() - top.winfo_rootx()
+        y = self.entry.winfo_rooty() - top.winfo_rooty() + self.entry.winfo_height()
+        lb.place(in_=top, x=x, y=y, width=self.entry.winfo_width())
+        lb.lift()
+
+    def _listbox(self) -> tk.Listbox:
+        if self._list is None:
+            theme = ctk.ThemeManager.theme
+            mode = 0 if ctk.get_appearance_mode() == "Light" else 1
+            pick = lambda color: color[mode] if isinstance(color, (list, tuple)) else color
+            self._list = tk.Listbox(
+                self.entry.winfo_toplevel(), activestyle="none", exportselection=False, borderwidth=1,
+                bg=pick(theme["CTkEntry"]["fg_color"]), fg=pick(theme["CTkEntry"]["text_color"]),
+                selectbackground=pick(theme["CTkButton"]["fg_color"]), highlightthickness=0,
+            )
+            self._list.bind("<ButtonRelease-1>", lambda e: self._choose())
+        return self._list
+
+    def _move(self, step: int) -> str:
+        if self._list is None or not self._list.winfo_ismapped():
+            self._update()
+            return "break"
+        sel = self._list.curselection()
+        i = max(0, min(len(self._items) - 1, (sel[0] if sel else -1) + step))
+        self._list.selection_clear(0, "end")
+        self._list.selection_set(i)
+        self._list.see(i)
+        return "break"
+
+    def _choose(self) -> str:
+        if self._list is not None and self._list.winfo_ismapped():
+            sel = self._list.curselection()
+            if sel:
+                self.set(self._items[sel[0]])
+        return "break"
+
+    def _hide(self) -> None:
+        if self._list is not None:
+            self._list.place_forget()
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Виртуальная таблица на ttk.Treeview для больших выборок. В дереве есть только
+элементы под видимые строки: при прокрутке меняются их значения, а не число
+элементов. Строки запрашиваются страницами через fetch(offset, limit, order_by,
+descending) в фоновом пуле (gui_tasks); последние страницы хранятся в памяти.
+Щелчок по заголовку столбца сортирует выборку на стороне движка хранения
+(csv_db.view_page): по возрастанию → по убыванию → порядок по умолчанию.
+После изменения данных refresh() перечитывает только видимые страницы,
+refresh_rows() — только строки с изменёнными id; в дереве обновляются лишь
+элементы, значения которых действительно изменились.
+"""
+
+from collections import OrderedDict
+from tkinter import ttk
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+PAGE_SIZE = 200
+CACHED_PAGES = 64
+HEADER_HEIGHT = 24
+
+Fetch = Callable[[int, int, Optional[str], bool], List[Tuple[Any, ...]]]
+FetchIds = Callable[[List[Any]], List[Tuple[Any, ...]]]
+
+
+class VirtualTree:
+    """Таблица с постраничной подгрузкой строк; pack() размещает её вместе с полосами прокрутки."""
+
+    def __init__(self, master, tasks, name: str = "table",
+                 on_loading: Optional[Callable[[bool], None]] = None,
+                 on_error: Optional[Callable[[BaseException], None]] = None):
+        self.tasks = tasks
+        self.name = name
+        self.on_loading = on_loading or (lambda busy: None)
+        self.on_error = on_error
+        self.tree = ttk.Treeview(master, show="headings", height=18, selectmode="browse")
+        self.scroll_y = ttk.Scrollbar(master, command=self._on_scrollbar)
+        self.scroll_x = ttk.Scrollbar(master, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=self.scroll_x.set)
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(3))
+        for key in ("<Up>", "<Down>", "<Prior>", "<Next>", "<Home>", "<End>"):
+            self.tree.bind(key, self._on_key)
+
+        self._source: Optional[str] = None
+        self._columns: Sequence[str] = ()
+        self._headers: Dict[str, str] = {}
+        self._fetch: Optional[Fetch] = None
+        self._count: Optional[Callable[[], int]] = None
+        self._fetch_ids: Optional[FetchIds] = None
+        self._pages: "OrderedDict[int, List[Tuple[Any, ...]]]" = OrderedDict()
+        self._inflight: Dict[int, int] = {}  # страница → поколение задачи
+        self._stale: Set[int] = set()  # страницы, показываемые до прихода новой версии
+        self._patch: Set[Any] = set()  # id строк, ожидающих перечитывания
+        self._shown: Dict[str, Tuple[Any, ...]] = {}  # значения элементов дерева
+        self._counting = False
+        self._total: Optional[int] = None
+        self._hint: Optional[int] = None  # прежнее число строк, пока идёт повторный подсчёт
+        self._top = 0
+        self._visible = 18
+        self._cursor: Optional[int] = None  # номер выбранной строки во всей выборке
+        self.order_by: Optional[str] = None
+        self.descending = False
+
+    def pack(self, **kwargs) -> None:
+        self.scroll_y.pack(side="right", fill="y")
+        self.scroll_x.pack(side="bottom", fill="x")
+        self.tree.pack(side="left", fill="both", expand=True, **kwargs)
+
+    # --- Источник данных ---
+
+    def set_source(self, source: str, columns: Sequence[str], headers: Dict[str, str], width: int,
+                   fetch: Fetch, count: Callable[[], int], fetch_ids: Optional[FetchIds] = None,
+                   keep_position: bool = True) -> None:
+        """
+        Показать выборку source. Для той же выборки (обновление после изменения данных)
+        сохраняются позиция прокрутки, выбранная строка и сортировка; keep_position=False
+        (изменился отбор строк) — сохраняется только сортировка, показ начинается с начала.
+        fetch_ids(ids) — строки по значениям первого столбца (для refresh_rows).
+        """
+        if source == self._source and not keep_position:
+            self._top = 0
+            self._cursor = None
+            self._total = None
+            self._hint = None
+        elif source != self._source:
+            self._source = source
+            self._top = 0
+            self._cursor = None
+            self._total = None
+            self._hint = None
+            self.order_by = None
+            self.descending = False
+            self.tree.delete(*self.tree.get_children())
+            self._shown.clear()
+            self.tree["columns"] = columns
+            for col in columns:
+                self.tree.column(col, width=width)
+        self._columns, self._headers = columns, headers
+        self._fetch, self._count, self._fetch_ids = fetch, count, fetch_ids
+        self._update_headings()
+        self.reload()
+
+    def reload(self) -> None:
+        """Сбросить загруженные страницы и запросить видимые строки и число строк заново."""
+        self._cancel_all()
+        self._pages.clear()
+        self._stale.clear()
+        if self._total is not None:
+            self._hint, self._total = self._total, None
+        self._render()
+        self._request()
+
+    def refresh(self, recount: bool = False) -> None:
+        """
+        Перечитать видимые страницы (позиции строк могли сдвинуться). До ответа на экране
+        остаются прежние строки; recount — пересчитать число строк (были вставки).
+        """
+        wanted = self._wanted()
+        for page in [p for p in self._pages if p not in wanted]:
+            del self._pages[page]
+        for page in self._inflight:
+            self.tasks.cancel(self._task(page))
+        self._inflight.clear()
+        self._stale = set(self._pages)
+        if recount and self._count is not None:
+            self._counting = True
+            self.tasks.submit(self._task("count"), self._count, self._counted, self._failed)
+        self._request()
+
+    def refresh_rows(self, ids: Iterable[Any]) -> None:
+        """Перечитать только загруженные строки с данными id (первый столбец)."""
+        ids = set(ids)
+        self._patch |= {row[0] for rows in self._pages.values() for row in rows if row[0] in ids}
+        if not self._patch or self._fetch_ids is None:
+            return
+        fetch_ids, wanted = self._fetch_ids, sorted(self._patch)
+        self.tasks.submit(self._task("rows"), lambda: fetch_ids(wanted), self._rows_loaded, self._failed)
+
+    def selected_values(self) -> Optional[Tuple[Any, ...]]:
+        """Значения выбранной строки (None — ничего не выбрано или строка ещё не загружена)."""
+        return None if self._cursor is None else self._row(self._cursor)
+
+    def sort(self, column: str) -> None:
+        if column != self.order_by:
+            self.order_by, self.descending = column, False
+        elif not self.descending:
+            self.descending = True
+        else:
+            self.order_by, self.descending = None, False
+        self._top = 0
+        self._cursor = None
+        self._update_headings()
+        self.reload()
+
+    def _update_headings(self) -> None:
+        for col in self._columns:
+            text = self._headers.get(col, col)
+            if col == self.order_by:
+                text += " ▼" if self.descending else " ▲"
+            self.tree.heading(col, text=text, command=lambda c=col: self.sort(c))
+
+    # --- Загрузка страниц ---
+
+    def _task(self, suffix: Any) -> str:
+        return f"{self.name}.{suffix}"
+
+    def _cancel_all(self) -> None:
+        for page in self._inflight:
+            self.tasks.cancel(self._task(page))
+        self._inflight.clear()
+        self.tasks.cancel(self._task("count"))
+        self._counting = False
+        self.tasks.cancel(self._task("rows"))
+        self._patch.clear()
+
+    def _request(self) -> None:
+        if self._fetch is None:
+            return
+        wanted = self._wanted()
+        # Страницы, ушедшие с экрана до загрузки, не нужны
+        for page in [p for p in self._inflight if p not in wanted]:
+            self.tasks.cancel(self._task(page))
+            del self._inflight[page]
+        fetch, order = self._fetch, (self.order_by, self.descending)
+        for page in wanted:
+            if (page in self._pages and page not in self._stale) or page in self._inflight:
+                continue
+            if self._total is not None and page * PAGE_SIZE >= self._total:
+                continue
+            self._inflight[page] = self.tasks.submit(
+                self._task(page),
+                lambda p=page: fetch(p * PAGE_SIZE, PAGE_SIZE, *order),
+                lambda rows, p=page: self._page_loaded(p, rows),
+                self._failed,
+            )
+        self._loading_changed()
+
+    def _wanted(self) -> range:
+        """Страницы, на которые приходятся видимые строки."""
+        return range(self._top // PAGE_SIZE, (self._top + self._visible - 1) // PAGE_SIZE + 1)
+
+    def _page_loaded(self, page: int, rows: List[Tuple[Any, ...]]) -> None:
+        self._inflight.pop(page, None)
+        self._stale.discard(page)
+        self._pages[page] = rows
+        self._pages.move_to_end(page)
+        while len(self._pages) > CACHED_PAGES:
+            self._pages.popitem(last=False)
+        if len(rows) < PAGE_SIZE:
+            self._total = page * PAGE_SIZE + len(rows)
+        if self._total is None and not self._counting:
+            # Число строк — после первого экрана: подсчёт загружает таблицу целиком
+            self._counting = True
+            self.tasks.submit(self._task("count"), self._count, self._counted, self._failed)
+        self._render()
+        self._request()
+
+    def _rows_loaded(self, rows: List[Tuple[Any, ...]]) -> None:
+        by_id = {r[0]: r for r in rows}
+        self._patch.clear()
+        for page, page_rows in list(self._pages.items()):
+            if any(r[0] in by_id for r in page_rows):
+                self._pages[page] = [by_id.get(r[0], r) for r in page_rows]
+        self._render()
+
+    def _counted(self, total: int) -> None:
+        self._counting = False
+        self._total = total
+        self._scroll_to(self._top)
+        self._render()
+        self._loading_changed()
+
+    def _failed(self, exc: BaseException) -> None:
+        self._cancel_all()
+        self._loading_changed()
+        if self.on_error is not None:
+            self.on_error(exc)
+
+    def _loading_changed(self) -> None:
+        self.on_loading(bool(self._inflight) or self._counting)
+
+    def _row(self, index: int) -> Optional[Tuple[Any, ...]]:
+        rows = self._pages.get(index // PAGE_SIZE)
+        if rows is None or index % PAGE_SIZE >= len(rows):
+            return None
+        return rows[index % PAGE_SIZE]
+
+    def _extent(self) -> int:
+        """Число строк для прокрутки: точное или нижняя оценка, пока подсчёт не завершён."""
+        if self._total is not None:
+            return self._total
+        if not self._pages:
+            return max(self._hint or 0, self._top + self._visible)
+        last = max(self._pages)
+        return max(self._hint or 0, last * PAGE_SIZE + len(self._pages[last]) + PAGE_SIZE)
+
+    # --- Отрисовка ---
+
+    def _render(self) -> None:
+        slots = self.tree.get_children()
+        if len(slots) != self._visible:
+            self.tree.delete(*slots)
+            self._shown.clear()
+            slots = [self.tree.insert("", "end", iid=str(i)) for i in range(self._visible)]
+        end = self._extent()
+        placeholder = ("…",) * len(self._columns)
+        selected = ()
+        for slot, iid in enumerate(slots):
+            index = self._top + slot
+            values = (self._row(index) or placeholder) if index < end else ()
+            # Элемент дерева меняется, только если изменились его значения
+            if self._shown.get(iid) != values:
+                self.tree.item(iid, values=values)
+                self._shown[iid] = values
+            if index == self._cursor and values:
+                selected = (iid,)
+        if self.tree.selection() != selected:
+            self.tree.selection_set(selected)
+        if selected:
+            self.tree.focus(selected[0])
+        extent = max(end, 1)
+        self.scroll_y.set(self._top / extent, min(1.0, (self._top + self._visible) / extent))
+
+    def _scroll_to(self, top: int) -> None:
+        top = max(0, min(int(top), self._extent() - self._visible))
+        if top != self._top:
+            self._top = top
+            self._render()
+            self._request()
+
+    def _scroll_by(self, rows: int) -> str:
+        self._scroll_to(self._top + rows)
+        return "break"
+
+    def _on_scrollbar(self, *args) -> None:
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * self._extent())
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self._scroll_by(step * self._visible if args[2] == "pages" else step)
+
+    def _on_wheel(self, event) -> str:
+        # Windows: delta кратна 120; macOS: небольшие значения
+        steps = event.delta // 120 if abs(event.delta) >= 120 else (1 if event.delta > 0 else -1)
+        return self._scroll_by(-3 * steps)
+
+    def _on_resize(self, event) -> None:
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible = max(1, (event.height - HEADER_HEIGHT) // row_height)
+        if visible != self._visible:
+            self._visible = visible
+            self._render()
+            self._request()
+
+    def _on_select(self, event) -> None:
+        sel = self.tree.selection()
+        if sel:
+            self._cursor = self._top + self.tree.index(sel[0])
+
+    def _on_key(self, event) -> str:
+        last = self._extent() - 1
+        cursor = self._top if self._cursor is None else self._cursor
+        moves = {"Up": -1, "Down": 1, "Prior": -self._visible, "Next": self._visible}
+        if event.keysym == "Home":
+            cursor = 0
+        elif event.keysym == "End":
+            cursor = last
+        else:
+            cursor += moves[event.keysym]
+        self._cursor = max(0, min(cursor, last))
+        if self._cursor < self._top:
+            self._scroll_to(self._cursor)
+        elif self._cursor >= self._top + self._visible:
+            self._scroll_to(self._cursor - self._visible + 1)
+        self._render()
+        return "break"